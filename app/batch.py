@@ -0,0 +1,135 @@
+import asyncio
+import os
+import weakref
+from typing import List
+
+import numpy as np
+from app.cache import CachedEmbeddings, normalize_text
+from app.embeddings import get_dense_embeddings
+from app.generator import GENERATOR_FALLBACK
+from app.graph import generation_limit, graph
+from app.state import BatchInputState, BatchOutputState, BatchState
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+# Near-duplicate merging is opt-in: 0 only merges identical questions
+BATCH_DEDUP_THRESHOLD = float(os.getenv("BATCH_DEDUP_THRESHOLD", "0"))
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+
+_generation_semaphores = weakref.WeakKeyDictionary()  # event loop -> semaphore
+
+
+def generation_semaphore() -> asyncio.Semaphore:
+    """Semaphore shared by the batch runs of the current event loop."""
+    loop = asyncio.get_running_loop()
+    if loop not in _generation_semaphores:
+        _generation_semaphores[loop] = asyncio.Semaphore(BATCH_GENERATION_CONCURRENCY)
+    return _generation_semaphores[loop]
+
+
+def cluster_questions(vectors: np.ndarray, threshold: float) -> List[int]:
+    """Map every question embedding to the first one it is a near-duplicate of.
+
+    Args:
+        vectors: One question embedding per row
+        threshold: Minimum cosine similarity of near-duplicate questions
+
+    Returns:
+        For every row, the index of its representative row (itself if unique)
+    """
+    if len(vectors) == 0:
+        return []
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.clip(
+        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None
+    )
+    representatives, clusters = [], []
+    for i, vector in enumerate(vectors):
+        if representatives:
+            scores = vectors[representatives] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= threshold:
+                clusters.append(representatives[best])
+                continue
+        representatives.append(i)
+        clusters.append(i)
+    return clusters
+
+
+async def deduplicate_node(state: BatchInputState) -> BatchState:
+    questions = state["questions"]
+    if not questions:
+        return {"questions": [], "representatives": []}
+    # Identical questions up to case and whitespace
+    first_occurrences = {}
+    identical = [
+        first_occurrences.setdefault(normalize_text(question), i)
+        for i, question in enumerate(questions)
+    ]
+    representatives = identical
+    embeddings = get_dense_embeddings()
+    cached = isinstance(embeddings, CachedEmbeddings)
+    if cached or BATCH_DEDUP_THRESHOLD > 0:
+        unique = sorted(set(identical))
+        texts = [questions[i] for i in unique]
+        # One batched call that also fills the query embedding cache, so the
+        # Milvus retriever and the semantic cache of every graph run hit it
+        vectors = (
+            await embeddings.aembed_queries(texts)
+            if cached
+            else await asyncio.gather(*(embeddings.aembed_query(t) for t in texts))
+        )
+        if BATCH_DEDUP_THRESHOLD > 0:
+            clusters = cluster_questions(np.array(vectors), BATCH_DEDUP_THRESHOLD)
+            representative_of = {i: unique[c] for i, c in zip(unique, clusters)}
+            representatives = [representative_of[i] for i in identical]
+    logger.info(
+        f"Batch of {len(questions)} questions has {len(set(representatives))} unique questions"
+    )
+    return {"questions": questions, "representatives": representatives}
+
+
+def fan_out(state: BatchState) -> List[Send] | str:
+    if not state["questions"]:
+        return "collect"
+    return [
+        Send("answer", {"index": i, "question": state["questions"][i]})
+        for i in sorted(set(state["representatives"]))
+    ]
+
+
+async def answer_node(state: dict, config: RunnableConfig) -> BatchState:
+    # Retrieval of all questions runs at once, generation is bounded
+    generation_limit.set(generation_semaphore())
+    try:
+        output = await graph.ainvoke({"question": state["question"]}, config)
+    except Exception as e:
+        logger.error(f"Batch question {state['index']} failed: {e}")
+        output = dict(GENERATOR_FALLBACK)
+    return {"answers": [(state["index"], output)]}
+
+
+def collect_node(state: BatchState) -> BatchOutputState:
+    answers = {index: output for index, output in state.get("answers", [])}
+    return {
+        "results": [answers[i] for i in state["representatives"]],
+        "answered_questions": [state["questions"][i] for i in state["representatives"]],
+    }
+
+
+builder = StateGraph(BatchState, input=BatchInputState, output=BatchOutputState)
+builder.add_node("deduplicate", deduplicate_node)
+builder.add_node("answer", answer_node)
+builder.add_node("collect", collect_node)
+builder.add_edge(START, "deduplicate")
+builder.add_conditional_edges("deduplicate", fan_out, ["answer", "collect"])
+builder.add_edge("answer", "collect")
+builder.add_edge("collect", END)
+batch_graph = builder.compile()
+batch_graph.name = "QA System for Business Case (Batch)"
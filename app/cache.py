@@ -0,0 +1,724 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from app.state import OutputState
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for use in cache keys (case and whitespace insensitive)."""
+    return " ".join(text.lower().split())
+
+
+class SemanticCacheBackend(ABC):
+    """Storage for question embeddings and their graph outputs."""
+
+    @abstractmethod
+    async def search(
+        self, embedding: np.ndarray
+    ) -> Tuple[float, Optional[OutputState]]:
+        """Return the best cosine score and its output, or (-1.0, None) if empty."""
+
+    @abstractmethod
+    async def add(self, embedding: np.ndarray, output: OutputState) -> None:
+        """Store an output under a unit-normalized question embedding."""
+
+
+class InMemorySemanticCacheBackend(SemanticCacheBackend):
+    """In-process backend with LRU and TTL eviction.
+
+    Embeddings live in a preallocated float32 matrix of `max_entries` rows, so
+    memory is bounded and a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._entries: OrderedDict[int, Tuple[float, OutputState]] = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, slot: int):
+        self._entries.pop(slot, None)
+        self._valid[slot] = False
+        self._free_slots.append(slot)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for slot in [s for s, (exp, _) in self._entries.items() if exp < now]:
+            self._evict(slot)
+
+    async def search(
+        self, embedding: np.ndarray
+    ) -> Tuple[float, Optional[OutputState]]:
+        with self._lock:
+            self._evict_expired()
+            if self._vectors is None or not self._entries:
+                return -1.0, None
+            scores = np.where(self._valid, self._vectors @ embedding, -np.inf)
+            slot = int(np.argmax(scores))
+            _, output = self._entries[slot]
+            self._entries.move_to_end(slot)
+            return float(scores[slot]), output
+
+    async def add(self, embedding: np.ndarray, output: OutputState) -> None:
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros(
+                    (self.max_entries, embedding.shape[0]), dtype=np.float32
+                )
+            self._evict_expired()
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))  # least recently used
+            slot = self._free_slots.pop()
+            self._vectors[slot] = embedding
+            self._valid[slot] = True
+            self._entries[slot] = (time.monotonic() + self.ttl, output)
+
+
+class RedisSemanticCacheBackend(SemanticCacheBackend):
+    """Redis backend, e.g. the `langgraph-redis` service from compose.yaml.
+
+    Entries are hashes with a Redis-side TTL; a sorted set of last access times
+    provides LRU eviction once `max_entries` is exceeded.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_entries: int = 1024,
+        ttl: float = 3600,
+        prefix: str = "qa:semantic_cache",
+    ):
+        from redis.asyncio import Redis  # optional dependency
+
+        self.client = Redis.from_url(url)
+        self.max_entries = max_entries
+        self.ttl = int(ttl)
+        self.prefix = prefix
+        self.lru_key = f"{prefix}:lru"
+
+    async def search(
+        self, embedding: np.ndarray
+    ) -> Tuple[float, Optional[OutputState]]:
+        ids = await self.client.zrange(self.lru_key, 0, -1)
+        if not ids:
+            return -1.0, None
+        async with self.client.pipeline(transaction=False) as pipe:
+            for entry_id in ids:
+                pipe.hget(f"{self.prefix}:{entry_id.decode()}", "vector")
+            raw_vectors = await pipe.execute()
+
+        expired = [entry_id for entry_id, raw in zip(ids, raw_vectors) if raw is None]
+        if expired:
+            await self.client.zrem(self.lru_key, *expired)
+        live = [(i, raw) for i, raw in zip(ids, raw_vectors) if raw is not None]
+        if not live:
+            return -1.0, None
+
+        vectors = np.stack([np.frombuffer(raw, dtype=np.float32) for _, raw in live])
+        scores = vectors @ embedding
+        best = int(np.argmax(scores))
+        entry_id = live[best][0]
+        raw_output = await self.client.hget(
+            f"{self.prefix}:{entry_id.decode()}", "output"
+        )
+        if raw_output is None:
+            return -1.0, None
+        await self.client.zadd(self.lru_key, {entry_id: time.time()})
+        return float(scores[best]), json.loads(raw_output)
+
+    async def add(self, embedding: np.ndarray, output: OutputState) -> None:
+        entry_id = uuid.uuid4().hex
+        key = f"{self.prefix}:{entry_id}"
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(
+                key,
+                mapping={
+                    "vector": embedding.astype(np.float32).tobytes(),
+                    "output": json.dumps(output),
+                },
+            )
+            pipe.expire(key, self.ttl)
+            pipe.zadd(self.lru_key, {entry_id: time.time()})
+            pipe.zcard(self.lru_key)
+            *_, size = await pipe.execute()
+
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = await self.client.zpopmin(self.lru_key, overflow)
+            await self.client.delete(
+                *[f"{self.prefix}:{entry_id.decode()}" for entry_id, _ in evicted]
+            )
+
+
+class SemanticCache:
+    """Answer cache keyed on question embeddings.
+
+    A question whose embedding has a cosine similarity of at least
+    `SEMANTIC_CACHE_THRESHOLD` to a previously answered question reuses that
+    question's output instead of running retrieval and generation again.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        backend: Optional[SemanticCacheBackend] = None,
+    ):
+        self.threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+        self.embeddings = embeddings
+        self.backend = backend or self.__setup_backend()
+        self.hits = 0
+        self.misses = 0
+
+    def __setup_backend(self) -> SemanticCacheBackend:
+        max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
+        ttl = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+        backend = os.getenv("SEMANTIC_CACHE_BACKEND", "memory").lower()
+        match backend:
+            case "memory":
+                return InMemorySemanticCacheBackend(max_entries=max_entries, ttl=ttl)
+            case "redis":
+                return RedisSemanticCacheBackend(
+                    url=os.getenv("REDIS_URI", "redis://localhost:6379"),
+                    max_entries=max_entries,
+                    ttl=ttl,
+                )
+            case _:
+                raise ValueError(f"Unsupported semantic cache backend: {backend}")
+
+    async def embed(self, question: str) -> np.ndarray:
+        embedding = np.asarray(
+            await self.embeddings.aembed_query(normalize_text(question)),
+            dtype=np.float32,
+        )
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    async def lookup(self, question: str) -> Optional[OutputState]:
+        """Get the cached output for a semantically equivalent question."""
+        score, output = await self.backend.search(await self.embed(question))
+        if output is not None and score >= self.threshold:
+            self.hits += 1
+            logger.info(f"Semantic cache hit (score={score:.4f}): {self.stats()}")
+            return output
+        self.misses += 1
+        return None
+
+    async def update(self, question: str, output: OutputState) -> None:
+        await self.backend.add(await self.embed(question), output)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = self.embeddings.embed_documents(missing)
+        else:
+            embedded = [self.embeddings.embed_query(text) for text in missing]
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = await self.embeddings.aembed_documents(missing)
+        else:
+            embedded = await asyncio.gather(
+                *(self.embeddings.aembed_query(text) for text in missing)
+            )
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class CacheStore(ABC):
+    """Key-value store for serialized cache entries with per-entry TTL."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored under key, or None if missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        """Store value under key for ttl seconds."""
+
+
+class InMemoryCacheStore(CacheStore):
+    """In-process store with LRU eviction beyond `max_entries`."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCacheStore(CacheStore):
+    """On-disk store that survives restarts, with LRU eviction beyond `max_entries`."""
+
+    def __init__(self, path: str, max_entries: int = 4096, table: str = "cache"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}_accessed_at "
+                f"ON {table} (accessed_at)"
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE key = ?", (key,)
+                )
+                return None
+            self._connection.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE expires_at < ?", (now,)
+            )
+            self._connection.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} "
+                "ORDER BY accessed_at DESC, rowid DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+def serialize_documents(docs: List[Document]) -> bytes:
+    return zlib.compress(
+        json.dumps(
+            [[doc.page_content, doc.metadata] for doc in docs],
+            separators=(",", ":"),
+            default=str,
+        ).encode()
+    )
+
+
+def deserialize_documents(value: bytes) -> List[Document]:
+    return [
+        Document(page_content=page_content, metadata=metadata)
+        for page_content, metadata in json.loads(zlib.decompress(value))
+    ]
+
+
+class CachedRetriever(Runnable):
+    """Retriever wrapper that reuses results for the same normalized query.
+
+    Entries are keyed on source, `top_k` and the normalized query. Exceptions
+    are not cached, so the fallbacks of the wrapped retriever still apply.
+    """
+
+    def __init__(
+        self,
+        retriever: Runnable,
+        source: str,
+        top_k: int,
+        ttl: float,
+        store: CacheStore,
+    ):
+        self.retriever = retriever
+        self.source = source
+        self.top_k = top_k
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(
+            f"{self.source}\0{self.top_k}\0{normalize_text(query)}".encode()
+        ).hexdigest()
+
+    def _get(self, query: str) -> Optional[List[Document]]:
+        value = self.store.get(self._key(query))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return deserialize_documents(value)
+
+    def _set(self, query: str, docs: List[Document]) -> None:
+        self.store.set(self._key(query), serialize_documents(docs), self.ttl)
+
+    def invoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        docs = self._get(input)
+        if docs is None:
+            docs = self.retriever.invoke(input, config, **kwargs)
+            self._set(input, docs)
+        return docs
+
+    async def ainvoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        docs = self._get(input)
+        if docs is None:
+            docs = await self.retriever.ainvoke(input, config, **kwargs)
+            self._set(input, docs)
+        return docs
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a bounded LRU cache of float32 vectors.
+
+    Vectors are keyed on the model name, the method (models may embed queries
+    and documents differently) and the normalized text. An optional persistent
+    store keeps them across restarts.
+
+    `embed_queries` embeds many queries at once and caches them as queries, so
+    later `embed_query` calls of the same texts are hits. With `symmetric`, the
+    model embeds queries like documents and the misses are embedded in one
+    batch; otherwise one query at a time.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_entries: int = 4096,
+        store: Optional[CacheStore] = None,
+        ttl: float = 2592000,
+        symmetric: bool = False,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.symmetric = symmetric
+        self.max_entries = max_entries
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.embed_duration = 0.0  # seconds spent embedding cache misses
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, np.ndarray] = OrderedDict()
+
+    def _key(self, method: str, text: str) -> str:
+        return hashlib.sha256(
+            f"{self.model_name}\0{method}\0{normalize_text(text)}".encode()
+        ).hexdigest()
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                return vector
+        if self.store is not None:
+            value = self.store.get(key)
+            if value is not None:
+                vector = np.frombuffer(value, dtype=np.float32)
+                self._put(key, vector, persist=False)
+                return vector
+        return None
+
+    def _put(self, key: str, vector: np.ndarray, persist: bool = True) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist and self.store is not None:
+            self.store.set(key, vector.tobytes(), self.ttl)
+
+    def _lookup(
+        self, method: str, texts: List[str]
+    ) -> Tuple[List[str], List[Optional[np.ndarray]]]:
+        keys = [self._key(method, text) for text in texts]
+        vectors = [self._get(key) for key in keys]
+        return keys, vectors
+
+    def _fill(
+        self,
+        texts: List[str],
+        keys: List[str],
+        vectors: List[Optional[np.ndarray]],
+        embedded: List[List[float]],
+        duration: float,
+    ) -> List[List[float]]:
+        misses = [i for i, vector in enumerate(vectors) if vector is None]
+        for i, embedding in zip(misses, embedded):
+            vectors[i] = np.asarray(embedding, dtype=np.float32)
+            self._put(keys[i], vectors[i])
+        self.hits += len(texts) - len(misses)
+        self.misses += len(misses)
+        self.embed_duration += duration
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("documents", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        embedded = self.embeddings.embed_documents(missing) if missing else []
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, vectors = self._lookup("query", [text])
+        started_at = time.perf_counter()
+        embedded = [] if vectors[0] is not None else [self.embeddings.embed_query(text)]
+        duration = time.perf_counter() - started_at
+        return self._fill([text], keys, vectors, embedded, duration)[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("documents", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        embedded = await self.embeddings.aembed_documents(missing) if missing else []
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, vectors = self._lookup("query", [text])
+        started_at = time.perf_counter()
+        embedded = (
+            [] if vectors[0] is not None else [await self.embeddings.aembed_query(text)]
+        )
+        duration = time.perf_counter() - started_at
+        return self._fill([text], keys, vectors, embedded, duration)[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = self.embeddings.embed_documents(missing)
+        else:
+            embedded = [self.embeddings.embed_query(text) for text in missing]
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = await self.embeddings.aembed_documents(missing)
+        else:
+            embedded = await asyncio.gather(
+                *(self.embeddings.aembed_query(text) for text in missing)
+            )
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        average_duration = self.embed_duration / self.misses if self.misses else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "time_saved": self.hits * average_duration,  # seconds, estimated
+        }
+
+
+class CachedLLM(Runnable):
+    """Structured LLM wrapper that reuses responses for the same rendered prompt.
+
+    Entries are keyed on the provider, model, temperature, rendered prompt and
+    output schema, so only use it at temperature 0, where responses are meant
+    to be deterministic. Responses which are not a dict are not cached.
+    """
+
+    def __init__(
+        self,
+        llm: Runnable,
+        provider: str,
+        model: str,
+        temperature: float,
+        schema: Any,
+        store: CacheStore,
+        ttl: float = 2592000,
+    ):
+        self.llm = llm
+        self.provider = provider
+        self.model = model
+        self.temperature = temperature
+        self.schema = json.dumps(
+            convert_to_openai_tool(schema), sort_keys=True, default=str
+        )
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, input: Any) -> str:
+        prompt = (
+            [[message.type, message.content] for message in input.to_messages()]
+            if isinstance(input, PromptValue)
+            else str(input)
+        )
+        return hashlib.sha256(
+            json.dumps(
+                [self.provider, self.model, self.temperature, prompt, self.schema],
+                default=str,
+            ).encode()
+        ).hexdigest()
+
+    def _get(self, key: str) -> Optional[dict]:
+        value = self.store.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(value))
+
+    def _set(self, key: str, output: Any) -> None:
+        if isinstance(output, dict):
+            self.store.set(
+                key, zlib.compress(json.dumps(output, default=str).encode()), self.ttl
+            )
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        key = self._key(input)
+        output = self._get(key)
+        if output is None:
+            output = self.llm.invoke(input, config, **kwargs)
+            self._set(key, output)
+        return output
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        key = self._key(input)
+        output = self._get(key)
+        if output is None:
+            output = await self.llm.ainvoke(input, config, **kwargs)
+            self._set(key, output)
+        return output
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        key = self._key(input)
+        output = self._get(key)
+        if output is not None:
+            yield output
+            return
+        async for chunk in self.llm.astream(input, config, **kwargs):
+            output = chunk
+            yield chunk
+        self._set(key, output)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = self.embeddings.embed_documents(missing)
+        else:
+            embedded = [self.embeddings.embed_query(text) for text in missing]
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors = self._lookup("query", texts)
+        missing = [text for text, vector in zip(texts, vectors) if vector is None]
+        started_at = time.perf_counter()
+        if not missing:
+            embedded = []
+        elif self.symmetric:
+            embedded = await self.embeddings.aembed_documents(missing)
+        else:
+            embedded = await asyncio.gather(
+                *(self.embeddings.aembed_query(text) for text in missing)
+            )
+        duration = time.perf_counter() - started_at
+        return self._fill(texts, keys, vectors, embedded, duration)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,216 @@
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_core.runnables import Runnable, RunnableConfig
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # value of the state gauge
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+
+class CircuitBreaker:
+    """Circuit breaker for an external dependency.
+
+    After `failure_threshold` consecutive failures or slow calls the circuit
+    opens and calls fail immediately with `CircuitOpenError`. After `cooldown`
+    seconds up to `half_open_calls` probe calls are let through: a successful
+    probe closes the circuit again, a failed one reopens it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        slow_call_threshold: float = 10.0,
+        cooldown: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.slow_call_threshold = slow_call_threshold  # seconds
+        self.cooldown = cooldown  # seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(STATE_VALUES[self.state], name=name)
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_STATE.set(STATE_VALUES[state], name=self.name)
+            CIRCUIT_TRANSITIONS.inc(name=self.name, state=state)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state != HALF_OPEN:
+            self._probes = 0
+
+    def before_call(self):
+        """Raise `CircuitOpenError` if the call must be skipped."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit {self.name} is open")
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"Circuit {self.name} is half-open")
+                self._probes += 1
+
+    def check(self):
+        """Raise `CircuitOpenError` if the circuit is open, without taking a probe."""
+        with self._lock:
+            if (
+                self.state == OPEN and time.monotonic() - self.opened_at < self.cooldown
+            ) or (self.state == HALF_OPEN and self._probes >= self.half_open_calls):
+                self.rejected += 1
+                raise CircuitOpenError(f"Circuit {self.name} is {self.state}")
+
+    def on_success(self, duration: float):
+        if duration > self.slow_call_threshold:
+            self.on_failure()
+            return
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def on_cancel(self):
+        """Release the probe slot of a call that was cancelled."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(self._probes - 1, 0)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, slow_call_threshold: float = 10.0) -> CircuitBreaker:
+    """Get the process-wide circuit breaker of a dependency.
+
+    Configured with CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN (seconds) and
+    `<NAME>_SLOW_CALL_THRESHOLD` (seconds).
+    """
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+                slow_call_threshold=float(
+                    os.getenv(
+                        f"{name.upper()}_SLOW_CALL_THRESHOLD", slow_call_threshold
+                    )
+                ),
+                cooldown=float(os.getenv("CIRCUIT_COOLDOWN", "30")),
+            )
+        return _circuit_breakers[name]
+
+
+class CircuitCheckRunnable(Runnable):
+    """Runnable wrapper that fails fast while a circuit is open.
+
+    Goes outside of a rate limiter whose inner calls are guarded by a
+    `CircuitBreakerRunnable`: an open circuit does not wait for tokens, and the
+    breaker times the calls without the rate limiter wait.
+    """
+
+    def __init__(self, runnable: Runnable, breaker: CircuitBreaker):
+        self.runnable = runnable
+        self.breaker = breaker
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        self.breaker.check()
+        return self.runnable.invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        self.breaker.check()
+        return await self.runnable.ainvoke(input, config, **kwargs)
+
+
+class CircuitBreakerRunnable(Runnable):
+    """Runnable wrapper that guards calls with a circuit breaker."""
+
+    def __init__(self, runnable: Runnable, breaker: CircuitBreaker):
+        self.runnable = runnable
+        self.breaker = breaker
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        self.breaker.before_call()
+        started_at = time.perf_counter()
+        try:
+            output = self.runnable.invoke(input, config, **kwargs)
+        except Exception:
+            self.breaker.on_failure()
+            raise
+        self.breaker.on_success(time.perf_counter() - started_at)
+        return output
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        self.breaker.before_call()
+        started_at = time.perf_counter()
+        try:
+            output = await self.runnable.ainvoke(input, config, **kwargs)
+        except Exception:
+            self.breaker.on_failure()
+            raise
+        except BaseException:
+            self.breaker.on_cancel()
+            raise
+        self.breaker.on_success(time.perf_counter() - started_at)
+        return output
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        self.breaker.before_call()
+        started_at = time.perf_counter()
+        try:
+            async for chunk in self.runnable.astream(input, config, **kwargs):
+                yield chunk
+        except Exception:
+            self.breaker.on_failure()
+            raise
+        except BaseException:
+            self.breaker.on_cancel()
+            raise
+        self.breaker.on_success(time.perf_counter() - started_at)
@@ -0,0 +1,53 @@
+import hashlib
+from typing import List, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+SIMHASH_BITS = 64
+
+
+def simhash(text: str, shingle_size: int = 3) -> np.uint64:
+    """Compute the 64-bit SimHash of a text over word shingles.
+
+    Near-identical texts get signatures with a small Hamming distance.
+    """
+    tokens = text.lower().split()
+    shingles = {
+        " ".join(tokens[i : i + shingle_size])
+        for i in range(max(len(tokens) - shingle_size + 1, 1))
+    }
+    hashes = np.array(
+        [
+            hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+            for shingle in shingles
+        ]
+    ).view(np.uint8)
+    bits = np.unpackbits(hashes.reshape(len(shingles), 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int32) * 2 > len(shingles)
+    return np.packbits(votes, bitorder="little").view(np.uint64)[0]
+
+
+def deduplicate_documents(
+    docs: List[Document], threshold: float = 0.95
+) -> Tuple[List[Document], int]:
+    """Remove near-duplicate documents, keeping the highest ranked one.
+
+    Args:
+        docs: Documents in rank order
+        threshold: Minimum SimHash similarity (share of equal signature bits)
+            for two documents to count as duplicates
+
+    Returns:
+        The remaining documents in rank order and the number of removed ones
+    """
+    max_distance = int((1 - threshold) * SIMHASH_BITS)
+    signatures = np.zeros(len(docs), dtype=np.uint64)
+    kept = []
+    for doc in docs:
+        signature = simhash(doc.page_content)
+        distances = np.bitwise_count(signatures[: len(kept)] ^ signature)
+        if not len(kept) or distances.min() > max_distance:
+            signatures[len(kept)] = signature
+            kept.append(doc)
+    return kept, len(docs) - len(kept)
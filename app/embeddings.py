@@ -0,0 +1,166 @@
+import os
+from typing import List
+
+import numpy as np
+from app.cache import CachedEmbeddings, SQLiteCacheStore
+from app.utils import LazyComponent, get_bool_env
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface import HuggingFaceEmbeddings
+
+load_dotenv()
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an exported (optionally int8-quantized) ONNX model.
+
+    Expects a directory with `model.onnx` and `tokenizer.json`, as written by
+    `scripts/export_onnx.py`. Applies mean pooling and L2 normalization, like
+    the sentence-transformers pipeline of `all-mpnet-base-v2`.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        num_threads: int = 0,
+        max_length: int = 384,
+        batch_size: int = 32,
+    ):
+        import onnxruntime  # optional dependency
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads  # 0 = onnxruntime default
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_path, "model.onnx"),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_token = next(
+            (
+                t
+                for t in ("<pad>", "[PAD]")
+                if self.tokenizer.token_to_id(t) is not None
+            ),
+            None,
+        )
+        if pad_token is None:
+            self.tokenizer.enable_padding()
+        else:
+            self.tokenizer.enable_padding(
+                pad_id=self.tokenizer.token_to_id(pad_token), pad_token=pad_token
+            )
+        self.batch_size = batch_size
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            inputs["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        mask = attention_mask[..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(
+            mask.sum(axis=1), 1e-9, None
+        )
+        return embeddings / np.clip(
+            np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return np.concatenate(
+            [
+                self._embed(texts[i : i + self.batch_size])
+                for i in range(0, len(texts), self.batch_size)
+            ]
+        ).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def check_embedding_parity(
+    reference: Embeddings, candidate: Embeddings, texts: List[str], k: int = 5
+) -> dict:
+    """Compare a candidate embedding backend against the reference one.
+
+    Returns:
+        Minimum and mean cosine similarity between the two embeddings of each
+        text, and the average overlap of each text's top-k nearest neighbours
+        among `texts`, which approximates the effect on retrieval recall.
+    """
+    a = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    cosine = (a * b).sum(axis=1)
+
+    k = min(k, len(texts) - 1)
+    if k < 1:
+        neighbour_overlap = 1.0
+    else:
+        top_a = np.argsort(-(a @ a.T), axis=1)[:, 1 : k + 1]
+        top_b = np.argsort(-(b @ b.T), axis=1)[:, 1 : k + 1]
+        neighbour_overlap = float(
+            np.mean([len(set(x) & set(y)) / k for x, y in zip(top_a, top_b)])
+        )
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "neighbour_overlap": neighbour_overlap,
+    }
+
+
+def setup_dense_embeddings() -> Embeddings:
+    model_name = os.getenv("DENSE_MODEL")
+    backend = os.getenv("EMBEDDING_BACKEND", "huggingface").lower()
+    match backend:
+        case "huggingface":
+            embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        case "onnx":
+            embeddings = OnnxEmbeddings(
+                model_path=os.getenv("ONNX_MODEL_PATH"),
+                num_threads=int(os.getenv("ONNX_NUM_THREADS", "0")),
+            )
+        case _:
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+    if not get_bool_env("EMBEDDING_CACHE_ENABLE", False):
+        return embeddings
+
+    max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096"))
+    path = os.getenv("EMBEDDING_CACHE_PATH")
+    return CachedEmbeddings(
+        embeddings,
+        model_name=f"{backend}:{model_name}",
+        max_entries=max_entries,
+        store=(
+            SQLiteCacheStore(
+                path, max_entries=max_entries * 16, table="embedding_cache"
+            )
+            if path
+            else None
+        ),
+        # Both backends embed a query like a document of the same text
+        symmetric=True,
+    )
+
+
+dense_embeddings = LazyComponent(setup_dense_embeddings, "dense_embeddings")
+
+
+def get_dense_embeddings() -> Embeddings:
+    """Get the process-wide dense embedding model defined by DENSE_MODEL.
+
+    The model is loaded once and shared by every component that embeds text,
+    so the retriever and the caches do not each pay for loading it. With
+    EMBEDDING_CACHE_ENABLE=true, it is wrapped in `CachedEmbeddings`.
+    """
+    return dense_embeddings.get()
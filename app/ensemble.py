@@ -0,0 +1,327 @@
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from app.metrics import RETRIEVER_DROPPED
+from app.utils import RRF_CONSTANT, setup_logger
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever, RetrieverLike
+from pydantic import Field
+
+logger = setup_logger(__name__)
+
+PRIMARY_KEY = "pk"  # primary key of vector store chunks, e.g. in Milvus
+ID_KEYS = ("source", "page")
+# Worker threads shared by the sync calls of all fusion retrievers
+FUSION_MAX_WORKERS = int(os.getenv("FUSION_MAX_WORKERS", "32"))
+_executor = ThreadPoolExecutor(
+    max_workers=FUSION_MAX_WORKERS, thread_name_prefix="fusion"
+)
+
+
+def document_key(doc: Document, id_keys: Sequence[str] = ID_KEYS) -> Hashable:
+    """Identity of a document for fusion.
+
+    Chunks with a primary key are identified by it, so chunks of the same page
+    stay apart; other documents, e.g. web results, by `id_keys` such as their
+    source and page. Falls back to the page content when none of `id_keys` is
+    in the metadata.
+    """
+    if doc.metadata.get(PRIMARY_KEY) is not None:
+        return PRIMARY_KEY, doc.metadata[PRIMARY_KEY]
+    key = tuple(map(doc.metadata.get, id_keys))
+    return doc.page_content if key.count(None) == len(key) else key
+
+
+class RankFusion:
+    """Weighted Reciprocal Rank Fusion (RRF) of ranked document lists.
+
+    Lists are added one at a time, e.g. as each source answers, and each one
+    updates the score vector of all candidates in a single NumPy operation. A
+    document scores the sum of weight / (rank + c) over the lists it appears
+    in. The same document (see `document_key`) is merged across lists, keeping
+    the first occurrence, and counts only at its best rank within a list.
+    """
+
+    def __init__(
+        self,
+        sources: Sequence[str] = (),
+        weights: Optional[Dict[str, float]] = None,
+        c: int = RRF_CONSTANT,
+        id_keys: Sequence[str] = ID_KEYS,
+        capacity: int = 256,
+    ):
+        self.weights = weights or {}
+        self.c = c
+        self.id_keys = tuple(id_keys)
+        self._positions = {source: i for i, source in enumerate(sources)}
+        self._rows: Dict[Hashable, int] = {}
+        self._docs: List[Document] = []
+        self._scores = np.zeros(capacity)
+        # Position of the first source (x 1e9) plus the rank of each document,
+        # which orders ties independently of the order in which sources answer
+        self._ties = np.full(capacity, np.inf)
+        self._ranks: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, source: str, docs: List[Document]):
+        """Add the ranked documents of a source."""
+        position = self._positions.setdefault(source, len(self._positions))
+        ranks: Dict[int, int] = {}  # row -> best rank in this list
+        for rank, doc in enumerate(docs, start=1):
+            row = self._rows.setdefault(
+                document_key(doc, self.id_keys), len(self._docs)
+            )
+            if row == len(self._docs):
+                self._docs.append(doc)
+            ranks.setdefault(row, rank)
+
+        if len(self._docs) > len(self._scores):
+            grow = max(len(self._docs), 2 * len(self._scores)) - len(self._scores)
+            self._scores = np.concatenate([self._scores, np.zeros(grow)])
+            self._ties = np.concatenate([self._ties, np.full(grow, np.inf)])
+        rows = np.fromiter(ranks.keys(), dtype=np.intp, count=len(ranks))
+        rank_array = np.fromiter(ranks.values(), dtype=np.float64, count=len(ranks))
+        self._scores[rows] += self.weights.get(source, 1.0) / (rank_array + self.c)
+        self._ties[rows] = np.minimum(self._ties[rows], position * 1e9 + rank_array)
+        self._ranks[source] = (rows, rank_array)
+
+    def ranking(self, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows of the documents ranked by fused score, best first, and their scores."""
+        n = len(self._docs)
+        order = np.lexsort((self._ties[:n], -self._scores[:n]))[:k]
+        return order, self._scores[order]
+
+    def fuse(self, k: Optional[int] = None) -> List[Document]:
+        """The documents ranked by fused score, best first.
+
+        Each document is a copy with its score breakdown, the fused score and
+        the rank and score of every source it appears in, in
+        `metadata["fusion"]`.
+        """
+        order, scores = self.ranking(k)
+        n = len(self._docs)
+        ranks_by_source = {}
+        for source, (rows, ranks) in self._ranks.items():
+            dense = np.zeros(n, dtype=np.intp)
+            dense[rows] = ranks
+            ranks_by_source[source] = dense[order].tolist()
+        docs = []
+        for i, (row, score) in enumerate(zip(order.tolist(), scores.tolist())):
+            breakdown = {}
+            for source, ranks in ranks_by_source.items():
+                if ranks[i]:
+                    breakdown[source] = {
+                        "rank": ranks[i],
+                        "score": self.weights.get(source, 1.0) / (ranks[i] + self.c),
+                    }
+            doc = self._docs[row]
+            docs.append(
+                doc.model_copy(
+                    update={
+                        "metadata": {
+                            **doc.metadata,
+                            "fusion": {"score": score, "sources": breakdown},
+                        }
+                    }
+                )
+            )
+        return docs
+
+
+def reciprocal_rank_fusion(
+    doc_lists: List[List[Document]],
+    c: int = RRF_CONSTANT,
+    id_keys: Sequence[str] = ID_KEYS,
+    sources: Optional[Sequence[str]] = None,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Document]:
+    """Fuse ranked document lists with weighted RRF, see `RankFusion`."""
+    sources = sources or [f"list_{i + 1}" for i in range(len(doc_lists))]
+    fusion = RankFusion(sources, weights, c=c, id_keys=id_keys)
+    for source, doc_list in zip(sources, doc_lists):
+        fusion.add(source, doc_list)
+    return fusion.fuse()
+
+
+def get_source_weights(sources: Sequence[str]) -> Dict[str, float]:
+    """RRF weight of each source from `<SOURCE>_RRF_WEIGHT` (default 1)."""
+    return {
+        source: float(os.getenv(f"{source.upper()}_RRF_WEIGHT", "1"))
+        for source in sources
+    }
+
+
+class FusionRetriever(BaseRetriever):
+    """Ensemble retriever fusing its sources with weighted RRF.
+
+    All sources are queried concurrently and each result is fused as soon as
+    it arrives. With a total `budget`, or a source's own budget, the sources
+    that have answered when it runs out are returned and the stragglers are
+    cancelled and recorded in `dropped`.
+
+    `ranked_lists` are fused as extra sources that have already answered, e.g.
+    the results of a source queried earlier (see `with_ranked_lists`).
+
+    Sync calls run the sources on a shared thread pool (FUSION_MAX_WORKERS).
+    Threads cannot be cancelled, so there the budget only stops waiting: a
+    straggler keeps its worker until it returns, and its result is discarded.
+    """
+
+    retrievers: List[RetrieverLike]
+    sources: List[str]
+    weights: Dict[str, float] = Field(default_factory=dict)
+    budget: Optional[float] = None  # seconds, None = no deadline
+    source_budgets: Dict[str, float] = Field(default_factory=dict)
+    c: int = RRF_CONSTANT
+    id_keys: Tuple[str, ...] = ID_KEYS
+    dropped: Dict[str, int] = Field(default_factory=dict)
+    ranked_lists: Dict[str, List[Document]] = Field(default_factory=dict)
+
+    def _deadline(self, source: str) -> float:
+        budget = self.budget if self.budget is not None else math.inf
+        return min(budget, self.source_budgets.get(source, budget))
+
+    def with_ranked_lists(
+        self, ranked_lists: Dict[str, List[Document]]
+    ) -> "FusionRetriever":
+        """Copy of the retriever that also fuses the ranked lists of other sources.
+
+        Their weights come from `<SOURCE>_RRF_WEIGHT`, see `get_source_weights`.
+        """
+        return self.model_copy(
+            update={
+                "ranked_lists": ranked_lists,
+                "weights": {**get_source_weights(ranked_lists), **self.weights},
+            }
+        )
+
+    def _fusion(self) -> RankFusion:
+        fusion = RankFusion(
+            [*self.ranked_lists, *self.sources],
+            self.weights,
+            c=self.c,
+            id_keys=self.id_keys,
+        )
+        for source, docs in self.ranked_lists.items():
+            fusion.add(source, docs)
+        return fusion
+
+    def _fuse(
+        self,
+        fusion: RankFusion,
+        answered: Set[str],
+        failed: Set[str],
+        started_at: float,
+    ) -> List[Document]:
+        dropped = [source for source in self.sources if source not in answered]
+        for source in dropped:
+            self.dropped[source] = self.dropped.get(source, 0) + 1
+            if source not in failed:  # errors are counted where they are caught
+                RETRIEVER_DROPPED.inc(source=source, reason="budget")
+        if dropped:
+            logger.warning(
+                f"Dropped sources after {time.monotonic() - started_at:.2f}s: {dropped}"
+            )
+        return fusion.fuse()
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started_at = time.monotonic()
+        fusion, answered, failed = self._fusion(), set(), set()
+        futures = {
+            _executor.submit(
+                retriever.invoke,
+                query,
+                {"callbacks": run_manager.get_child(tag=f"retriever_{i + 1}")},
+            ): source
+            for i, (source, retriever) in enumerate(zip(self.sources, self.retrievers))
+        }
+        pending = set(futures)
+        while pending:
+            deadlines = {
+                future: started_at + self._deadline(futures[future])
+                for future in pending
+            }
+            timeout = min(deadlines.values()) - time.monotonic()
+            done, pending = wait(
+                pending,
+                timeout=None if math.isinf(timeout) else max(timeout, 0),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    fusion.add(futures[future], future.result())
+                    answered.add(futures[future])
+                except Exception as e:
+                    logger.error(f"Retriever {futures[future]} failed: {e}")
+                    RETRIEVER_DROPPED.inc(source=futures[future], reason="error")
+                    failed.add(futures[future])
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[f] <= now]:
+                future.cancel()
+                pending.discard(future)
+        return self._fuse(fusion, answered, failed, started_at)
+
+    async def _aretrieve(
+        self,
+        source: str,
+        retriever: RetrieverLike,
+        query: str,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        tag: str,
+        failed: Set[str],
+    ) -> Tuple[str, Optional[List[Document]]]:
+        try:
+            return source, await asyncio.wait_for(
+                retriever.ainvoke(query, {"callbacks": run_manager.get_child(tag=tag)}),
+                timeout=(
+                    None
+                    if math.isinf(self._deadline(source))
+                    else self._deadline(source)
+                ),
+            )
+        except asyncio.TimeoutError:
+            return source, None
+        except Exception as e:
+            logger.error(f"Retriever {source} failed: {e}")
+            RETRIEVER_DROPPED.inc(source=source, reason="error")
+            failed.add(source)
+            return source, None
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        started_at = time.monotonic()
+        fusion, answered, failed = self._fusion(), set(), set()
+        tasks = [
+            asyncio.create_task(
+                self._aretrieve(
+                    source, retriever, query, run_manager, f"retriever_{i + 1}", failed
+                )
+            )
+            for i, (source, retriever) in enumerate(zip(self.sources, self.retrievers))
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks, timeout=self.budget):
+                source, docs = await next_result
+                if docs is not None:
+                    fusion.add(source, docs)
+                    answered.add(source)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+        return self._fuse(fusion, answered, failed, started_at)
@@ -1,8 +1,26 @@
 import os
-from typing import List
+import time
+from functools import cached_property
+from typing import Any, Callable, List, Optional, Tuple
 
-from app.state import OutputState
-from app.utils import MAX_RETRY, NUMBER_OF_CONTEXT_DOCS, TEMPERATURE, TIMEOUT
+import tiktoken
+from app.cache import CachedLLM, InMemoryCacheStore, SQLiteCacheStore
+from app.circuit_breaker import (
+    CircuitBreakerRunnable,
+    CircuitOpenError,
+    get_circuit_breaker,
+)
+from app.llm_routing import ProviderRouter
+from app.metrics import GENERATOR_FALLBACKS, TokenUsageCallbackHandler
+from app.state import CompactOutputState, OutputState
+from app.utils import (
+    MAX_RETRY,
+    TEMPERATURE,
+    TIMEOUT,
+    convert_document_to_additional_source,
+    get_bool_env,
+    setup_logger,
+)
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
@@ -11,11 +29,13 @@ from langchain_deepseek import ChatDeepSeek
 from langchain_openai import ChatOpenAI
 from openai import APIError, APITimeoutError, BadRequestError
 
+logger = setup_logger(__name__)
 load_dotenv()
 
 NO_ANSWER_PROMPT = (
     '"I don\'t know the answer to that question due to insufficient context."'
 )
+LLM_PROVIDERS = ("OPENAI", "DEEPSEEK")
 GENERATOR_FALLBACK = {
     "answer": "Unable to answer the question due to API error. Please check the logs for details.",
     "citations": [],
@@ -25,48 +45,288 @@ GENERATOR_FALLBACK = {
 
 class Generator:
     def __init__(self):
+        self.streaming = get_bool_env("GENERATOR_STREAMING", False)
+        self.citation_mode = os.getenv("CITATION_MODE", "full").lower()
+        match self.citation_mode:
+            case "full":
+                self.output_schema = OutputState
+            case "reference":  # LLM cites context documents by index
+                self.output_schema = CompactOutputState
+            case _:
+                raise ValueError(f"Unsupported citation mode: {self.citation_mode}")
+        self.context_token_budget = int(
+            os.getenv("CONTEXT_TOKEN_BUDGET", "0")
+        )  # 0 = no budget
         self.prompt = ChatPromptTemplate.from_messages(
             [
                 (
                     "system",
-                    f"You are a reliable document analysis assistant that answers questions strictly based on the {NUMBER_OF_CONTEXT_DOCS} provided context documents. If the context is missing, empty, or insufficient, reply with: {NO_ANSWER_PROMPT}. Avoid assumptions, hallucination, and harmful content. Stay factual, clear, and grounded in the context. IMPORTANT: Return only valid JSON.",
+                    f"You are a reliable document analysis assistant that answers questions strictly based on the provided context documents. If the context is missing, empty, or insufficient, reply with: {NO_ANSWER_PROMPT}. Avoid assumptions, hallucination, and harmful content. Stay factual, clear, and grounded in the context. IMPORTANT: Return only valid JSON.",
                 ),
                 ("human", "Contexts: {context}\nQuestion: {question}"),
             ],
         )
 
         llm_provider = (os.getenv("LLM_PROVIDER", "")).upper()
+        # "auto" routes between all providers by their recent latency
+        providers = (
+            self.__configured_providers() if llm_provider == "AUTO" else (llm_provider,)
+        )
+        self.llms = {
+            provider.lower(): self.__setup_llm(provider) for provider in providers
+        }
+        self.llm = next(iter(self.llms.values()))
+        self.provider_router = (
+            ProviderRouter(
+                {provider: self.__structured_llm(provider) for provider in self.llms},
+                hedge=get_bool_env("LLM_HEDGING_ENABLE", False),
+                hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "0.9")),
+                min_hedge_delay=float(os.getenv("LLM_MIN_HEDGE_DELAY", "1.0")),
+            )
+            if len(self.llms) > 1
+            else None
+        )
+        self.response_cache = (
+            self.__setup_response_cache()
+            if get_bool_env("LLM_CACHE_ENABLE", False)
+            else None
+        )
+
+    def __configured_providers(self) -> Tuple[str, ...]:
+        """Providers of LLM_PROVIDERS whose `<PROVIDER>_API_KEY` is set."""
+        providers = tuple(
+            provider for provider in LLM_PROVIDERS if os.getenv(f"{provider}_API_KEY")
+        )
+        if not providers:
+            raise ValueError(
+                "LLM_PROVIDER=auto requires an API key of at least one of: "
+                + ", ".join(f"{provider}_API_KEY" for provider in LLM_PROVIDERS)
+            )
+        for provider in LLM_PROVIDERS:
+            if provider not in providers:
+                logger.warning(
+                    f"Skipping LLM provider {provider}, {provider}_API_KEY is not set"
+                )
+        return providers
+
+    def __setup_llm(self, llm_provider: str):
         match llm_provider:
             case "OPENAI":
-                self.llm = ChatOpenAI(
+                return ChatOpenAI(
                     model="gpt-4.1",
                     timeout=TIMEOUT,
                     max_retries=MAX_RETRY,
                     tags=[llm_provider.lower()],
                     temperature=TEMPERATURE,
+                    callbacks=[TokenUsageCallbackHandler(llm_provider.lower())],
+                    stream_usage=True,  # token usage of streamed responses
                 )
             case "DEEPSEEK":
-                self.llm = ChatDeepSeek(
+                return ChatDeepSeek(
                     model="deepseek-chat",  # DeepSeek V3
                     timeout=TIMEOUT,
                     max_retries=MAX_RETRY,
                     tags=[llm_provider.lower()],
                     temperature=TEMPERATURE,
+                    callbacks=[TokenUsageCallbackHandler(llm_provider.lower())],
+                    stream_usage=True,  # token usage of streamed responses
                 )
             case _:
                 raise ValueError(f"Unsupported LLM provider: {llm_provider}")
 
-    # TODO: Manage doc positioning based on research
+    def __structured_llm(self, provider: str):
+        llm = self.llms[provider].with_structured_output(self.output_schema)
+        if get_bool_env("CIRCUIT_BREAKER_ENABLE", False):
+            llm = CircuitBreakerRunnable(
+                llm, get_circuit_breaker(f"llm_{provider}", slow_call_threshold=TIMEOUT)
+            )
+        return llm
+
+    def __setup_response_cache(self) -> Optional[CachedLLM]:
+        if TEMPERATURE != 0:
+            logger.warning("LLM cache is disabled, it requires TEMPERATURE=0")
+            return None
+        max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "4096"))
+        backend = os.getenv("LLM_CACHE_BACKEND", "sqlite").lower()
+        match backend:
+            case "memory":
+                store = InMemoryCacheStore(max_entries=max_entries)
+            case "sqlite":
+                store = SQLiteCacheStore(
+                    path=os.getenv("LLM_CACHE_PATH", ".cache/llm.sqlite"),
+                    max_entries=max_entries,
+                    table="llm_cache",
+                )
+            case _:
+                raise ValueError(f"Unsupported LLM cache backend: {backend}")
+        return CachedLLM(
+            llm=self.__uncached_llm(),
+            provider=",".join(self.llms),
+            model=",".join(llm.model_name for llm in self.llms.values()),
+            temperature=TEMPERATURE,
+            schema=self.output_schema,
+            store=store,
+            ttl=float(os.getenv("LLM_CACHE_TTL", "2592000")),
+        )
+
+    def __uncached_llm(self):
+        if self.provider_router is not None:
+            return self.provider_router
+        return self.__structured_llm(next(iter(self.llms)))
+
+    @cached_property
+    def tokenizer(self) -> tiktoken.Encoding:
+        """Local tokenizer used to count prompt tokens, loaded on first use."""
+        return tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "o200k_base"))
+
+    def format_doc(self, doc: Document, index: Optional[int] = None) -> str:
+        formatted = f"Source: {doc.metadata.get('source')}\nPage: {doc.metadata.get('page')}\nInformation: {doc.page_content}"
+        return formatted if index is None else f"Index: {index}\n{formatted}"
+
+    def pack_docs(
+        self,
+        docs: List[Document],
+        budget: int,
+        min_trimmed_tokens: int = 32,
+        indexed: bool = False,
+    ) -> Tuple[List[Document], List[Document], dict]:
+        """Fit ranked documents into a prompt token budget.
+
+        Documents are taken in rank order until one does not fit. That one is
+        trimmed to the remaining budget if at least `min_trimmed_tokens` are
+        left, otherwise dropped, and all lower ranked documents are dropped
+        as well, so the packed documents are always a prefix of `docs`.
+
+        Args:
+            docs: Documents in rank order
+            budget: Maximum number of tokens of the formatted documents
+            min_trimmed_tokens: Minimum content tokens kept of a trimmed document
+            indexed: Count the tokens of documents formatted with their index
+
+        Returns:
+            The packed documents, the dropped documents and token statistics
+            of the packing
+        """
+        separator_tokens = len(self.tokenizer.encode("\n\n---\n\n"))
+        packed = []
+        stats = {
+            "tokens_used": 0,
+            "tokens_cut": 0,
+            "docs_trimmed": 0,
+            "docs_dropped": 0,
+        }
+        for i, doc in enumerate(docs):
+            tokens = len(
+                self.tokenizer.encode(self.format_doc(doc, i if indexed else None))
+            )
+            cost = tokens + (separator_tokens if packed else 0)
+            remaining = budget - stats["tokens_used"]
+            if cost <= remaining:
+                packed.append(doc)
+                stats["tokens_used"] += cost
+                continue
+
+            content_tokens = self.tokenizer.encode(doc.page_content)
+            overhead = cost - len(content_tokens)
+            keep = remaining - overhead
+            dropped = docs[i:]
+            if keep >= min_trimmed_tokens:
+                packed.append(
+                    Document(
+                        page_content=self.tokenizer.decode(content_tokens[:keep]),
+                        metadata=doc.metadata,
+                    )
+                )
+                stats["tokens_used"] += overhead + keep
+                stats["tokens_cut"] += len(content_tokens) - keep
+                stats["docs_trimmed"] += 1
+                dropped = docs[i + 1 :]
+            for dropped_doc in dropped:
+                stats["tokens_cut"] += len(
+                    self.tokenizer.encode(self.format_doc(dropped_doc))
+                )
+            stats["docs_dropped"] = len(dropped)
+            return packed, dropped, stats
+        return packed, [], stats
+
+    def pack_context(
+        self, docs: List[Document]
+    ) -> Tuple[List[Document], List[Document]]:
+        """Pack context documents into the CONTEXT_TOKEN_BUDGET, if any.
+
+        Returns:
+            The documents to format as context and the dropped documents
+        """
+        if self.context_token_budget <= 0:
+            return docs, []
+        packed, dropped, stats = self.pack_docs(
+            docs,
+            self.context_token_budget,
+            indexed=self.citation_mode == "reference",
+        )
+        logger.info(f"Context packing: {stats}")
+        return packed, dropped
+
     def format_docs_as_context(self, docs: List[Document]):
+        # In reference mode documents are cited by their position in `docs`
+        indexed = self.citation_mode == "reference"
         return (
             "\n"
             + "\n\n---\n\n".join(
-                f"Source: {doc.metadata.get('source')}\nPage: {doc.metadata.get('page')}\nInformation: {doc.page_content}"
-                for doc in docs
+                self.format_doc(doc, i if indexed else None)
+                for i, doc in enumerate(docs)
             )
             + "\n"
         )
 
+    def resolve_citations(self, response: dict, docs: List[Document]) -> OutputState:
+        """Resolve a response of the compact schema into an `OutputState`.
+
+        Cited context documents become citations, using the cited span as
+        snippet when its offsets are valid, and uncited ones become additional
+        sources. Responses of the full schema are returned as is.
+
+        Args:
+            response: Structured response of the LLM
+            docs: Context documents given to `format_docs_as_context`
+
+        Returns:
+            The response in the full output schema
+        """
+        if self.citation_mode != "reference":
+            return response
+        citations = []
+        cited = set()
+        for reference in response.get("citations") or []:
+            index = reference.get("index")
+            if not isinstance(index, int) or not 0 <= index < len(docs):
+                logger.warning(f"Ignoring citation of unknown document: {reference}")
+                continue
+            doc = docs[index]
+            start, end = reference.get("start"), reference.get("end")
+            if isinstance(start, int) and isinstance(end, int) and 0 <= start < end:
+                snippet = doc.page_content[start:end]
+            else:
+                snippet = doc.page_content
+            citation = {
+                "url": doc.metadata.get("source"),
+                "snippet": snippet,
+                "page": doc.metadata.get("page"),
+            }
+            if citation not in citations:
+                citations.append(citation)
+            cited.add(index)
+        return {
+            "answer": response.get("answer"),
+            "citations": citations,
+            "additional_sources": response.get("additional_sources", [])
+            + [
+                convert_document_to_additional_source(doc)
+                for i, doc in enumerate(docs)
+                if i not in cited
+            ],
+        }
+
     def __call__(self):
         return self.get_prompt() | self.get_llm()
 
@@ -74,10 +334,59 @@ class Generator:
         return self.prompt
 
     def get_llm(self):
-        return self.llm.with_structured_output(OutputState).with_fallbacks(
+        llm = (
+            self.response_cache
+            if self.response_cache is not None
+            else self.__uncached_llm()
+        )
+        return llm.with_fallbacks(
             self.__generator_fallback(),
-            exceptions_to_handle=(APIError, APITimeoutError, BadRequestError),
+            exceptions_to_handle=(
+                APIError,
+                APITimeoutError,
+                BadRequestError,
+                CircuitOpenError,
+            ),
         )
 
+    async def astream(
+        self, prompt: Any, on_event: Optional[Callable[[dict], None]] = None
+    ) -> OutputState:
+        """Generate the structured response while streaming the answer text.
+
+        Partial answer text is passed to `on_event` as `{"answer_delta": str}` as
+        soon as it is parsed from the LLM output, followed by a final
+        `{"time_to_first_token": float, "latency": float}` event (in seconds).
+
+        Returns:
+            The complete structured response, like `get_llm().ainvoke`.
+        """
+        on_event = on_event or (lambda event: None)
+        started_at = time.perf_counter()
+        time_to_first_token = None
+        answer = ""
+        response = {}
+        async for chunk in self.get_llm().astream(prompt):
+            response = chunk
+            partial_answer = chunk.get("answer") or ""
+            if len(partial_answer) > len(answer):
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - started_at
+                on_event({"answer_delta": partial_answer[len(answer) :]})
+                answer = partial_answer
+
+        latency = time.perf_counter() - started_at
+        logger.info(
+            "Generation time to first token: "
+            + (f"{time_to_first_token:.3f}s" if time_to_first_token else "n/a")
+            + f", latency: {latency:.3f}s"
+        )
+        on_event({"time_to_first_token": time_to_first_token, "latency": latency})
+        return response
+
     def __generator_fallback(self):
-        return [RunnableLambda(lambda x: GENERATOR_FALLBACK)]
+        def fallback(x):
+            GENERATOR_FALLBACKS.inc(provider=",".join(self.llms))
+            return GENERATOR_FALLBACK
+
+        return [RunnableLambda(fallback)]
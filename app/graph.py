@@ -1,50 +1,260 @@
-from app.generator import Generator
+import asyncio
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import List, Optional
+
+from app.cache import SemanticCache
+from app.dedup import deduplicate_documents
+from app.embeddings import dense_embeddings, get_dense_embeddings
+from app.generator import GENERATOR_FALLBACK, Generator
+from app.metrics import CONTEXT_CHARACTERS, CONTEXT_DOCUMENTS, timed_node
+from app.reranker import Reranker
 from app.retriever import Retriever
+from app.routing import AdaptiveRouter
+from app.single_flight import SingleFlight, coalescing_key
 from app.state import ContextState, InputState, OutputState, OverallState
-from app.utils import NUMBER_OF_CONTEXT_DOCS, convert_document_to_additional_source
+from app.utils import (
+    DEDUP_THRESHOLD,
+    NUMBER_OF_CONTEXT_DOCS,
+    LazyComponent,
+    convert_document_to_additional_source,
+    get_bool_env,
+    setup_logger,
+)
 from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
 from langgraph.graph import END, START, StateGraph
 
+logger = setup_logger(__name__)
 load_dotenv()
 
-retriever = Retriever()
-generator = Generator()
+# Components are built on first use (or by `warmup`), not at import time
+retriever = LazyComponent(Retriever, "retriever")
+generator = LazyComponent(Generator, "generator")
+reranker = (
+    LazyComponent(Reranker, "reranker")
+    if get_bool_env("RERANKER_ENABLE", False)
+    else None
+)
+router = AdaptiveRouter() if get_bool_env("ADAPTIVE_ROUTING_ENABLE", False) else None
+# Concurrent runs of the same question share one retrieval and generation.
+# Streamed generations are not shared, since only the leader run would emit
+# the partial answers on its "custom" stream.
+retriever_flight = (
+    SingleFlight("retriever") if get_bool_env("COALESCING_ENABLE", False) else None
+)
+generator_flight = (
+    SingleFlight("generator")
+    if get_bool_env("COALESCING_ENABLE", False)
+    and not get_bool_env("GENERATOR_STREAMING", False)
+    else None
+)
+semantic_cache = (
+    LazyComponent(lambda: SemanticCache(get_dense_embeddings()), "semantic_cache")
+    if get_bool_env("SEMANTIC_CACHE_ENABLE", False)
+    else None
+)
+# Set by batch runs (see app.batch) to bound the number of concurrent LLM calls
+generation_limit: ContextVar[Optional[asyncio.Semaphore]] = ContextVar(
+    "generation_limit", default=None
+)
+
+
+def warmup(background: bool = True) -> Optional[threading.Thread]:
+    """Preload the embedding model and open all retriever and LLM clients.
+
+    Logs a breakdown of the time spent on each component.
+
+    Args:
+        background: Run in a daemon thread instead of blocking the caller
+
+    Returns:
+        The warmup thread if running in background, otherwise None
+    """
+
+    def run():
+        started_at = time.perf_counter()
+        components = [dense_embeddings, retriever, generator]
+        components += [c for c in (reranker, semantic_cache) if c is not None]
+        for component in components:
+            try:
+                component.get()
+            except Exception as e:
+                logger.error(f"Warmup of {component.name} failed: {e}")
+        breakdown = ", ".join(
+            f"{component.name}={component.init_duration:.3f}s"
+            for component in components
+            if component.init_duration is not None
+        )
+        logger.info(
+            f"Startup time: {time.perf_counter() - started_at:.3f}s ({breakdown})"
+        )
+
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
 
+@timed_node("semantic_cache")
+async def semantic_cache_node(state: InputState) -> OverallState:
+    cached_output = await (await semantic_cache.aget()).lookup(state["question"])
+    if cached_output is None:
+        return {"question": state["question"]}
+    return {"question": state["question"], **cached_output}
 
-async def retriever_node(state: InputState) -> ContextState:
-    retrieved_docs = await retriever().ainvoke(state["question"])
+
+def route_after_semantic_cache(state: OverallState) -> str:
+    return END if state.get("answer") is not None else "retriever"
+
+
+def to_context_state(question: str, retrieved_docs: List[Document]) -> ContextState:
+    if get_bool_env("DEDUP_ENABLE", False):
+        retrieved_docs, removed = deduplicate_documents(retrieved_docs, DEDUP_THRESHOLD)
+        logger.info(f"Removed {removed} near-duplicate documents")
     return {
-        "question": state["question"],
+        "question": question,
         "context": retrieved_docs[:NUMBER_OF_CONTEXT_DOCS],
         "additional_sources": retrieved_docs[NUMBER_OF_CONTEXT_DOCS:],
     }
 
 
-async def generator_node(context_state: ContextState) -> OutputState:
-    prompt = await generator.get_prompt().ainvoke(
-        {
-            "question": context_state["question"],
-            "context": generator.format_docs_as_context(context_state["context"]),
-        }
+async def retrieve(question: str) -> ContextState:
+    qa_retriever = await retriever.aget()
+    # Only the local corpus is queried first when routing is adaptive
+    runnable = qa_retriever.local_retriever or qa_retriever()
+    return to_context_state(question, await runnable.ainvoke(question))
+
+
+@timed_node("retriever")
+async def retriever_node(state: InputState, config: RunnableConfig) -> ContextState:
+    if retriever_flight is None:
+        return await retrieve(state["question"])
+    return await retriever_flight.run(
+        coalescing_key(state["question"], config),
+        lambda: retrieve(state["question"]),
     )
-    response = await generator.get_llm().ainvoke(prompt)
+
+
+def route_after_retriever(context_state: ContextState) -> str:
+    qa_retriever = retriever.get()
+    if qa_retriever.local_retriever is not None and qa_retriever.web_retriever:
+        docs = context_state["context"] + context_state["additional_sources"]
+        if router.needs_web(context_state["question"], docs):
+            return "web_retriever"
+    return "reranker" if reranker is not None else "generator"
+
+
+@timed_node("web_retriever")
+async def web_retriever_node(context_state: ContextState) -> ContextState:
+    qa_retriever = await retriever.aget()
+    local_docs = context_state["context"] + context_state["additional_sources"]
+    # The local results are fused with the list of every web source, as if all
+    # sources had been queried at once
+    web_retriever = qa_retriever.web_retriever.with_ranked_lists(
+        {qa_retriever.local_source: local_docs}
+    )
+    started_at = time.perf_counter()
+    docs = await web_retriever.ainvoke(context_state["question"])
+    router.record_web_latency(time.perf_counter() - started_at)
+    return to_context_state(context_state["question"], docs)
+
+
+@timed_node("reranker")
+async def reranker_node(context_state: ContextState) -> ContextState:
+    qa_reranker = await reranker.aget()
+    reranked_docs = await qa_reranker.arerank(
+        context_state["question"],
+        context_state["context"] + context_state["additional_sources"],
+    )
+    return {
+        "question": context_state["question"],
+        "context": reranked_docs[:NUMBER_OF_CONTEXT_DOCS],
+        "additional_sources": reranked_docs[NUMBER_OF_CONTEXT_DOCS:],
+    }
+
+
+async def generate(context_state: ContextState) -> OutputState:
+    qa_generator = await generator.aget()
+    context_docs, dropped_docs = qa_generator.pack_context(context_state["context"])
+    context = qa_generator.format_docs_as_context(context_docs)
+    CONTEXT_DOCUMENTS.observe(len(context_docs))
+    CONTEXT_CHARACTERS.observe(len(context))
+    prompt = await qa_generator.get_prompt().ainvoke(
+        {"question": context_state["question"], "context": context}
+    )
+    async with generation_limit.get() or nullcontext():
+        if qa_generator.streaming:
+            # Partial answers are emitted on the graph's "custom" stream mode
+            response = await qa_generator.astream(prompt, on_event=get_stream_writer())
+        else:
+            response = await qa_generator.get_llm().ainvoke(prompt)
+    fallback = response is GENERATOR_FALLBACK
+    response = qa_generator.resolve_citations(response, context_docs)
+    # Documents dropped by packing were not in the prompt, but stay listed
     additional_sources_from_context_state = [
         convert_document_to_additional_source(doc)
-        for doc in context_state["additional_sources"]
+        for doc in dropped_docs + context_state["additional_sources"]
     ]
-    return {
+    output = {
         "answer": response.get("answer"),
         "citations": response.get("citations", []),
         "additional_sources": response.get("additional_sources", [])
         + additional_sources_from_context_state,
     }
+    if semantic_cache is not None and not fallback:
+        await (await semantic_cache.aget()).update(context_state["question"], output)
+    return output
+
+
+@timed_node("generator")
+async def generator_node(
+    context_state: ContextState, config: RunnableConfig
+) -> OutputState:
+    if generator_flight is None:
+        return await generate(context_state)
+    context_fingerprint = [
+        (doc.metadata.get("source"), doc.metadata.get("page"), hash(doc.page_content))
+        for doc in context_state["context"]
+    ]
+    return await generator_flight.run(
+        coalescing_key(context_state["question"], config, context_fingerprint),
+        lambda: generate(context_state),
+    )
 
 
 builder = StateGraph(OverallState, input=InputState, output=OutputState)
 builder.add_node("retriever", retriever_node)
 builder.add_node("generator", generator_node)
-builder.add_edge(START, "retriever")
-builder.add_edge("retriever", "generator")
+if semantic_cache is not None:
+    builder.add_node("semantic_cache", semantic_cache_node)
+    builder.add_edge(START, "semantic_cache")
+    builder.add_conditional_edges(
+        "semantic_cache", route_after_semantic_cache, ["retriever", END]
+    )
+else:
+    builder.add_edge(START, "retriever")
+after_retriever = "reranker" if reranker is not None else "generator"
+if router is not None:
+    builder.add_node("web_retriever", web_retriever_node)
+    builder.add_conditional_edges(
+        "retriever", route_after_retriever, ["web_retriever", after_retriever]
+    )
+    builder.add_edge("web_retriever", after_retriever)
+else:
+    builder.add_edge("retriever", after_retriever)
+if reranker is not None:
+    builder.add_node("reranker", reranker_node)
+    builder.add_edge("reranker", "generator")
 builder.add_edge("generator", END)
 graph = builder.compile()
 graph.name = "QA System for Business Case"
+
+if get_bool_env("WARMUP_ENABLE", False):
+    warmup(background=True)
@@ -0,0 +1,36 @@
+import asyncio
+import os
+import weakref
+
+import httpx
+from app.utils import TIMEOUT
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Get the pooled async HTTP client shared by all retrievers.
+
+    Connections are kept alive and reused across requests. httpx clients are
+    bound to an event loop, so there is one client per running loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(
+                    os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+                ),
+            ),
+            follow_redirects=True,
+        )
+        _clients[loop] = client
+    return client
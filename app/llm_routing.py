@@ -0,0 +1,212 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.utils import TIMEOUT, setup_logger
+from langchain_core.runnables import Runnable, RunnableConfig
+
+logger = setup_logger(__name__)
+
+# Upper bounds (seconds) of the latency buckets, spaced by a factor of sqrt(2)
+LATENCY_BUCKETS = tuple(0.1 * 2 ** (i / 2) for i in range(20))
+
+
+class LatencyHistogram:
+    """Latency histogram whose counts decay, so recent calls weigh more.
+
+    Every recorded latency multiplies all counts by `decay` first, so a sample
+    recorded `n` calls ago has a weight of `decay ** n`.
+    """
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS, decay: float = 0.98):
+        self.buckets = buckets
+        self.decay = decay
+        self.counts = [0.0] * (len(buckets) + 1)  # the last bucket is unbounded
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self.counts = [count * self.decay for count in self.counts]
+            self.counts[bisect_left(self.buckets, latency)] += 1
+            self.samples += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the `q` (0 - 1) percentile, if any samples."""
+        with self._lock:
+            total = sum(self.counts)
+            if not total:
+                return None
+            cumulative = 0.0
+            for i, count in enumerate(self.counts):
+                cumulative += count
+                if cumulative >= q * total:
+                    break
+        return self.buckets[i] if i < len(self.buckets) else float(TIMEOUT)
+
+
+class ProviderRouter(Runnable):
+    """Route LLM calls to the provider with the best recent median latency.
+
+    Providers without recorded latencies are tried first, so every provider
+    gets measured. A failed call is retried on the next provider. With `hedge`,
+    a second provider is also called if the first has not answered within its
+    `hedge_percentile` latency; the first valid response wins and the other
+    call is cancelled.
+    """
+
+    def __init__(
+        self,
+        runnables: Dict[str, Runnable],
+        hedge: bool = False,
+        hedge_percentile: float = 0.9,
+        min_hedge_delay: float = 1.0,
+    ):
+        self.runnables = runnables
+        self.histograms = {name: LatencyHistogram() for name in runnables}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay  # seconds
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def ranked(self) -> List[str]:
+        return sorted(
+            self.runnables,
+            key=lambda name: self.histograms[name].percentile(0.5) or 0.0,
+        )
+
+    def hedge_delay(self, name: str) -> float:
+        delay = self.histograms[name].percentile(self.hedge_percentile)
+        return max(delay or 0.0, self.min_hedge_delay)
+
+    def _is_valid(self, output: Any) -> bool:
+        return isinstance(output, dict) and bool(output.get("answer"))
+
+    def _record(self, name: str, started_at: float, failed: bool = False):
+        latency = time.perf_counter() - started_at
+        # Failures count as timeouts, so failing providers are ranked last
+        self.histograms[name].record(max(latency, TIMEOUT) if failed else latency)
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        error = None
+        for name in self.ranked():
+            started_at = time.perf_counter()
+            try:
+                output = self.runnables[name].invoke(input, config, **kwargs)
+            except Exception as e:
+                self._record(name, started_at, failed=True)
+                logger.warning(f"LLM provider {name} failed: {e}")
+                error = e
+                continue
+            self._record(name, started_at)
+            return output
+        raise error
+
+    async def _ainvoke(
+        self, name: str, input: Any, config: Optional[RunnableConfig], **kwargs: Any
+    ) -> Any:
+        started_at = time.perf_counter()
+        try:
+            output = await self.runnables[name].ainvoke(input, config, **kwargs)
+        except Exception as e:
+            self._record(name, started_at, failed=True)
+            logger.warning(f"LLM provider {name} failed: {e}")
+            raise
+        self._record(name, started_at)
+        return output
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> Any:
+        order = self.ranked()
+        remaining = iter(order)
+        tasks: Dict[asyncio.Future, str] = {}
+
+        def start_next() -> Optional[asyncio.Future]:
+            name = next(remaining, None)
+            if name is None:
+                return None
+            task = asyncio.ensure_future(self._ainvoke(name, input, config, **kwargs))
+            tasks[task] = name
+            return task
+
+        pending = {start_next()}
+        error, output = None, None
+        hedged = False
+        try:
+            while pending:
+                hedge_delay = (
+                    self.hedge_delay(order[0])
+                    if self.hedge and len(tasks) == 1
+                    else None
+                )
+                done, pending = await asyncio.wait(
+                    pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif self._is_valid(task.result()):
+                        if hedged and tasks[task] != order[0]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    else:
+                        output = task.result()
+                if not done or not pending:  # too slow or failed, try the next one
+                    task = start_next()
+                    if task is not None:
+                        pending.add(task)
+                        if not done:
+                            hedged = True
+                            self.hedges += 1
+                            logger.info(
+                                f"Hedging LLM call of {order[0]} with {tasks[task]}"
+                            )
+        finally:
+            # A cancelled hedge loser records no latency: it is censored, not a sample
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if output is None and error is not None:
+            raise error
+        return output
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        # Streams are not hedged, but fail over until the first chunk is yielded
+        error = None
+        for name in self.ranked():
+            started_at = time.perf_counter()
+            streamed = False
+            try:
+                async for chunk in self.runnables[name].astream(
+                    input, config, **kwargs
+                ):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                self._record(name, started_at, failed=True)
+                if streamed:
+                    raise
+                logger.warning(f"LLM provider {name} failed: {e}")
+                error = e
+                continue
+            self._record(name, started_at)
+            return
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            "latency_p50": {
+                name: histogram.percentile(0.5)
+                for name, histogram in self.histograms.items()
+            },
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from app.utils import RRF_CONSTANT, setup_logger
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+logger = setup_logger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Stop words of the english analyzer of the Milvus BM25 function
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such that "
+    "the their then there these they this to was will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens without stop words.
+
+    Close to the Milvus english analyzer, but without stemming.
+    """
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalIndex:
+    """In-process hybrid index of the PDF corpus.
+
+    A directory with the chunk texts and metadata (`chunks.jsonl`), their unit
+    normalized dense embeddings (`vectors.npy`, memory-mapped float32) and a
+    BM25 inverted index of the same chunks (`bm25.npz`, `vocabulary.json`).
+    Built by `LocalIndex.build`, e.g. from a Milvus collection with
+    `scripts/export_local_index.py`.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "index.json"), "r") as f:
+            self.info = json.load(f)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        with open(os.path.join(path, "chunks.jsonl"), "r") as f:
+            for line in f:
+                chunk = json.loads(line)
+                self.texts.append(chunk["text"])
+                self.metadatas.append(chunk["metadata"])
+        with open(os.path.join(path, "vocabulary.json"), "r") as f:
+            self.vocabulary: Dict[str, int] = json.load(f)
+        bm25 = np.load(os.path.join(path, "bm25.npz"))
+        self.indptr = bm25["indptr"]
+        self.postings = bm25["postings"]
+        self.weights = bm25["weights"]
+        self.idf = bm25["idf"]
+        if len(self.vectors) != len(self.texts):
+            raise ValueError(
+                f"Local index {path} has {len(self.vectors)} vectors for {len(self.texts)} chunks"
+            )
+
+    def __len__(self):
+        return len(self.texts)
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        texts: Sequence[str],
+        metadatas: Sequence[dict],
+        vectors: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+        **info: Any,
+    ) -> "LocalIndex":
+        """Write an index of the chunks and their dense embeddings to `path`."""
+        os.makedirs(path, exist_ok=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.clip(
+            np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None
+        )
+        np.save(os.path.join(path, "vectors.npy"), vectors)
+        with open(os.path.join(path, "chunks.jsonl"), "w") as f:
+            for text, metadata in zip(texts, metadatas):
+                f.write(json.dumps({"text": text, "metadata": metadata}) + "\n")
+
+        # Postings of each term, with the BM25 term frequency saturation and
+        # document length normalization precomputed per posting
+        term_frequencies = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(tf.values()) for tf in term_frequencies])
+        average_length = lengths.mean() if len(lengths) else 0.0
+        vocabulary: Dict[str, int] = {}
+        postings: List[List[Tuple[int, float]]] = []
+        for doc, tf in enumerate(term_frequencies):
+            norm = k1 * (1 - b + b * lengths[doc] / (average_length or 1))
+            for term, count in tf.items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                if term_id == len(postings):
+                    postings.append([])
+                postings[term_id].append((doc, count * (k1 + 1) / (count + norm)))
+        document_frequencies = np.array([len(p) for p in postings])
+        np.savez(
+            os.path.join(path, "bm25.npz"),
+            indptr=np.concatenate([[0], np.cumsum(document_frequencies)]).astype(
+                np.int64
+            ),
+            postings=np.array([doc for p in postings for doc, _ in p], dtype=np.int32),
+            weights=np.array(
+                [weight for p in postings for _, weight in p], dtype=np.float32
+            ),
+            idf=np.log(
+                1
+                + (len(texts) - document_frequencies + 0.5)
+                / (document_frequencies + 0.5)
+            ).astype(np.float32),
+        )
+        with open(os.path.join(path, "vocabulary.json"), "w") as f:
+            json.dump(vocabulary, f)
+        with open(os.path.join(path, "index.json"), "w") as f:
+            json.dump({"count": len(texts), "dim": vectors.shape[1], **info}, f)
+        return cls(path)
+
+    def dense_search(self, embedding: Sequence[float], k: int) -> np.ndarray:
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        return top_k(self.vectors @ query, k)
+
+    def bm25_search(self, query: str, k: int) -> np.ndarray:
+        term_ids = [
+            self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary
+        ]
+        if not term_ids:
+            return np.zeros(0, dtype=np.intp)
+        docs = np.concatenate(
+            [self.postings[self.indptr[t] : self.indptr[t + 1]] for t in term_ids]
+        )
+        weights = np.concatenate(
+            [
+                self.weights[self.indptr[t] : self.indptr[t + 1]] * self.idf[t]
+                for t in term_ids
+            ]
+        )
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        return candidates[top_k(scores, k)]
+
+    def search(
+        self,
+        query: str,
+        embedding: Sequence[float],
+        k: int,
+        c: int = RRF_CONSTANT,
+        group_size: Optional[int] = None,
+        group_by: str = "source",
+    ) -> List[Document]:
+        """Hybrid dense and BM25 search fused with RRF, like the Milvus retriever.
+
+        Returns up to `k` groups of at most `group_size` chunks with the same
+        `group_by` metadata. The fused score is kept in `metadata["score"]`.
+        """
+        depth = k * (group_size or 1)
+        scores: Dict[int, float] = {}
+        for ranking in (
+            self.dense_search(embedding, depth),
+            self.bm25_search(query, depth),
+        ):
+            for rank, doc in enumerate(ranking.tolist(), start=1):
+                scores[doc] = scores.get(doc, 0.0) + 1 / (rank + c)
+
+        docs, group_counts = [], Counter()
+        for doc in sorted(scores, key=scores.get, reverse=True):
+            metadata = self.metadatas[doc]
+            group = metadata.get(group_by)
+            if group_size is not None:
+                if group_counts[group] >= group_size or (
+                    group not in group_counts and len(group_counts) >= k
+                ):
+                    continue
+                group_counts[group] += 1
+            elif len(docs) >= k:
+                break
+            docs.append(
+                Document(
+                    page_content=self.texts[doc],
+                    metadata={**metadata, "score": scores[doc]},
+                )
+            )
+        return docs
+
+
+class LocalIndexRetriever(BaseRetriever):
+    """Retriever of a `LocalIndex` with the search parameters of the Milvus retriever."""
+
+    index: Any
+    embeddings: Any
+    k: int = 20
+    c: int = RRF_CONSTANT
+    group_size: Optional[int] = None
+
+    def _search(self, query: str, embedding: List[float]) -> List[Document]:
+        return self.index.search(
+            query, embedding, k=self.k, c=self.c, group_size=self.group_size
+        )
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        return self._search(query, self.embeddings.embed_query(query))
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager
+    ) -> List[Document]:
+        embedding = await self.embeddings.aembed_query(query)
+        # The search is CPU-bound, keep the event loop free for other requests
+        return await asyncio.to_thread(self._search, query, embedding)
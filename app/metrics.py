@@ -0,0 +1,320 @@
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import Runnable, RunnableConfig
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], **extra) -> str:
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for _, value in pairs
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped))
+        + "}"
+    )
+
+
+class Registry:
+    """Metrics rendered together, with unique names."""
+
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric"):
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Duplicate metric name: {metric.name}")
+            self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self.metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        registry: Optional[Registry] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines of the metric in the Prometheus text format."""
+
+    def render(self) -> str:
+        return "\n".join(
+            [
+                f"# HELP {self.name} {self.documentation}",
+                f"# TYPE {self.name} {self.type}",
+                *self.samples(),
+            ]
+        )
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        registry: Optional[Registry] = None,
+    ):
+        super().__init__(name, documentation, labels, registry)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labels, key)} {value}"
+                for key, value in sorted(self.values.items())
+            ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        registry: Optional[Registry] = None,
+    ):
+        super().__init__(name, documentation, labels, registry)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [
+                f"{self.name}{_format_labels(self.labels, key)} {value}"
+                for key, value in sorted(self.values.items())
+            ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+        registry: Optional[Registry] = None,
+    ):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = buckets
+        self.values: Dict[Tuple[str, ...], list] = {}  # (bucket counts, sum)
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def time(self, **labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, le=bound)
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Timer:
+    """Context manager observing the duration of its block in seconds."""
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started_at, **self.labels)
+
+
+NODE_DURATION = Histogram(
+    "qa_node_duration_seconds", "Duration of graph nodes.", ("node",)
+)
+NODE_ERRORS = Counter(
+    "qa_node_errors_total", "Exceptions raised by graph nodes.", ("node",)
+)
+RETRIEVER_DURATION = Histogram(
+    "qa_retriever_duration_seconds", "Duration of retrieval per source.", ("source",)
+)
+RETRIEVER_DOCUMENTS = Histogram(
+    "qa_retriever_documents",
+    "Documents returned per source.",
+    ("source",),
+    buckets=COUNT_BUCKETS,
+)
+RETRIEVER_FALLBACKS = Counter(
+    "qa_retriever_fallbacks_total",
+    "Failed retrievals answered by the empty fallback.",
+    ("source",),
+)
+RETRIEVER_DROPPED = Counter(
+    "qa_retriever_dropped_total",
+    "Sources left out of fusion, by reason (budget or error).",
+    ("source", "reason"),
+)
+CONTEXT_DOCUMENTS = Histogram(
+    "qa_context_documents",
+    "Documents in the generator context.",
+    buckets=COUNT_BUCKETS,
+)
+CONTEXT_CHARACTERS = Histogram(
+    "qa_context_characters",
+    "Characters of the formatted generator context.",
+    buckets=SIZE_BUCKETS,
+)
+GENERATOR_FALLBACKS = Counter(
+    "qa_generator_fallbacks_total",
+    "Generations answered by GENERATOR_FALLBACK.",
+    ("provider",),
+)
+CIRCUIT_STATE = Gauge(
+    "qa_circuit_state",
+    "State of circuit breakers: 0 closed, 1 half-open, 2 open.",
+    ("name",),
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "qa_circuit_transitions_total",
+    "State changes of circuit breakers by new state.",
+    ("name", "state"),
+)
+LLM_TOKENS = Counter("qa_llm_tokens_total", "LLM token usage.", ("provider", "type"))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+class MeteredRetriever(Runnable):
+    """Retriever wrapper recording the duration and document count of a source."""
+
+    def __init__(self, retriever: Runnable, source: str):
+        self.retriever = retriever
+        self.source = source
+
+    def _observe(self, docs: List[Document]) -> List[Document]:
+        RETRIEVER_DOCUMENTS.observe(len(docs), source=self.source)
+        return docs
+
+    def invoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        with RETRIEVER_DURATION.time(source=self.source):
+            docs = self.retriever.invoke(input, config, **kwargs)
+        return self._observe(docs)
+
+    async def ainvoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        with RETRIEVER_DURATION.time(source=self.source):
+            docs = await self.retriever.ainvoke(input, config, **kwargs)
+        return self._observe(docs)
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """Count the prompt and completion tokens of a chat model."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                if usage:
+                    LLM_TOKENS.inc(
+                        usage.get("input_tokens", 0),
+                        provider=self.provider,
+                        type="prompt",
+                    )
+                    LLM_TOKENS.inc(
+                        usage.get("output_tokens", 0),
+                        provider=self.provider,
+                        type="completion",
+                    )
+
+
+def timed_node(node: str):
+    """Decorate an async graph node to record its duration and errors."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            try:
+                with NODE_DURATION.time(node=node):
+                    return await function(*args, **kwargs)
+            except Exception:
+                NODE_ERRORS.inc(node=node)
+                raise
+
+        return wrapper
+
+    return decorator
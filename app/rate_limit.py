@@ -0,0 +1,136 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableConfig
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+
+class TokenBucket:
+    """Token bucket rate limiter shared by threads and event loops.
+
+    Tokens may go negative: every caller reserves its tokens immediately and
+    waits until they are refilled, so callers are served in arrival order.
+    """
+
+    def __init__(self, rate: float, burst: float, name: str = ""):
+        self.rate = rate
+        self.burst = burst
+        self.name = name
+        self.queue_depth = 0
+        self.acquired = 0
+        self.total_wait = 0.0  # seconds
+        self.max_wait = 0.0  # seconds
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            self._tokens -= tokens
+            wait = max(-self._tokens / self.rate, 0.0)
+            self.acquired += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait > 0:
+                self.queue_depth += 1
+            return wait
+
+    def _release(self, wait: float):
+        if wait > 0:
+            with self._lock:
+                self.queue_depth -= 1
+
+    def _refund(self, tokens: float):
+        with self._lock:
+            self._tokens += tokens
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Wait until `tokens` are available and return the time waited."""
+        wait = self._reserve(tokens)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self._refund(tokens)
+            raise
+        finally:
+            self._release(wait)
+        return wait
+
+    def acquire_sync(self, tokens: float = 1) -> float:
+        wait = self._reserve(tokens)
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            self._release(wait)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "acquired": self.acquired,
+            "average_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+_rate_limiters: Dict[str, Optional[TokenBucket]] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(source: str, default_rate: float = 0) -> Optional[TokenBucket]:
+    """Get the process-wide rate limiter of a source.
+
+    Configured with `<SOURCE>_RATE_LIMIT` (requests per second, 0 to disable,
+    defaults to `default_rate`) and `<SOURCE>_RATE_BURST` (defaults to the rate,
+    at least 1).
+    """
+    with _rate_limiters_lock:
+        if source not in _rate_limiters:
+            rate = float(os.getenv(f"{source.upper()}_RATE_LIMIT", default_rate))
+            burst = float(os.getenv(f"{source.upper()}_RATE_BURST", max(rate, 1)))
+            _rate_limiters[source] = (
+                TokenBucket(rate, burst, name=source) if rate > 0 else None
+            )
+        return _rate_limiters[source]
+
+
+class RateLimitedRetriever(Runnable):
+    """Retriever wrapper that acquires `tokens` from a rate limiter per call."""
+
+    def __init__(self, retriever: Runnable, limiter: TokenBucket, tokens: float = 1):
+        self.retriever = retriever
+        self.limiter = limiter
+        self.tokens = tokens
+
+    def _log_wait(self, wait: float):
+        if wait > 0:
+            logger.info(
+                f"Rate limited {self.limiter.name} for {wait:.3f}s: {self.limiter.stats()}"
+            )
+
+    def invoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        self._log_wait(self.limiter.acquire_sync(self.tokens))
+        return self.retriever.invoke(input, config, **kwargs)
+
+    async def ainvoke(
+        self, input: str, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> List[Document]:
+        self._log_wait(await self.limiter.acquire(self.tokens))
+        return await self.retriever.ainvoke(input, config, **kwargs)
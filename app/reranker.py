@@ -0,0 +1,96 @@
+import asyncio
+import os
+import threading
+import time
+from typing import List, Optional
+
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+
+class Reranker:
+    """Local cross-encoder reranker for retrieved documents.
+
+    All (question, passage) pairs of a request are scored in one batch on CPU.
+    Reranking is skipped, keeping the fused order, when too many requests are
+    already reranking or when scoring exceeds the latency budget.
+    """
+
+    def __init__(self):
+        from sentence_transformers import CrossEncoder  # loads torch, import lazily
+
+        self.max_candidates = int(os.getenv("RERANKER_MAX_CANDIDATES", "20"))
+        self.budget = float(os.getenv("RERANKER_BUDGET", "1.0"))  # seconds
+        self.max_in_flight = int(os.getenv("RERANKER_MAX_IN_FLIGHT", "2"))
+        self.model = CrossEncoder(
+            os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            max_length=int(os.getenv("RERANKER_MAX_LENGTH", "256")),  # tokens
+            device="cpu",
+        )
+        self.in_flight = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _release(self, job: dict):
+        with self._lock:
+            if not job["released"]:
+                job["released"] = True
+                self.in_flight -= 1
+
+    def _predict(self, pairs: List[List[str]], job: dict) -> Optional[List[float]]:
+        with self._lock:
+            if job["released"]:  # timed out before a thread picked it up
+                return None
+            job["started"] = True
+        try:
+            started_at = time.perf_counter()
+            scores = self.model.predict(pairs, batch_size=len(pairs))
+            logger.info(
+                f"Reranked {len(pairs)} documents in {time.perf_counter() - started_at:.3f}s"
+            )
+            return scores
+        finally:
+            self._release(job)
+
+    async def arerank(self, question: str, docs: List[Document]) -> List[Document]:
+        """Order the top `max_candidates` documents by cross-encoder score.
+
+        Documents beyond the candidate cap keep their order after the reranked
+        ones. On load or timeout the documents are returned unchanged.
+        """
+        candidates = docs[: self.max_candidates]
+        if len(candidates) < 2:
+            return docs
+        with self._lock:
+            overloaded = self.in_flight >= self.max_in_flight
+            if not overloaded:
+                self.in_flight += 1
+        if overloaded:
+            self.skipped += 1
+            logger.warning("Reranking skipped: too many requests in flight")
+            return docs
+
+        # The slot is released when the prediction thread ends, or here if the
+        # job never started, e.g. it timed out while queued in a busy executor
+        job = {"started": False, "released": False}
+        pairs = [[question, doc.page_content] for doc in candidates]
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.to_thread(self._predict, pairs, job), timeout=self.budget
+            )
+        except asyncio.TimeoutError:
+            self.skipped += 1
+            logger.warning(f"Reranking skipped: exceeded {self.budget}s budget")
+            return docs
+        finally:
+            with self._lock:
+                started = job["started"]
+            if not started:
+                self._release(job)
+
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+        return [candidates[i] for i in order] + docs[self.max_candidates :]
@@ -1,22 +1,97 @@
+import asyncio
 import os
+from datetime import date
 from typing import List
+from xml.etree import ElementTree
 
+import httpx
+import xmltodict
+from app.cache import CachedRetriever, InMemoryCacheStore, SQLiteCacheStore
+from app.circuit_breaker import (
+    CircuitBreakerRunnable,
+    CircuitCheckRunnable,
+    get_circuit_breaker,
+)
+from app.embeddings import get_dense_embeddings
+from app.ensemble import FusionRetriever, get_source_weights
+from app.http_client import get_async_client
+from app.local_index import LocalIndex, LocalIndexRetriever
+from app.metrics import RETRIEVER_FALLBACKS, MeteredRetriever
+from app.rate_limit import RateLimitedRetriever, get_rate_limiter
 from app.utils import RRF_CONSTANT, get_bool_env, setup_logger
 from dotenv import load_dotenv
-from langchain.retrievers import EnsembleRetriever
 from langchain.schema import Document
 from langchain_community.retrievers import ArxivRetriever, PubMedRetriever
 from langchain_community.retrievers.tavily_search_api import (
     SearchDepth,
     TavilySearchAPIRetriever,
 )
-from langchain_core.runnables import RunnableLambda
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.vectorstores import VectorStoreRetriever
 from langchain_milvus import BM25BuiltInFunction, Milvus
 
 logger = setup_logger(__name__)
 load_dotenv()
 
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ATOM = "{http://www.w3.org/2005/Atom}"
+REQUESTS_PER_CALL = {"pubmed": 2}  # ESearch + batched EFetch
+GROUP_SIZE = 5  # chunks per PDF source in the hybrid search results
+DEFAULT_CACHE_TTL = {  # seconds
+    "local_index": "3600",
+    "milvus": "3600",
+    "tavily": "900",
+    "arxiv": "604800",
+    "pubmed": "604800",
+}
+
+
+class ScoredMilvusRetriever(VectorStoreRetriever):
+    """Milvus retriever which keeps the hybrid search score in `metadata["score"]`."""
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        results = self.vectorstore.similarity_search_with_score(
+            query, **self.search_kwargs
+        )
+        return self.__with_scores(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager
+    ) -> List[Document]:
+        results = await self.vectorstore.asimilarity_search_with_score(
+            query, **self.search_kwargs
+        )
+        return self.__with_scores(results)
+
+    def __with_scores(self, results: list) -> List[Document]:
+        for doc, score in results:
+            doc.metadata["score"] = score
+        return [doc for doc, _ in results]
+
+
+class TieredTavilySearchAPIRetriever(TavilySearchAPIRetriever):
+    """Tavily retriever which tries BASIC search depth before ADVANCED.
+
+    ADVANCED search costs more credits and latency, so it is only used when
+    BASIC search returns nothing with a relevance score of at least `min_score`.
+    """
+
+    min_score: float = 0.5
+
+    def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
+        basic = self.model_copy(update={"search_depth": SearchDepth.BASIC})
+        docs = TavilySearchAPIRetriever._get_relevant_documents(
+            basic, query, run_manager=run_manager
+        )
+        top_score = max((doc.metadata.get("score") or 0 for doc in docs), default=0)
+        if top_score >= self.min_score:
+            return docs
+        logger.info(f"Escalating Tavily search to ADVANCED (top score {top_score})")
+        advanced = self.model_copy(update={"search_depth": SearchDepth.ADVANCED})
+        return TavilySearchAPIRetriever._get_relevant_documents(
+            advanced, query, run_manager=run_manager
+        )
+
 
 class CustomArxivRetriever(ArxivRetriever):
     def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
@@ -25,6 +100,46 @@ class CustomArxivRetriever(ArxivRetriever):
             doc.metadata["source"] = doc.metadata.pop("Entry ID")
         return docs
 
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager
+    ) -> List[Document]:
+        if self.get_full_documents:  # PDF loading is only available synchronously
+            return await super()._aget_relevant_documents(
+                query, run_manager=run_manager
+            )
+
+        if self.is_arxiv_identifier(query):
+            params = {"id_list": ",".join(query.split())}
+        else:
+            params = {"search_query": query[: self.ARXIV_MAX_QUERY_LENGTH]}
+        params |= {
+            "max_results": self.top_k_results,
+            "sortBy": "relevance",
+            "sortOrder": "descending",
+        }
+        response = await get_async_client().get(ARXIV_API_URL, params=params)
+        response.raise_for_status()
+
+        docs = []
+        for entry in ElementTree.fromstring(response.text).iter(f"{ATOM}entry"):
+            docs.append(
+                Document(
+                    page_content=entry.findtext(f"{ATOM}summary", "").strip(),
+                    metadata={
+                        "source": entry.findtext(f"{ATOM}id", ""),
+                        "Published": date.fromisoformat(
+                            entry.findtext(f"{ATOM}updated", "")[:10]
+                        ),
+                        "Title": entry.findtext(f"{ATOM}title", "").strip(),
+                        "Authors": ", ".join(
+                            author.findtext(f"{ATOM}name", "")
+                            for author in entry.iter(f"{ATOM}author")
+                        ),
+                    },
+                )
+            )
+        return docs
+
 
 class CustomPubMedRetriever(PubMedRetriever):
     def _get_relevant_documents(self, query: str, *, run_manager) -> List[Document]:
@@ -35,18 +150,100 @@ class CustomPubMedRetriever(PubMedRetriever):
             )
         return docs
 
+    async def _aget(self, url: str, params: dict) -> httpx.Response:
+        if self.api_key:
+            params["api_key"] = self.api_key
+        sleep_time = self.sleep_time
+        for retry in range(self.max_retry + 1):
+            response = await get_async_client().get(url, params=params)
+            if response.status_code != 429 or retry == self.max_retry:
+                break
+            await asyncio.sleep(sleep_time)  # Too Many Requests, back off
+            sleep_time *= 2
+        response.raise_for_status()
+        return response
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager
+    ) -> List[Document]:
+        search = await self._aget(
+            self.base_url_esearch,
+            {
+                "db": "pubmed",
+                "term": query,
+                "retmode": "json",
+                "retmax": self.top_k_results,
+            },
+        )
+        uids = search.json()["esearchresult"]["idlist"]
+        if not uids:
+            return []
+
+        # Fetch all articles in a single EFetch request instead of one per article
+        fetch = await self._aget(
+            self.base_url_efetch,
+            {"db": "pubmed", "retmode": "xml", "id": ",".join(uids)},
+        )
+        article_set = (
+            xmltodict.parse(
+                fetch.text, force_list=("PubmedArticle", "PubmedBookArticle")
+            ).get("PubmedArticleSet")
+            or {}
+        )
+        articles = {}
+        for article_type, citation_key in (
+            ("PubmedArticle", "MedlineCitation"),
+            ("PubmedBookArticle", "BookDocument"),
+        ):
+            for article in article_set.get(article_type, []):
+                pmid = article[citation_key]["PMID"]
+                uid = pmid["#text"] if isinstance(pmid, dict) else pmid
+                articles[uid] = self._parse_article(
+                    uid, {"PubmedArticleSet": {article_type: article}}
+                )
+
+        docs = []
+        for uid in uids:  # keep the ESearch relevance order
+            if uid in articles:
+                doc = self._dict2document(articles[uid])
+                doc.metadata["source"] = (
+                    f"https://pubmed.ncbi.nlm.nih.gov/{doc.metadata.pop("uid")}"
+                )
+                docs.append(doc)
+        return docs
+
 
 class Retriever:
     def __init__(
         self,
     ):
         retrievers = []
+        sources = []
         self.top_k = int(os.getenv("TOP_K", "20"))
-        if get_bool_env("MILVUS_ENABLE"):
+        self.adaptive_routing = get_bool_env("ADAPTIVE_ROUTING_ENABLE", False)
+        self.cache_store = (
+            self.__setup_cache_store()
+            if get_bool_env("RETRIEVAL_CACHE_ENABLE", False)
+            else None
+        )
+        # The in-process index replaces Milvus for the PDF corpus
+        if get_bool_env("LOCAL_INDEX_ENABLE", False):
+            self.local_index = self.__wrap(
+                "local_index",
+                LocalIndexRetriever(
+                    index=LocalIndex(os.getenv("LOCAL_INDEX_PATH", "data/local_index")),
+                    embeddings=get_dense_embeddings(),
+                    k=self.top_k,
+                    c=RRF_CONSTANT,
+                    group_size=GROUP_SIZE,
+                    tags=["local_index"],
+                ),
+            ).with_fallbacks(self.__retriever_fallback("local_index"))
+            retrievers.append(self.local_index)
+            sources.append("local_index")
+        elif get_bool_env("MILVUS_ENABLE"):
             milvus_client = Milvus(
-                embedding_function=[
-                    HuggingFaceEmbeddings(model_name=os.getenv("DENSE_MODEL"))
-                ],
+                embedding_function=[get_dense_embeddings()],
                 collection_name=os.getenv("MILVUS_COLLECTION", "pdf"),
                 connection_args={
                     "uri": os.getenv("MILVUS_URI"),
@@ -69,55 +266,178 @@ class Retriever:
                 ),
             )
 
-            self.milvus = milvus_client.as_retriever(
-                search_kwargs={
-                    "k": self.top_k,
-                    "ranker_type": "rrf",
-                    "ranker_params": {"k": RRF_CONSTANT},
-                    "group_by_field": "source",
-                    "group_size": 5,
-                },
-                tags=["milvus"],
-            ).with_fallbacks(self.__retriever_fallback())
+            search_kwargs = {
+                "k": self.top_k,
+                "ranker_type": "rrf",
+                "ranker_params": {"k": RRF_CONSTANT},
+                "group_by_field": "source",
+                "group_size": GROUP_SIZE,
+            }
+            # Adaptive routing decides on the hybrid search scores
+            milvus_retriever = (
+                ScoredMilvusRetriever(
+                    vectorstore=milvus_client,
+                    search_kwargs=search_kwargs,
+                    tags=["milvus"],
+                )
+                if self.adaptive_routing
+                else milvus_client.as_retriever(
+                    search_kwargs=search_kwargs, tags=["milvus"]
+                )
+            )
+            self.milvus = self.__wrap("milvus", milvus_retriever).with_fallbacks(
+                self.__retriever_fallback("milvus")
+            )
             retrievers.append(self.milvus)
+            sources.append("milvus")
 
         if get_bool_env("TAVILY_ENABLE"):
-            self.tavily = TavilySearchAPIRetriever(
-                k=self.top_k,
-                search_depth=SearchDepth.ADVANCED,
-                tags=["tavily"],
-            ).with_fallbacks(self.__retriever_fallback())
+            self.tavily = self.__wrap(
+                "tavily",
+                (
+                    TieredTavilySearchAPIRetriever(
+                        k=self.top_k,
+                        min_score=float(os.getenv("TAVILY_ADVANCED_MIN_SCORE", "0.5")),
+                        tags=["tavily"],
+                    )
+                    if get_bool_env("TAVILY_TIERED_ENABLE", False)
+                    else TavilySearchAPIRetriever(
+                        k=self.top_k,
+                        search_depth=SearchDepth.ADVANCED,
+                        tags=["tavily"],
+                    )
+                ),
+            ).with_fallbacks(self.__retriever_fallback("tavily"))
             retrievers.append(self.tavily)
+            sources.append("tavily")
 
         if get_bool_env("ARXIV_ENABLE"):
-            self.arxiv = CustomArxivRetriever(
-                load_max_docs=self.top_k,
-                get_full_documents=False,
-                tags=["arxiv"],
-            ).with_fallbacks(self.__retriever_fallback())
+            self.arxiv = self.__wrap(
+                "arxiv",
+                CustomArxivRetriever(
+                    load_max_docs=self.top_k,
+                    get_full_documents=False,
+                    tags=["arxiv"],
+                ),
+            ).with_fallbacks(self.__retriever_fallback("arxiv"))
             retrievers.append(self.arxiv)
+            sources.append("arxiv")
 
         if get_bool_env("PUBMED_ENABLE"):
-            self.pubmed = CustomPubMedRetriever(
-                api_key=os.getenv("PUBMED_API_KEY"),
-                top_k_results=self.top_k,
-                sleep_time=0.5,
-                tags=["pubmed"],
-            ).with_fallbacks(self.__retriever_fallback())
+            self.pubmed = self.__wrap(
+                "pubmed",
+                CustomPubMedRetriever(
+                    api_key=os.getenv("PUBMED_API_KEY"),
+                    top_k_results=self.top_k,
+                    sleep_time=0.5,
+                    tags=["pubmed"],
+                ),
+            ).with_fallbacks(self.__retriever_fallback("pubmed"))
             retrievers.append(self.pubmed)
+            sources.append("pubmed")
 
-        self.retriever = self.__setup_ensemble_retriever(retrievers)
+        self.retriever = self.__setup_ensemble_retriever(retrievers, sources)
+
+        # With adaptive routing, the PDF corpus is queried first and the web
+        # sources only when its results are not confident enough (see app.routing)
+        self.local_retriever = None
+        self.local_source = None
+        self.web_retriever = None
+        if (
+            self.adaptive_routing
+            and sources
+            and sources[0] in ("local_index", "milvus")
+        ):
+            self.local_retriever = retrievers[0]
+            self.local_source = sources[0]
+            if len(sources) > 1:
+                self.web_retriever = self.__setup_ensemble_retriever(
+                    retrievers[1:], sources[1:]
+                )
+        elif self.adaptive_routing:
+            logger.warning(
+                "Adaptive routing requires Milvus or the local index, querying all sources"
+            )
 
-    def __setup_ensemble_retriever(self, retrievers: list):
-        return EnsembleRetriever(
+    def __setup_cache_store(self):
+        max_entries = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "4096"))
+        backend = os.getenv("RETRIEVAL_CACHE_BACKEND", "memory").lower()
+        match backend:
+            case "memory":
+                return InMemoryCacheStore(max_entries=max_entries)
+            case "sqlite":
+                return SQLiteCacheStore(
+                    path=os.getenv("RETRIEVAL_CACHE_PATH", ".cache/retrieval.sqlite"),
+                    max_entries=max_entries,
+                    table="retrieval_cache",
+                )
+            case _:
+                raise ValueError(f"Unsupported retrieval cache backend: {backend}")
+
+    def __wrap(self, source: str, retriever: Runnable) -> Runnable:
+        """Wrap a source retriever with its rate limiter, circuit breaker, cache and metrics.
+
+        The rate limiter sits inside the cache, so cache hits cost no tokens. The
+        circuit breaker guards the call inside the rate limiter, so its slow call
+        timer does not count the wait for tokens, and an open circuit is checked
+        before the rate limiter, so rejected calls do not wait for tokens either.
+        """
+        breaker = (
+            get_circuit_breaker(source)
+            if get_bool_env("CIRCUIT_BREAKER_ENABLE", False)
+            else None
+        )
+        if breaker is not None:
+            retriever = CircuitBreakerRunnable(retriever, breaker)
+        limiter = get_rate_limiter(source)
+        if limiter is not None:
+            retriever = RateLimitedRetriever(
+                retriever, limiter, tokens=REQUESTS_PER_CALL.get(source, 1)
+            )
+            if breaker is not None:
+                retriever = CircuitCheckRunnable(retriever, breaker)
+        return MeteredRetriever(self.__with_cache(source, retriever), source)
+
+    def __with_cache(self, source: str, retriever: Runnable) -> Runnable:
+        """Wrap a source retriever with the result cache, if enabled.
+
+        Web results change quickly while papers rarely do, so each source has its
+        own TTL (`<SOURCE>_CACHE_TTL`, in seconds).
+        """
+        if self.cache_store is None:
+            return retriever
+        return CachedRetriever(
+            retriever=retriever,
+            source=source,
+            top_k=self.top_k,
+            ttl=float(
+                os.getenv(f"{source.upper()}_CACHE_TTL", DEFAULT_CACHE_TTL[source])
+            ),
+            store=self.cache_store,
+        )
+
+    def __setup_ensemble_retriever(self, retrievers: list, sources: list):
+        budget = float(os.getenv("RETRIEVAL_BUDGET", "0"))  # seconds, 0 = no deadline
+        return FusionRetriever(
             retrievers=retrievers,
+            sources=sources,
+            weights=get_source_weights(sources),
+            budget=budget if budget > 0 else None,
+            source_budgets={
+                source: float(os.getenv(f"{source.upper()}_RETRIEVAL_BUDGET"))
+                for source in sources
+                if os.getenv(f"{source.upper()}_RETRIEVAL_BUDGET")
+            },
             c=RRF_CONSTANT,
-            id_key="source",
             tags=["ensemble"],
         )
 
     def __call__(self):
         return self.retriever
 
-    def __retriever_fallback(self):
-        return [RunnableLambda(lambda x: [])]
+    def __retriever_fallback(self, source: str):
+        def fallback(x):
+            RETRIEVER_FALLBACKS.inc(source=source)
+            return []
+
+        return [RunnableLambda(fallback)]
@@ -0,0 +1,103 @@
+import os
+import threading
+from typing import List, Optional
+
+from app.local_index import tokenize
+from app.utils import NUMBER_OF_CONTEXT_DOCS, RRF_CONSTANT, setup_logger
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+HYBRID_FIELDS = 2  # dense and sparse (BM25) vector fields of the Milvus search
+# Question words, on top of the stop words of the BM25 analyzer
+QUESTION_WORDS = frozenset(
+    "can could did do does how should what when where which who whom whose why "
+    "would".split()
+)
+
+
+def query_terms(text: str) -> set:
+    """Terms of a text as matched by the BM25 search, without question words."""
+    return {term for term in tokenize(text) if term not in QUESTION_WORDS}
+
+
+def normalized_rrf_score(score: Optional[float], c: int = RRF_CONSTANT) -> float:
+    """Scale a Milvus hybrid RRF score to [0, 1], where 1 is the top rank in all fields."""
+    if score is None:
+        return 0.0
+    return score * (c + 1) / HYBRID_FIELDS
+
+
+class AdaptiveRouter:
+    """Decide whether web sources are needed on top of the local corpus.
+
+    Web sources are skipped when the local results are confident: enough
+    documents, a top hybrid score ranked highly by both dense and BM25 search,
+    and context documents covering the terms of the question.
+    """
+
+    def __init__(self):
+        self.min_docs = int(os.getenv("ADAPTIVE_MIN_DOCS", str(NUMBER_OF_CONTEXT_DOCS)))
+        self.min_score = float(os.getenv("ADAPTIVE_MIN_SCORE", "0.9"))
+        self.min_coverage = float(os.getenv("ADAPTIVE_MIN_COVERAGE", "0.6"))
+        self.fan_outs = 0
+        self.skips = 0
+        self.latency_saved = 0.0  # seconds, estimated from the web latency
+        self.web_latency: Optional[float] = None  # moving average in seconds
+        self._lock = threading.Lock()
+
+    def signals(self, question: str, docs: List[Document]) -> dict:
+        terms = query_terms(question)
+        context_terms = set().union(
+            *(query_terms(doc.page_content) for doc in docs[:NUMBER_OF_CONTEXT_DOCS])
+        )
+        return {
+            "docs": len(docs),
+            "top_score": max(
+                (normalized_rrf_score(doc.metadata.get("score")) for doc in docs),
+                default=0.0,
+            ),
+            "coverage": len(terms & context_terms) / len(terms) if terms else 1.0,
+        }
+
+    def needs_web(self, question: str, docs: List[Document]) -> bool:
+        """Return whether to fan out to the web sources, logging the decision."""
+        signals = self.signals(question, docs)
+        needs_web = (
+            signals["docs"] < self.min_docs
+            or signals["top_score"] < self.min_score
+            or signals["coverage"] < self.min_coverage
+        )
+        with self._lock:
+            if needs_web:
+                self.fan_outs += 1
+            else:
+                self.skips += 1
+                self.latency_saved += self.web_latency or 0.0
+        if needs_web:
+            logger.info(f"Routing to web sources: {signals}")
+        else:
+            saved = f"{self.web_latency:.3f}s" if self.web_latency else "n/a"
+            logger.info(
+                f"Skipping web sources, estimated latency saved: {saved} ({signals})"
+            )
+        return needs_web
+
+    def record_web_latency(self, duration: float, weight: float = 0.2):
+        with self._lock:
+            self.web_latency = (
+                duration
+                if self.web_latency is None
+                else (1 - weight) * self.web_latency + weight * duration
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "fan_outs": self.fan_outs,
+                "skips": self.skips,
+                "latency_saved": self.latency_saved,
+                "web_latency": self.web_latency,
+            }
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from app.cache import normalize_text
+from app.utils import setup_logger
+from langchain_core.runnables import RunnableConfig
+
+logger = setup_logger(__name__)
+
+T = TypeVar("T")
+
+# Per-run identifiers which do not change the result of a graph run
+RUN_SPECIFIC_CONFIG_KEYS = (
+    "thread_id",
+    "run_id",
+    "assistant_id",
+    "graph_id",
+    "user_id",
+)
+RUN_SPECIFIC_CONFIG_PREFIXES = ("__", "checkpoint_", "langgraph_", "x-")
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight execution between concurrent calls with the same key.
+
+    The execution runs in its own task. A cancelled caller only stops waiting;
+    the execution is cancelled once all of its callers are cancelled.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.executions = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def run(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        key = (id(asyncio.get_running_loop()), key)
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(function()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self._calls[key] = call
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            logger.info(f"Coalesced {self.name} call with {call.waiters} in flight")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done():  # this caller was cancelled
+                call.waiters -= 1
+                if call.waiters == 0:
+                    self._forget(key, call)
+                    call.task.cancel()
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
+
+
+def coalescing_key(
+    question: str, config: Optional[RunnableConfig] = None, *extra: Any
+) -> str:
+    """Key of a graph run from its normalized question and relevant config."""
+    configurable = {
+        k: v
+        for k, v in ((config or {}).get("configurable") or {}).items()
+        if k not in RUN_SPECIFIC_CONFIG_KEYS
+        and not k.startswith(RUN_SPECIFIC_CONFIG_PREFIXES)
+    }
+    return json.dumps(
+        [normalize_text(question), configurable, *extra], sort_keys=True, default=str
+    )
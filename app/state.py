@@ -1,4 +1,5 @@
-from typing import List, Optional
+import operator
+from typing import List, Optional, Tuple
 
 from langchain_core.documents import Document
 from typing_extensions import Annotated, TypedDict
@@ -36,6 +37,24 @@ class AdditionalSource(TypedDict):
     ]
 
 
+class CitationReference(TypedDict):
+    """A reference to the context document used to justify the answer."""
+
+    index: Annotated[
+        int, ..., "The Index of the context document which justifies the answer."
+    ]
+    start: Annotated[
+        Optional[int],
+        None,
+        "Character offset in the Information of the document where the snippet which justifies the answer starts.",
+    ]
+    end: Annotated[
+        Optional[int],
+        None,
+        "Character offset in the Information of the document where the snippet which justifies the answer ends.",
+    ]
+
+
 class InputState(TypedDict):
     """Input state for graph"""
 
@@ -97,3 +116,57 @@ class OutputState(TypedDict):
         [],
         "The list of URLs of the sources which are NOT USED to justify the answer but exist in the given context.",
     ]
+
+
+class CompactOutputState(TypedDict):
+    """Compact output schema for LLM. Citations only refer to the context documents, which are resolved to OutputState after generation to save completion tokens in LLM."""
+
+    answer: Annotated[
+        str,
+        ...,
+        "The answer to the user question, which is based only on the given context. If the given context is insufficient, the answer should explain that the context is insufficient.",
+    ]
+    citations: Annotated[
+        Optional[List[CitationReference]],
+        [],
+        "The list of references to the context documents used to justify the answer.",
+    ]
+
+
+class BatchInputState(TypedDict):
+    """Input state for batch graph"""
+
+    questions: Annotated[List[str], ..., "The questions asked by the user."]
+
+
+class BatchState(TypedDict):
+    """Overall state for batch graph"""
+
+    questions: Annotated[List[str], ..., "The questions asked by the user."]
+    representatives: Annotated[
+        List[int],
+        ...,
+        "For every question, the index of the question which is answered in its place.",
+    ]
+    answers: Annotated[List[Tuple[int, OutputState]], operator.add]
+    results: Annotated[
+        List[OutputState], ..., "The outputs of the questions in input order."
+    ]
+    answered_questions: Annotated[
+        List[str],
+        ...,
+        "For every question, the question whose output is returned in its place.",
+    ]
+
+
+class BatchOutputState(TypedDict):
+    """Output state for batch graph"""
+
+    results: Annotated[
+        List[OutputState], ..., "The outputs of the questions in input order."
+    ]
+    answered_questions: Annotated[
+        List[str],
+        ...,
+        "For every question, the question whose output is returned in its place.",
+    ]
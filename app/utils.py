@@ -1,6 +1,10 @@
+import asyncio
 import logging
 import os
 import sys
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
 
 from app.state import AdditionalSource
 from dotenv import load_dotenv
@@ -8,12 +12,17 @@ from langchain_core.documents import Document
 
 load_dotenv()
 
+T = TypeVar("T")
+
 TIMEOUT = 60  # seconds
 MAX_RETRY = 3
 RRF_CONSTANT = int(os.getenv("RRF_CONSTANT", "60"))
 NUMBER_OF_CONTEXT_DOCS = int(
     os.getenv("NUMBER_OF_CONTEXT_DOCS", "5")
 )  # number of context documents to be used in the prompt
+DEDUP_THRESHOLD = float(
+    os.getenv("DEDUP_THRESHOLD", "0.95")
+)  # minimum SimHash similarity of near-duplicate documents
 TEMPERATURE = float(
     os.getenv("TEMPERATURE", "0.0")
 )  # 0.0 (deterministic) - 1.0 (random)
@@ -37,6 +46,9 @@ def setup_logger(name=__name__):
     return logger
 
 
+logger = setup_logger(__name__)
+
+
 def convert_document_to_additional_source(doc: Document) -> AdditionalSource:
     """Convert a Document to an Additional Source."""
     return {
@@ -60,3 +72,39 @@ def get_bool_env(key: str, default: bool = True) -> bool:
     if value is None:
         return default
     return value.lower() in ("true", "1", "yes", "y")
+
+
+class LazyComponent(Generic[T]):
+    """Thread-safe, lazily constructed component.
+
+    The factory runs once, on the first call to `get`, so importing a module
+    that declares expensive components (models, clients) stays cheap.
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        self.factory = factory
+        self.name = name
+        self.init_duration: Optional[float] = None  # seconds
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    started_at = time.perf_counter()
+                    instance = self.factory()
+                    self.init_duration = time.perf_counter() - started_at
+                    self._instance = instance
+                    logger.info(f"Initialized {self.name} in {self.init_duration:.3f}s")
+        return self._instance
+
+    async def aget(self) -> T:
+        """Like `get`, but constructs the component off the event loop."""
+        if self._instance is not None:
+            return self._instance
+        return await asyncio.to_thread(self.get)
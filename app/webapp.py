@@ -0,0 +1,14 @@
+from app.metrics import render
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+# Custom routes served by langgraph-api next to the graph (see langgraph.json)
+
+
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(routes=[Route("/metrics", metrics)])
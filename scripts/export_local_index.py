@@ -0,0 +1,111 @@
+"""Export a Milvus collection to a local index for LOCAL_INDEX_ENABLE=true.
+
+Usage:
+    python -m scripts.export_local_index --output data/local_index
+
+Reads every chunk of MILVUS_COLLECTION with its text, metadata and dense
+embedding, builds the BM25 index of the same chunks and writes both to
+`--output` (see `app.local_index.LocalIndex`). With `--embed` the chunks are
+embedded again with DENSE_MODEL instead of copying the stored vectors. The
+search latency of the new index is measured on the evaluation questions.
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from app.embeddings import get_dense_embeddings
+from app.local_index import LocalIndex
+from app.retriever import GROUP_SIZE
+from app.utils import RRF_CONSTANT, setup_logger
+from dotenv import load_dotenv
+from pymilvus import MilvusClient
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+TEXT_FIELD = "text"
+DENSE_FIELD = "dense_vector"
+SPARSE_FIELD = "sparse_vector"  # output of the BM25 function, not stored
+
+
+def export_collection(client: MilvusClient, collection: str, batch_size: int):
+    fields = [f["name"] for f in client.describe_collection(collection)["fields"]]
+    output_fields = [f for f in fields if f != SPARSE_FIELD]
+    iterator = client.query_iterator(
+        collection_name=collection,
+        batch_size=batch_size,
+        filter="",
+        output_fields=output_fields,
+    )
+    texts, metadatas, vectors = [], [], []
+    while True:
+        batch = iterator.next()
+        if not batch:
+            iterator.close()
+            break
+        for row in batch:
+            texts.append(row.pop(TEXT_FIELD))
+            vectors.append(row.pop(DENSE_FIELD))
+            metadatas.append(row)
+        logger.info(f"Exported {len(texts)} chunks")
+    return texts, metadatas, np.array(vectors, dtype=np.float32)
+
+
+def measure_latency(index: LocalIndex, questions: list[str], k: int) -> dict:
+    embeddings = get_dense_embeddings()
+    durations = []
+    for question in questions:
+        embedding = embeddings.embed_query(question)
+        started_at = time.perf_counter()
+        index.search(question, embedding, k=k, c=RRF_CONSTANT, group_size=GROUP_SIZE)
+        durations.append(time.perf_counter() - started_at)
+    p50, p95 = np.percentile(durations, [50, 95]) if durations else (0.0, 0.0)
+    return {"questions": len(durations), "p50": float(p50), "p95": float(p95)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--output", default=os.getenv("LOCAL_INDEX_PATH", "data/local_index")
+    )
+    parser.add_argument("--collection", default=os.getenv("MILVUS_COLLECTION", "pdf"))
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--embed", action="store_true", help="embed the chunks with DENSE_MODEL"
+    )
+    parser.add_argument(
+        "--questions",
+        default=os.getenv(
+            "EVALUATION_DATASET_PATH", "tests/evaluation/dataset/vpp.json"
+        ),
+        help="questions to measure the search latency on",
+    )
+    args = parser.parse_args()
+
+    client = MilvusClient(uri=os.getenv("MILVUS_URI"), token=os.getenv("MILVUS_TOKEN"))
+    texts, metadatas, vectors = export_collection(
+        client, args.collection, args.batch_size
+    )
+    if args.embed:
+        vectors = np.array(get_dense_embeddings().embed_documents(texts))
+    index = LocalIndex.build(
+        args.output,
+        texts,
+        metadatas,
+        vectors,
+        collection=args.collection,
+        model=os.getenv("DENSE_MODEL"),
+    )
+    logger.info(f"Wrote {len(index)} chunks to {args.output}")
+
+    with open(args.questions, "r") as f:
+        questions = [q for group in json.load(f).values() for q in group]
+    k = int(os.getenv("TOP_K", "20"))
+    logger.info(f"Search latency: {json.dumps(measure_latency(index, questions, k))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Export DENSE_MODEL to an int8-quantized ONNX model for EMBEDDING_BACKEND=onnx.
+
+Usage:
+    python -m scripts.export_onnx --output models/all-mpnet-base-v2-onnx
+
+Requires `torch`, `transformers`, `onnx` and `onnxruntime`. After exporting,
+the embeddings are compared with the current HuggingFace backend and the
+script fails if they drift further than the given thresholds.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import torch
+from app.embeddings import OnnxEmbeddings, check_embedding_parity
+from app.utils import setup_logger
+from dotenv import load_dotenv
+from langchain_huggingface import HuggingFaceEmbeddings
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoModel, AutoTokenizer
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+
+def export(model_name: str, output: str, quantize: bool = True):
+    os.makedirs(output, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output)  # writes tokenizer.json
+    model = AutoModel.from_pretrained(model_name).eval()
+
+    sample = tokenizer(["Virtual power plant"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(output, "model.fp32.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    model_path = os.path.join(output, "model.onnx")
+    if quantize:
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, model_path)
+    logger.info(f"Exported {model_name} to {model_path}")
+
+
+def load_parity_texts(path: str) -> list[str]:
+    with open(path, "r") as f:
+        return [question for group in json.load(f).values() for question in group]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=os.getenv("DENSE_MODEL"))
+    parser.add_argument("--output", default=os.getenv("ONNX_MODEL_PATH"))
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument(
+        "--parity-dataset",
+        default=os.getenv(
+            "EVALUATION_DATASET_PATH", "tests/evaluation/dataset/vpp.json"
+        ),
+    )
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--min-neighbour-overlap", type=float, default=0.9)
+    args = parser.parse_args()
+
+    export(args.model, args.output, quantize=not args.no_quantize)
+
+    parity = check_embedding_parity(
+        HuggingFaceEmbeddings(model_name=args.model),
+        OnnxEmbeddings(args.output),
+        load_parity_texts(args.parity_dataset),
+    )
+    logger.info(f"Parity: {json.dumps(parity)}")
+    if (
+        parity["min_cosine"] < args.min_cosine
+        or parity["neighbour_overlap"] < args.min_neighbour_overlap
+    ):
+        logger.error("ONNX embeddings drift too far from the reference model")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Replay a question log against the graph to measure latency under load.
+
+Usage:
+    python -m scripts.replay requests.jsonl --target http://localhost:8123 --speed 2
+    python -m scripts.replay requests.jsonl --target inprocess --concurrency 16
+
+Each line of the log is a JSON object. The question is read from `question`,
+falling back to `body` and `title` as in `requests.jsonl`. An optional
+`timestamp` (ISO 8601 or epoch seconds) gives the original arrival time.
+
+In open-loop mode (default) requests are sent at their original times divided
+by `--speed`, or at `--rate` requests per second if the log has no timestamps,
+regardless of how fast they complete. With `--concurrency` the log is replayed
+in closed loop by that many concurrent clients instead. The target is either
+the in-process `graph` or the URL of the langgraph-api server (see
+compose.yaml). Latency per request, error and fallback rates are written as
+JSON, with the gap before the update of every node. The gap is measured
+client-side between consecutive stream updates, so it approximates the node
+duration only for nodes that run one after another.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from app.generator import GENERATOR_FALLBACK
+from app.utils import setup_logger
+from dotenv import load_dotenv
+
+logger = setup_logger(__name__)
+load_dotenv()
+
+ASSISTANT_ID = "qa-system-for-business-case"  # graph name in langgraph.json
+
+
+def parse_timestamp(value) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value).timestamp()
+
+
+def load_log(path: str) -> List[dict]:
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            records.append(
+                {
+                    "id": record.get("request_id") or record.get("id") or len(records),
+                    "question": record.get("question")
+                    or record.get("body")
+                    or record.get("title"),
+                    "timestamp": parse_timestamp(record.get("timestamp")),
+                }
+            )
+    return records
+
+
+def schedule(records: List[dict], speed: float, rate: float) -> List[float]:
+    """Offsets (seconds) at which the records are sent in open-loop mode."""
+    timestamps = [record["timestamp"] for record in records]
+    if all(timestamp is not None for timestamp in timestamps):
+        return [(timestamp - timestamps[0]) / speed for timestamp in timestamps]
+    return [i / (rate * speed) for i in range(len(records))]
+
+
+def summarize(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": len(values),
+        "mean": float(np.mean(values)),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(max(values)),
+    }
+
+
+class InProcessTarget:
+    """Run the graph of `app.graph` in this process."""
+
+    def __init__(self):
+        from app.graph import graph
+
+        self.graph = graph
+
+    async def stream(self, question: str) -> AsyncIterator[dict]:
+        async for update in self.graph.astream(
+            {"question": question}, stream_mode="updates"
+        ):
+            yield update
+
+    async def close(self):
+        pass
+
+
+class HttpTarget:
+    """Run the graph on a langgraph-api server as stateless runs."""
+
+    def __init__(self, url: str, assistant_id: str, timeout: float, connections: int):
+        self.url = url.rstrip("/")
+        self.assistant_id = assistant_id
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=connections, max_keepalive_connections=connections
+            ),
+        )
+
+    async def stream(self, question: str) -> AsyncIterator[dict]:
+        async with self.client.stream(
+            "POST",
+            f"{self.url}/runs/stream",
+            json={
+                "assistant_id": self.assistant_id,
+                "input": {"question": question},
+                "stream_mode": ["updates"],
+            },
+        ) as response:
+            response.raise_for_status()
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:") :].strip()
+                elif line.startswith("data:") and event in ("updates", "error"):
+                    data = json.loads(line[len("data:") :])
+                    if event == "error":
+                        raise RuntimeError(f"Run failed: {data}")
+                    yield data
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def replay_one(target, record: dict, scheduled_at: float, started: float) -> dict:
+    started_at = time.perf_counter()
+    result = {
+        "id": record["id"],
+        "schedule_lag": started_at - started - scheduled_at,
+        "node_gaps": {},  # seconds since the previous update
+        "error": None,
+        "fallback": False,
+    }
+    last_event_at = started_at
+    try:
+        async for update in target.stream(record["question"]):
+            now = time.perf_counter()
+            for node, output in (update or {}).items():
+                result["node_gaps"][node] = now - last_event_at
+                if isinstance(output, dict) and "answer" in output:
+                    result["fallback"] = (
+                        output["answer"] == GENERATOR_FALLBACK["answer"]
+                    )
+            last_event_at = now
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["latency"] = time.perf_counter() - started_at
+    return result
+
+
+async def replay(
+    target,
+    records: List[dict],
+    offsets: Optional[List[float]] = None,
+    concurrency: Optional[int] = None,
+) -> Tuple[List[dict], float]:
+    """Replay open loop at `offsets`, or closed loop with `concurrency` clients."""
+    started = time.perf_counter()
+    if concurrency:
+        queue = list(enumerate(records))
+        results = [None] * len(records)
+
+        async def client():
+            while queue:
+                i, record = queue.pop(0)
+                results[i] = await replay_one(target, record, 0.0, time.perf_counter())
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    else:
+
+        async def send(record: dict, offset: float) -> dict:
+            await asyncio.sleep(max(started + offset - time.perf_counter(), 0))
+            return await replay_one(target, record, offset, started)
+
+        results = await asyncio.gather(
+            *(send(record, offset) for record, offset in zip(records, offsets))
+        )
+    return results, time.perf_counter() - started
+
+
+def report(results: List[dict], duration: float) -> dict:
+    completed = [r for r in results if r["error"] is None]
+    nodes = sorted({node for r in completed for node in r["node_gaps"]})
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            kind = r["error"].split(":")[0]
+            errors[kind] = errors.get(kind, 0) + 1
+    return {
+        "requests": len(results),
+        "duration": duration,
+        "throughput": len(completed) / duration if duration else 0.0,
+        "error_rate": (len(results) - len(completed)) / len(results) if results else 0,
+        "errors": errors,
+        "fallback_rate": (
+            sum(r["fallback"] for r in completed) / len(completed) if completed else 0
+        ),
+        "latency": summarize([r["latency"] for r in completed]),
+        "node_gaps": {
+            node: summarize(
+                [r["node_gaps"][node] for r in completed if node in r["node_gaps"]]
+            )
+            for node in nodes
+        },
+        "schedule_lag": summarize([r["schedule_lag"] for r in results]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="JSONL question log")
+    parser.add_argument(
+        "--target", default="inprocess", help='"inprocess" or langgraph-api URL'
+    )
+    parser.add_argument("--assistant-id", default=ASSISTANT_ID)
+    parser.add_argument("--speed", type=float, default=1.0, help="rate multiplier")
+    parser.add_argument(
+        "--rate", type=float, default=1.0, help="requests/s without timestamps"
+    )
+    parser.add_argument("--concurrency", type=int, help="replay in closed loop")
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--records", help="write per-request results as JSONL")
+    args = parser.parse_args()
+
+    records = load_log(args.log)[: args.limit]
+    if not records:
+        parser.error(f"no questions to replay in {args.log}")
+    offsets = None if args.concurrency else schedule(records, args.speed, args.rate)
+
+    async def run():
+        target = (
+            InProcessTarget()
+            if args.target == "inprocess"
+            else HttpTarget(
+                args.target,
+                args.assistant_id,
+                args.timeout,
+                connections=args.concurrency or len(records),
+            )
+        )
+        try:
+            return await replay(target, records, offsets, args.concurrency)
+        finally:
+            await target.close()
+
+    results, duration = asyncio.run(run())
+    summary = {
+        "target": args.target,
+        "mode": "closed" if args.concurrency else "open",
+        "speed": args.speed,
+        "concurrency": args.concurrency,
+        **report(results, duration),
+    }
+    logger.info(f"Replay: {json.dumps(summary)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.records:
+        with open(args.records, "w") as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""Local stand-ins for the external services of the QA graph.
+
+Every fake waits for a latency drawn from a log-normal distribution and fails
+with a configurable rate, so the graph can be benchmarked without network
+access, API keys or model downloads.
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import httpx
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableConfig
+from openai import APITimeoutError
+
+# Median latency (seconds), log-normal sigma and failure rate of each service
+DEFAULT_SERVICES = {
+    "milvus": {"median": 0.05, "sigma": 0.3, "failure_rate": 0.0},
+    "tavily": {"median": 0.8, "sigma": 0.5, "failure_rate": 0.02},
+    "arxiv": {"median": 0.6, "sigma": 0.5, "failure_rate": 0.02},
+    "pubmed": {"median": 0.7, "sigma": 0.5, "failure_rate": 0.02},
+    "embeddings": {"median": 0.01, "sigma": 0.2, "failure_rate": 0.0},
+    "llm": {"median": 2.0, "sigma": 0.4, "failure_rate": 0.01},
+}
+SENTENCES = [
+    "A virtual power plant aggregates distributed energy resources.",
+    "Batteries, heat pumps and solar panels are dispatched as one unit.",
+    "Aggregators trade the pooled flexibility on balancing markets.",
+    "Customers receive a subsidy or a share of the market revenue.",
+    "Grid operators use the flexibility to relieve congestion.",
+]
+
+
+class FakeServiceError(ConnectionError):
+    """Injected failure of a fake service."""
+
+
+class ServiceProfile:
+    """Latency distribution and failure rate of a fake service."""
+
+    def __init__(
+        self,
+        name: str,
+        median: float,
+        sigma: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.name = name
+        self.median = median
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        self.calls += 1
+        if self.median <= 0:
+            return 0.0
+        return self.median * self._random.lognormvariate(0, self.sigma)
+
+    def should_fail(self) -> bool:
+        failed = self._random.random() < self.failure_rate
+        self.failures += failed
+        return failed
+
+    def call(self):
+        time.sleep(self.sample())
+        if self.should_fail():
+            raise FakeServiceError(f"{self.name} is unavailable")
+
+    async def acall(self):
+        await asyncio.sleep(self.sample())
+        if self.should_fail():
+            raise FakeServiceError(f"{self.name} is unavailable")
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "failures": self.failures}
+
+
+def make_documents(source: str, query: str, k: int, scored: bool = False):
+    digest = hashlib.sha256(f"{source}\0{query}".encode()).hexdigest()[:12]
+    return [
+        Document(
+            page_content=" ".join(
+                SENTENCES[(i + j) % len(SENTENCES)] for j in range(3)
+            ),
+            metadata={
+                "source": f"https://{source}.example.com/{digest}/{i}",
+                "page": i,
+                # Hybrid RRF score of a top ranked document, see app.routing
+                **({"score": 2 / (61 + i)} if scored else {}),
+            },
+        )
+        for i in range(k)
+    ]
+
+
+class FakeRetriever(BaseRetriever):
+    source: str
+    profile: Any
+    k: int = 10
+    scored: bool = False
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        self.profile.call()
+        return make_documents(self.source, query, self.k, self.scored)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        await self.profile.acall()
+        return make_documents(self.source, query, self.k, self.scored)
+
+
+class FakeMilvus:
+    """Stand-in for `langchain_milvus.Milvus`."""
+
+    def __init__(self, profile: ServiceProfile, **kwargs: Any):
+        self.profile = profile
+
+    def as_retriever(self, search_kwargs: dict, **kwargs: Any) -> FakeRetriever:
+        return FakeRetriever(
+            source="milvus", profile=self.profile, k=search_kwargs.get("k", 10)
+        )
+
+
+class FakeEmbeddings(DeterministicFakeEmbedding):
+    profile: Any
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.profile.call()
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.profile.call()
+        return super().embed_query(text)
+
+
+class FakeStructuredLLM(Runnable):
+    """Stand-in for a chat model with structured output."""
+
+    def __init__(self, profile: ServiceProfile, chunks: int = 8):
+        self.profile = profile
+        self.chunks = chunks
+
+    def _response(self, input: Any) -> dict:
+        if self.profile.should_fail():
+            raise APITimeoutError(request=httpx.Request("POST", "https://llm.fake"))
+        return {
+            "answer": " ".join(SENTENCES[:3]),
+            "citations": [],
+            "additional_sources": [],
+        }
+
+    def invoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> dict:
+        time.sleep(self.profile.sample())
+        return self._response(input)
+
+    async def ainvoke(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ) -> dict:
+        await asyncio.sleep(self.profile.sample())
+        return self._response(input)
+
+    async def astream(
+        self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any
+    ):
+        latency = self.profile.sample()
+        response = self._response(input)
+        answer = response["answer"]
+        for i in range(1, self.chunks + 1):
+            await asyncio.sleep(latency / self.chunks)
+            yield {"answer": answer[: len(answer) * i // self.chunks]}
+        yield response
+
+
+class FakeChatModel:
+    """Stand-in for `ChatOpenAI` and `ChatDeepSeek`."""
+
+    def __init__(self, profile: ServiceProfile, model: str = "fake", **kwargs: Any):
+        self.profile = profile
+        self.model_name = model
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> Runnable:
+        return FakeStructuredLLM(self.profile)
+
+
+def setup_profiles(
+    config: Optional[Dict[str, dict]] = None, seed: int = 0
+) -> Dict[str, ServiceProfile]:
+    services = {name: dict(values) for name, values in DEFAULT_SERVICES.items()}
+    for name, values in (config or {}).items():
+        services.setdefault(name, {}).update(values)
+    return {
+        name: ServiceProfile(name, seed=seed + i, **values)
+        for i, (name, values) in enumerate(services.items())
+    }
+
+
+def patch_services(stack: ExitStack, profiles: Dict[str, ServiceProfile]):
+    """Replace every external service of the graph with its fake."""
+
+    def retriever(source: str, scored: bool = False):
+        return lambda **kwargs: FakeRetriever(
+            source=source,
+            profile=profiles[source],
+            k=kwargs.get("k") or kwargs.get("top_k_results") or 10,
+            scored=scored,
+        )
+
+    patches = {
+        "app.embeddings.HuggingFaceEmbeddings": lambda **kwargs: FakeEmbeddings(
+            size=768, profile=profiles["embeddings"]
+        ),
+        "app.retriever.Milvus": lambda **kwargs: FakeMilvus(
+            profiles["milvus"], **kwargs
+        ),
+        "app.retriever.ScoredMilvusRetriever": lambda search_kwargs, **kwargs: (
+            FakeRetriever(
+                source="milvus",
+                profile=profiles["milvus"],
+                k=search_kwargs.get("k", 10),
+                scored=True,
+            )
+        ),
+        "app.retriever.TavilySearchAPIRetriever": retriever("tavily"),
+        "app.retriever.TieredTavilySearchAPIRetriever": retriever("tavily"),
+        "app.retriever.CustomArxivRetriever": lambda **kwargs: FakeRetriever(
+            source="arxiv", profile=profiles["arxiv"], k=kwargs.get("load_max_docs", 10)
+        ),
+        "app.retriever.CustomPubMedRetriever": retriever("pubmed"),
+        "app.generator.ChatOpenAI": lambda **kwargs: FakeChatModel(
+            profiles["llm"], **kwargs
+        ),
+        "app.generator.ChatDeepSeek": lambda **kwargs: FakeChatModel(
+            profiles["llm"], **kwargs
+        ),
+    }
+    for target, fake in patches.items():
+        stack.enter_context(patch(target, fake))
@@ -0,0 +1,300 @@
+"""Offline latency and throughput benchmark of the QA graph.
+
+Runs `app.graph.graph` against the local fakes of `tests.benchmark.fakes` and
+writes p50/p95/p99 latency, throughput, event-loop lag and peak memory as
+JSON, so runs can be compared across commits:
+
+    python -m tests.benchmark.run --requests 200 --concurrency 16 --output bench.json
+
+Feature flags are read from the environment as usual, e.g.
+`RETRIEVAL_CACHE_ENABLE=true python -m tests.benchmark.run`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import numpy as np
+
+from tests.benchmark.fakes import patch_services, setup_profiles
+
+DEFAULT_ENV = {
+    "LLM_PROVIDER": "openai",
+    "DENSE_MODEL": "fake",
+    "MILVUS_ENABLE": "true",
+    "TAVILY_ENABLE": "true",
+    "ARXIV_ENABLE": "true",
+    "PUBMED_ENABLE": "true",
+    "LANGSMITH_TRACING": "false",
+}
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(max(values)),
+    }
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, "r") as f:
+        data = json.load(f)
+    return [question for questions in data.values() for question in questions]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class EventLoopLagMonitor:
+    """Measure how late the event loop wakes up a task sleeping for `interval`."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - started_at - self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def measure(worker, concurrency: int, latencies: List[float], counts) -> dict:
+    monitor = EventLoopLagMonitor()
+    monitor.start()
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started_at
+    await monitor.stop()
+    errors, fallbacks = counts()
+    return {
+        "duration": duration,
+        "completed": len(latencies),
+        "errors": errors,
+        "fallbacks": fallbacks,
+        "throughput": len(latencies) / duration if duration else 0.0,
+        "questions_per_minute": 60 * len(latencies) / duration if duration else 0.0,
+        "latency": percentiles(latencies),
+        "event_loop_lag": percentiles(monitor.lags),
+    }
+
+
+async def run_benchmark(
+    graph, questions: List[str], requests: int, concurrency: int
+) -> dict:
+    from app.generator import GENERATOR_FALLBACK
+
+    latencies, errors, fallbacks = [], 0, 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(questions[i % len(questions)])
+
+    async def worker():
+        nonlocal errors, fallbacks
+        while not queue.empty():
+            question = queue.get_nowait()
+            started_at = time.perf_counter()
+            try:
+                result = await graph.ainvoke({"question": question})
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started_at)
+            fallbacks += result.get("answer") == GENERATOR_FALLBACK["answer"]
+
+    return await measure(worker, concurrency, latencies, lambda: (errors, fallbacks))
+
+
+async def run_batch_benchmark(
+    batch_graph, questions: List[str], requests: int, concurrency: int, size: int
+) -> dict:
+    """Like `run_benchmark`, but submit the questions in batches of `size`."""
+    from app.generator import GENERATOR_FALLBACK
+
+    latencies, errors, fallbacks = [], 0, 0
+    queue: asyncio.Queue = asyncio.Queue()
+    batch = [questions[i % len(questions)] for i in range(requests)]
+    for i in range(0, requests, size):
+        queue.put_nowait(batch[i : i + size])
+
+    async def worker():
+        nonlocal errors, fallbacks
+        while not queue.empty():
+            batch = queue.get_nowait()
+            started_at = time.perf_counter()
+            try:
+                result = await batch_graph.ainvoke({"questions": batch})
+            except Exception:
+                errors += len(batch)
+                continue
+            # Every question of a batch completes with its batch
+            latencies.extend([time.perf_counter() - started_at] * len(batch))
+            fallbacks += sum(
+                r.get("answer") == GENERATOR_FALLBACK["answer"]
+                for r in result["results"]
+            )
+
+    return await measure(worker, concurrency, latencies, lambda: (errors, fallbacks))
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests")
+    parser.add_argument(
+        "--memory-requests",
+        type=int,
+        help="requests of the separate memory tracing pass (default: --requests, 0 to skip)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        help="submit questions in batches of this size to app.batch.batch_graph",
+    )
+    parser.add_argument(
+        "--questions",
+        default=os.getenv(
+            "EVALUATION_DATASET_PATH", "tests/evaluation/dataset/vpp.json"
+        ),
+    )
+    parser.add_argument(
+        "--services",
+        help='JSON file overriding the fakes, e.g. {"llm": {"median": 1.0, "failure_rate": 0.1}}',
+    )
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="multiply all median latencies, e.g. 0 to measure pure overhead",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+    services = {}
+    if args.services:
+        with open(args.services, "r") as f:
+            services = json.load(f)
+    profiles = setup_profiles(services, seed=args.seed)
+    for profile in profiles.values():
+        profile.median *= args.latency_scale
+
+    questions = load_questions(args.questions)
+    with ExitStack() as stack:
+        patch_services(stack, profiles)
+        if args.batch_size:
+            from app.batch import batch_graph  # reads the feature flags
+
+            def benchmark(requests: int):
+                return run_batch_benchmark(
+                    batch_graph, questions, requests, args.concurrency, args.batch_size
+                )
+
+        else:
+            from app.graph import graph  # reads the feature flags
+
+            def benchmark(requests: int):
+                return run_benchmark(graph, questions, requests, args.concurrency)
+
+        memory_requests = (
+            args.requests if args.memory_requests is None else args.memory_requests
+        )
+
+        async def run():
+            await benchmark(args.warmup)
+            result = await benchmark(args.requests)
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            service_stats = {name: p.stats() for name, p in profiles.items()}
+            # Tracing slows down allocations, so it runs after the timed pass
+            peak_traced = None
+            if memory_requests:
+                tracemalloc.start()
+                try:
+                    await benchmark(memory_requests)
+                    _, peak_traced = tracemalloc.get_traced_memory()
+                finally:
+                    tracemalloc.stop()
+            return result, max_rss, service_stats, peak_traced
+
+        result, max_rss, service_stats, peak_traced = asyncio.run(run())
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size,
+            "latency_scale": args.latency_scale,
+            "seed": args.seed,
+            "services": {
+                name: {
+                    "median": profile.median,
+                    "sigma": profile.sigma,
+                    "failure_rate": profile.failure_rate,
+                }
+                for name, profile in profiles.items()
+            },
+            "env": {
+                key: value
+                for key, value in sorted(os.environ.items())
+                if key.endswith(("_ENABLE", "_BUDGET", "_MODE", "_BACKEND"))
+                or key in ("LLM_PROVIDER", "TOP_K", "NUMBER_OF_CONTEXT_DOCS")
+            },
+        },
+        **result,
+        "memory": {
+            # Of the separate tracing pass
+            "peak_traced_mb": peak_traced / 2**20 if peak_traced is not None else None,
+            # Of the timed pass; ru_maxrss is in kilobytes on Linux, bytes on macOS
+            "max_rss_mb": max_rss / (2**20 if sys.platform == "darwin" else 2**10),
+        },
+        "services": service_stats,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
+"""Evaluate the graph on a dataset of question groups with RAGAS.
+
+Every question is answered by the graph and its citations and additional
+sources are judged by RAGAS. Graph calls and judge calls run concurrently,
+limited by `EVALUATION_CONCURRENCY` and `JUDGE_CONCURRENCY`. Graph calls are
+rate limited by `EVALUATION_RATE_LIMIT` (graph calls per second) and the
+requests of the judge LLM by `JUDGE_RATE_LIMIT` (Gemini requests per second,
+0.15 by default; every judge call makes several), see
+`app.rate_limit.get_rate_limiter`. Finished stages are appended to the
+checkpoint at `EVALUATION_CHECKPOINT_PATH`, keyed on the question text, so an
+interrupted run resumes where it stopped and edited questions are answered
+again; delete the checkpoint to start over. Fallback answers of the generator
+are neither checkpointed nor scored, but counted separately.
+"""
+
 import asyncio
+import hashlib
 import json
 import os
+import time
 from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
+from app.embeddings import get_dense_embeddings
+from app.generator import GENERATOR_FALLBACK
 from app.graph import graph
+from app.rate_limit import TokenBucket, get_rate_limiter
 from app.utils import setup_logger
 from dotenv import load_dotenv
 from langchain_community.utils.math import cosine_similarity
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import HuggingFaceEmbeddings
 from ragas import EvaluationDataset, evaluate
 from ragas.llms import LangchainLLMWrapper
 from ragas.metrics import (
@@ -21,102 +41,288 @@ from ragas.metrics import (
 load_dotenv()
 logger = setup_logger(__name__)
 
-SLEEP_DURATION = 60  # seconds
-llm = LangchainLLMWrapper(
+CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", "4"))
+JUDGE_CONCURRENCY = int(os.getenv("JUDGE_CONCURRENCY", "2"))
+CHECKPOINT_PATH = os.getenv(
+    "EVALUATION_CHECKPOINT_PATH", "tests/evaluation/checkpoint.jsonl"
+)
+
+
+class RateLimitedLLMWrapper(LangchainLLMWrapper):
+    """RAGAS LLM wrapper that acquires a rate limiter token per LLM request."""
+
+    def __init__(self, *args, limiter: Optional[TokenBucket] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    def generate_text(self, *args, **kwargs):
+        if self.limiter:
+            self.limiter.acquire_sync()
+        return super().generate_text(*args, **kwargs)
+
+    async def agenerate_text(self, *args, **kwargs):
+        if self.limiter:
+            await self.limiter.acquire()
+        return await super().agenerate_text(*args, **kwargs)
+
+
+llm = RateLimitedLLMWrapper(
     ChatGoogleGenerativeAI(
         model="gemini-2.5-flash",
         temperature=0,
         max_tokens=None,
         timeout=None,
         max_retries=3,
-    )
-)
-model_embeddings = HuggingFaceEmbeddings(
-    model_name=os.getenv("DENSE_MODEL"),
+    ),
+    # 9 requests per minute by default, below the Gemini free tier limit
+    limiter=get_rate_limiter("judge", default_rate=0.15),
 )
+model_embeddings = get_dense_embeddings()
+graph_limiter = get_rate_limiter("evaluation")
 
 
-def avg_semantic_similarity(texts: list[str]) -> float:
-    n = len(texts)
-    if n <= 1:
-        return 1.0
+def avg_semantic_similarities(groups: Dict[str, List[str]]) -> Dict[str, float]:
+    """Average pairwise similarity of the texts of every group.
 
-    embeddings = model_embeddings.embed_documents(texts)
-    similarity_matrix = cosine_similarity(embeddings, embeddings)
-    upper_triangle_indices = np.triu_indices(n, k=1)
-    pairwise_scores = similarity_matrix[upper_triangle_indices]
-    avg_similarity = np.mean(pairwise_scores)
-    return avg_similarity
+    The texts of all groups are embedded in a single batch.
+    """
+    texts = [text for group in groups.values() for text in group]
+    embeddings = np.array(model_embeddings.embed_documents(texts)) if texts else None
+    scores, offset = {}, 0
+    for id, group in groups.items():
+        n = len(group)
+        if n <= 1:
+            scores[id] = 1.0
+        else:
+            group_embeddings = embeddings[offset : offset + n]
+            similarity_matrix = cosine_similarity(group_embeddings, group_embeddings)
+            upper_triangle_indices = np.triu_indices(n, k=1)
+            scores[id] = float(np.mean(similarity_matrix[upper_triangle_indices]))
+        offset += n
+    return scores
 
 
-async def main():
-    final_result = defaultdict(dict)
-    path = os.getenv("EVALUATION_DATASET_PATH", "tests/evaluation/dataset/vpp.json")
-    with open(path, "r") as f:
-        data = json.load(f)
+class Checkpoint:
+    """Append-only JSONL record of the finished stages of every question.
 
-        for id, questions in data.items():
-            answers = []
-            for question in questions:
-                result = await graph.ainvoke({"question": question})
-                answers.append(result.get("answer"))
-
-                # Evaluate RAGAS Citations
-                evaluate(
-                    dataset=EvaluationDataset.from_list(
-                        [
-                            {
-                                "user_input": question,
-                                "retrieved_contexts": [
-                                    r.get("snippet", "")
-                                    for r in result.get("citations", [])
-                                ],
-                                "response": result.get("answer"),
-                            }
-                        ]
-                    ),
-                    metrics=[
-                        Faithfulness(),
-                        ResponseRelevancy(),
-                        LLMContextPrecisionWithoutReference(),
-                    ],
-                    llm=llm,
-                    experiment_name=f"group_{id}_citations",
-                )
+    Records are keyed on a hash of the question text as well, so answers and
+    scores of a question edited in the dataset are not resumed.
+    """
 
-                await asyncio.sleep(SLEEP_DURATION)
-
-                # Evaluate RAGAS Additional Sources
-                evaluate(
-                    dataset=EvaluationDataset.from_list(
-                        [
-                            {
-                                "user_input": question,
-                                "retrieved_contexts": [
-                                    r.get("snippet", "")
-                                    for r in result.get("additional_sources", [])
-                                ],
-                                "response": result.get("answer"),
-                            }
-                        ]
-                    ),
-                    metrics=[
-                        LLMContextPrecisionWithoutReference(),
-                    ],
-                    llm=llm,
-                    experiment_name=f"group_{id}_additional_sources",
+    def __init__(self, path: str):
+        self.path = path
+        self.records: Dict[Tuple[str, int, str, str], dict] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if "question" not in record:
+                        continue  # written before records were keyed on questions
+                    key = (
+                        record["group"],
+                        record["index"],
+                        record["question"],
+                        record["stage"],
+                    )
+                    self.records[key] = record["result"]
+            logger.info(f"Resuming from {len(self.records)} stages in {path}")
+
+    @staticmethod
+    def question_hash(question: str) -> str:
+        return hashlib.sha256(question.encode()).hexdigest()[:16]
+
+    def get(self, group: str, index: int, question: str, stage: str):
+        return self.records.get((group, index, self.question_hash(question), stage))
+
+    def save(self, group: str, index: int, question: str, stage: str, result):
+        question = self.question_hash(question)
+        self.records[(group, index, question, stage)] = result
+        with open(self.path, "a") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "group": group,
+                        "index": index,
+                        "question": question,
+                        "stage": stage,
+                        "result": result,
+                    }
                 )
+                + "\n"
+            )
+
 
-                await asyncio.sleep(SLEEP_DURATION)
+class StageTimer:
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
 
-            # Calculate average semantic similarity per group
-            avg_semantic_similarity_score = avg_semantic_similarity(answers)
-            logger.info(
-                f"Group {id} - Average Semantic Similarity: {avg_semantic_similarity_score}"
+    async def run(self, stage: str, coroutine):
+        started_at = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            self.durations[stage].append(time.perf_counter() - started_at)
+
+    def report(self) -> dict:
+        return {
+            stage: {
+                "count": len(durations),
+                "total": sum(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+            }
+            for stage, durations in self.durations.items()
+        }
+
+
+async def answer(question: str, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        if graph_limiter:
+            await graph_limiter.acquire()
+        result = await graph.ainvoke({"question": question})
+    return {
+        "answer": result.get("answer"),
+        "citations": [r.get("snippet", "") for r in result.get("citations", [])],
+        "additional_sources": [
+            r.get("snippet", "") for r in result.get("additional_sources", [])
+        ],
+    }
+
+
+async def judge(
+    question: str,
+    response: dict,
+    stage: str,
+    experiment_name: str,
+    semaphore: asyncio.Semaphore,
+):
+    metrics = (
+        [Faithfulness(), ResponseRelevancy(), LLMContextPrecisionWithoutReference()]
+        if stage == "citations"
+        else [LLMContextPrecisionWithoutReference()]
+    )
+    async with semaphore:
+        result = await asyncio.to_thread(
+            evaluate,
+            dataset=EvaluationDataset.from_list(
+                [
+                    {
+                        "user_input": question,
+                        "retrieved_contexts": response[stage],
+                        "response": response["answer"],
+                    }
+                ]
+            ),
+            metrics=metrics,
+            llm=llm,
+            experiment_name=experiment_name,
+            show_progress=False,
+        )
+    return {name: float(score) for name, score in result.scores[0].items()}
+
+
+async def evaluate_question(
+    id: str,
+    index: int,
+    question: str,
+    checkpoint: Checkpoint,
+    timer: StageTimer,
+    semaphore: asyncio.Semaphore,
+    judge_semaphore: asyncio.Semaphore,
+) -> bool:
+    """Answer and judge a question.
+
+    Returns:
+        False if the generator fell back, in which case nothing is checkpointed
+        or judged, True otherwise
+    """
+    response = checkpoint.get(id, index, question, "answer")
+    if response is None:
+        response = await timer.run("graph", answer(question, semaphore))
+        if response["answer"] == GENERATOR_FALLBACK["answer"]:
+            return False
+        checkpoint.save(id, index, question, "answer", response)
+
+    async def run_judge(stage: str):
+        if checkpoint.get(id, index, question, stage) is not None:
+            return
+        scores = await timer.run(
+            f"judge_{stage}",
+            judge(question, response, stage, f"group_{id}_{stage}", judge_semaphore),
+        )
+        checkpoint.save(id, index, question, stage, scores)
+
+    await asyncio.gather(run_judge("citations"), run_judge("additional_sources"))
+    return True
+
+
+async def main():
+    started_at = time.perf_counter()
+    path = os.getenv("EVALUATION_DATASET_PATH", "tests/evaluation/dataset/vpp.json")
+    with open(path, "r") as f:
+        data = json.load(f)
+
+    checkpoint = Checkpoint(CHECKPOINT_PATH)
+    timer = StageTimer()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    judge_semaphore = asyncio.Semaphore(JUDGE_CONCURRENCY)
+    tasks = [
+        (id, index, question)
+        for id, questions in data.items()
+        for index, question in enumerate(questions)
+    ]
+    results = await asyncio.gather(
+        *(
+            evaluate_question(
+                id, index, question, checkpoint, timer, semaphore, judge_semaphore
             )
-            final_result[id]["avg_semantic_similarity"] = avg_semantic_similarity_score
+            for id, index, question in tasks
+        ),
+        return_exceptions=True,
+    )
+    failed = fallbacks = 0
+    for (id, index, question), result in zip(tasks, results):
+        if isinstance(result, Exception):
+            failed += 1
+            logger.error(f"Group {id} question {index} failed: {result!r}")
+        elif result is False:
+            fallbacks += 1
+            logger.warning(f"Group {id} question {index} got a fallback answer")
 
-    logger.info(f"Average Semantic Similarity: {json.dumps(final_result)}")
+    final_result = defaultdict(dict)
+    answers = {
+        id: [
+            response["answer"]
+            for index, question in enumerate(questions)
+            if (response := checkpoint.get(id, index, question, "answer")) is not None
+        ]
+        for id, questions in data.items()
+    }
+    similarities = await timer.run(
+        "similarity", asyncio.to_thread(avg_semantic_similarities, answers)
+    )
+    for id, questions in data.items():
+        final_result[id]["avg_semantic_similarity"] = similarities[id]
+        for stage in ("citations", "additional_sources"):
+            scores = [
+                score
+                for index, question in enumerate(questions)
+                if (score := checkpoint.get(id, index, question, stage)) is not None
+            ]
+            final_result[id][stage] = {
+                name: float(np.nanmean([s[name] for s in scores]))
+                for name in (scores[0] if scores else {})
+            }
+        logger.info(f"Group {id} - Average Semantic Similarity: {similarities[id]}")
+
+    logger.info(f"Evaluation: {json.dumps(final_result)}")
+    logger.info(
+        f"Evaluated {len(tasks) - failed - fallbacks}/{len(tasks)} questions "
+        f"({fallbacks} fallback answers, {failed} failed) in "
+        f"{time.perf_counter() - started_at:.1f}s: {json.dumps(timer.report())}"
+    )
 
 
 if __name__ == "__main__":
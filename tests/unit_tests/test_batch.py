@@ -0,0 +1,107 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+from app.batch import batch_graph, cluster_questions
+from app.cache import CachedEmbeddings
+from app.generator import GENERATOR_FALLBACK
+
+
+class TestClusterQuestions(unittest.TestCase):
+    def test_near_duplicates_map_to_first_occurrence(self):
+        vectors = np.array([[1.0, 0.0], [0.0, 1.0], [0.99, 0.05], [0.05, 2.0]])
+        self.assertEqual(cluster_questions(vectors, 0.95), [0, 1, 0, 1])
+
+    def test_threshold_above_similarity_keeps_questions(self):
+        vectors = np.array([[1.0, 0.0], [0.9, 0.1]])
+        self.assertEqual(cluster_questions(vectors, 0.999), [0, 1])
+
+    def test_empty(self):
+        self.assertEqual(cluster_questions(np.zeros((0, 2)), 0.95), [])
+
+
+class TestBatchGraph(unittest.TestCase):
+    def run_batch(self, questions, vectors, side_effect=None, threshold=0.0):
+        embeddings = MagicMock()
+        embeddings.aembed_query = AsyncMock(side_effect=lambda q: vectors[q])
+        answered = []
+
+        async def ainvoke(state, config=None):
+            answered.append(state["question"])
+            if side_effect is not None:
+                raise side_effect
+            return {"answer": state["question"], "citations": []}
+
+        with (
+            patch("app.batch.BATCH_DEDUP_THRESHOLD", threshold),
+            patch("app.batch.get_dense_embeddings", return_value=embeddings),
+            patch("app.batch.graph.ainvoke", side_effect=ainvoke),
+        ):
+            result = asyncio.run(batch_graph.ainvoke({"questions": questions}))
+        return result, answered, embeddings
+
+    def test_identical_questions_answered_once(self):
+        questions = ["What is a VPP?", "Cost in Sweden?", "what is a  VPP?", "VPPs?"]
+        result, answered, embeddings = self.run_batch(questions, {})
+        embeddings.aembed_query.assert_not_awaited()
+        self.assertEqual(
+            sorted(answered), ["Cost in Sweden?", "VPPs?", "What is a VPP?"]
+        )
+        self.assertEqual(
+            [r["answer"] for r in result["results"]],
+            ["What is a VPP?", "Cost in Sweden?", "What is a VPP?", "VPPs?"],
+        )
+
+    def test_near_duplicates_answered_once_when_enabled(self):
+        questions = ["What is a VPP?", "Cost in Sweden?", "what is a  VPP?", "VPPs?"]
+        vectors = {
+            "What is a VPP?": [1.0, 0.0],
+            "Cost in Sweden?": [0.0, 1.0],
+            "VPPs?": [0.99, 0.01],
+        }
+        result, answered, embeddings = self.run_batch(
+            questions, vectors, threshold=0.95
+        )
+        # Identical questions are embedded once, as queries
+        self.assertEqual(
+            [call.args[0] for call in embeddings.aembed_query.await_args_list],
+            ["What is a VPP?", "Cost in Sweden?", "VPPs?"],
+        )
+        self.assertEqual(sorted(answered), ["Cost in Sweden?", "What is a VPP?"])
+        self.assertEqual(
+            [r["answer"] for r in result["results"]],
+            ["What is a VPP?", "Cost in Sweden?", "What is a VPP?", "What is a VPP?"],
+        )
+        self.assertEqual(
+            result["answered_questions"],
+            ["What is a VPP?", "Cost in Sweden?", "What is a VPP?", "What is a VPP?"],
+        )
+
+    def test_questions_embedded_in_one_batch_for_the_cache(self):
+        base = MagicMock()
+        base.aembed_documents = AsyncMock(return_value=[[1.0, 0.0], [0.0, 1.0]])
+        embeddings = CachedEmbeddings(base, model_name="mock", symmetric=True)
+        questions = ["What is a VPP?", "Cost in Sweden?", "what is a  VPP?"]
+        with (
+            patch("app.batch.get_dense_embeddings", return_value=embeddings),
+            patch("app.batch.graph.ainvoke", new=AsyncMock(return_value={})),
+        ):
+            asyncio.run(batch_graph.ainvoke({"questions": questions}))
+        base.aembed_documents.assert_awaited_once_with(
+            ["What is a VPP?", "Cost in Sweden?"]
+        )
+        # The retrieval of each question hits the cache
+        self.assertEqual(embeddings.embed_query("Cost in Sweden?"), [0.0, 1.0])
+        base.embed_query.assert_not_called()
+
+    def test_failed_question_returns_fallback(self):
+        result, _, _ = self.run_batch(
+            ["What is a VPP?"], {}, side_effect=RuntimeError("error")
+        )
+        self.assertEqual(result["results"], [GENERATOR_FALLBACK])
+
+    def test_empty_batch(self):
+        result, answered, _ = self.run_batch([], {})
+        self.assertEqual(result["results"], [])
+        self.assertEqual(answered, [])
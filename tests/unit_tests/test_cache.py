@@ -0,0 +1,306 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from typing import Any, List
+from unittest.mock import patch
+
+import numpy as np
+from app.cache import (
+    CachedEmbeddings,
+    CachedLLM,
+    CachedRetriever,
+    InMemoryCacheStore,
+    InMemorySemanticCacheBackend,
+    SemanticCache,
+    SQLiteCacheStore,
+)
+from app.state import OutputState
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+
+OUTPUT = {
+    "answer": "A virtual power plant aggregates distributed energy resources.",
+    "citations": [],
+    "additional_sources": [],
+}
+
+VECTORS = {
+    "what is a virtual power plant?": [1.0, 0.0, 0.0],
+    "what does virtual power plant mean?": [0.99, 0.1, 0.0],
+    "how much does electricity cost in sweden?": [0.0, 1.0, 0.0],
+}
+
+
+class MockEmbeddings(Embeddings):
+    """Mock embeddings with fixed vectors for known questions."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [VECTORS[text.lower()] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return VECTORS[text.lower()]
+
+
+def unit(vector: List[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = SemanticCache(
+            embeddings=MockEmbeddings(), backend=InMemorySemanticCacheBackend()
+        )
+        self.cache.threshold = 0.95
+
+    def test_paraphrase_hit(self):
+        async def run():
+            await self.cache.update("What is a virtual power plant?", OUTPUT)
+            return await self.cache.lookup("What does  virtual power plant mean?")
+
+        self.assertEqual(asyncio.run(run()), OUTPUT)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_unrelated_question_miss(self):
+        async def run():
+            await self.cache.update("What is a virtual power plant?", OUTPUT)
+            return await self.cache.lookup("How much does electricity cost in Sweden?")
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+
+class TestInMemorySemanticCacheBackend(unittest.TestCase):
+    def test_lru_eviction(self):
+        backend = InMemorySemanticCacheBackend(max_entries=2)
+
+        async def run():
+            await backend.add(unit([1, 0, 0]), {"answer": "a"})
+            await backend.add(unit([0, 1, 0]), {"answer": "b"})
+            await backend.search(unit([1, 0, 0]))  # "a" becomes most recent
+            await backend.add(unit([0, 0, 1]), {"answer": "c"})
+            return await backend.search(unit([0, 1, 0]))
+
+        score, output = asyncio.run(run())
+        self.assertEqual(len(backend), 2)
+        self.assertNotEqual(output, {"answer": "b"})
+
+    def test_ttl_expiry(self):
+        backend = InMemorySemanticCacheBackend(ttl=-1)
+
+        async def run():
+            await backend.add(unit([1, 0, 0]), {"answer": "a"})
+            return await backend.search(unit([1, 0, 0]))
+
+        self.assertEqual(asyncio.run(run()), (-1.0, None))
+
+    def test_expired_best_match_falls_back_to_live_entry(self):
+        backend = InMemorySemanticCacheBackend(ttl=10)
+
+        async def run():
+            with patch("app.cache.time.monotonic", return_value=0):
+                await backend.add(unit([1, 0, 0]), {"answer": "a"})
+            with patch("app.cache.time.monotonic", return_value=5):
+                await backend.add(unit([1, 0.1, 0]), {"answer": "b"})
+            with patch("app.cache.time.monotonic", return_value=12):
+                return await backend.search(unit([1, 0, 0]))
+
+        score, output = asyncio.run(run())
+        self.assertEqual(output, {"answer": "b"})
+        self.assertGreater(score, 0.99)
+        self.assertEqual(len(backend), 1)
+
+
+class MockCountingRunnable(Runnable):
+    """Mock retriever runnable which counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        return [
+            Document(
+                page_content="Mock content",
+                metadata={"source": "https://mock_source.com/mock.pdf", "page": 1},
+            )
+        ]
+
+
+class TestCachedRetriever(unittest.TestCase):
+    def test_normalized_query_reuses_result(self):
+        runnable = MockCountingRunnable()
+        retriever = CachedRetriever(
+            runnable, source="tavily", top_k=10, ttl=60, store=InMemoryCacheStore()
+        )
+        first = retriever.invoke("What is a Virtual Power Plant?")
+        second = retriever.invoke("  what is a virtual power plant?")
+        self.assertEqual(runnable.calls, 1)
+        self.assertEqual(first, second)
+        self.assertEqual((retriever.hits, retriever.misses), (1, 1))
+
+    def test_sqlite_store_survives_restart(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "retrieval.sqlite")
+            SQLiteCacheStore(path).set("key", b"value", ttl=60)
+            self.assertEqual(SQLiteCacheStore(path).get("key"), b"value")
+
+    def test_sqlite_store_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            store = SQLiteCacheStore(os.path.join(directory, "r.sqlite"), max_entries=1)
+            store.set("expired", b"value", ttl=-1)
+            self.assertIsNone(store.get("expired"))
+            store.set("old", b"value", ttl=60)
+            store.set("new", b"value", ttl=60)
+            self.assertIsNone(store.get("old"))
+            self.assertEqual(store.get("new"), b"value")
+
+
+class MockCountingEmbeddings(MockEmbeddings):
+    """Mock embeddings which count the texts they embed."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        self.embedded.append(text)
+        return super().embed_query(text)
+
+
+class TestCachedEmbeddings(unittest.TestCase):
+    def test_batch_embeds_only_misses(self):
+        base = MockCountingEmbeddings()
+        embeddings = CachedEmbeddings(base, model_name="mock")
+        embeddings.embed_documents(["What is a virtual power plant?"])
+        vectors = embeddings.embed_documents(
+            [
+                "what is a  virtual power plant?",
+                "how much does electricity cost in sweden?",
+            ]
+        )
+        self.assertEqual(
+            base.embedded,
+            [
+                "What is a virtual power plant?",
+                "how much does electricity cost in sweden?",
+            ],
+        )
+        self.assertEqual(vectors, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        self.assertEqual(embeddings.stats()["hits"], 1)
+
+    def test_queries_and_documents_are_cached_separately(self):
+        base = MockCountingEmbeddings()
+        embeddings = CachedEmbeddings(base, model_name="mock")
+        embeddings.embed_query("What is a virtual power plant?")
+        embeddings.embed_documents(["What is a virtual power plant?"])
+        embeddings.embed_query("what is a virtual power plant?")
+        self.assertEqual(
+            base.embedded,
+            ["What is a virtual power plant?", "What is a virtual power plant?"],
+        )
+        self.assertEqual(embeddings.stats()["hits"], 1)
+
+    def test_batched_queries(self):
+        base = MockCountingEmbeddings()
+        embeddings = CachedEmbeddings(base, model_name="mock", symmetric=True)
+        embeddings.embed_query("What is a virtual power plant?")
+        vectors = asyncio.run(
+            embeddings.aembed_queries(
+                [
+                    "what is a  virtual power plant?",
+                    "how much does electricity cost in sweden?",
+                ]
+            )
+        )
+        self.assertEqual(vectors, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        embeddings.embed_query("How much does electricity cost in Sweden?")
+        self.assertEqual(
+            base.embedded,
+            [
+                "What is a virtual power plant?",
+                "how much does electricity cost in sweden?",
+            ],
+        )
+        self.assertEqual(embeddings.stats()["hits"], 2)
+
+    def test_persistent_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "embeddings.sqlite")
+            CachedEmbeddings(
+                MockCountingEmbeddings(), "mock", store=SQLiteCacheStore(path)
+            ).embed_query("What is a virtual power plant?")
+            base = MockCountingEmbeddings()
+            embeddings = CachedEmbeddings(base, "mock", store=SQLiteCacheStore(path))
+            vector = embeddings.embed_query("What is a virtual power plant?")
+            self.assertEqual(vector, [1.0, 0.0, 0.0])
+            self.assertEqual(base.embedded, [])
+
+
+class MockStructuredLLM(Runnable):
+    """Mock structured LLM which counts its calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        return OUTPUT
+
+    async def astream(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        yield {"answer": OUTPUT["answer"][:10]}
+        yield OUTPUT
+
+
+class TestCachedLLM(unittest.TestCase):
+    def setUp(self):
+        self.prompt = ChatPromptTemplate.from_messages(
+            [("system", "Answer from context."), ("human", "{question}")]
+        )
+
+    def cached_llm(self, llm: Runnable, store, model: str = "gpt-4.1"):
+        return CachedLLM(
+            llm,
+            provider="openai",
+            model=model,
+            temperature=0.0,
+            schema=OutputState,
+            store=store,
+        )
+
+    def test_same_prompt_reuses_response(self):
+        llm, store = MockStructuredLLM(), InMemoryCacheStore()
+        cached = self.cached_llm(llm, store)
+        for question in ["What is a VPP?", "What is a VPP?", "Why a VPP?"]:
+            self.assertEqual(
+                cached.invoke(self.prompt.invoke({"question": question})), OUTPUT
+            )
+        self.assertEqual(llm.calls, 2)
+        self.assertEqual(cached.stats()["hits"], 1)
+
+        # Another model does not reuse the responses
+        self.cached_llm(llm, store, model="deepseek-chat").invoke(
+            self.prompt.invoke({"question": "What is a VPP?"})
+        )
+        self.assertEqual(llm.calls, 3)
+
+    def test_stream_is_cached_across_restart(self):
+        prompt = self.prompt.invoke({"question": "What is a VPP?"})
+
+        async def stream(cached: CachedLLM):
+            return [chunk async for chunk in cached.astream(prompt)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "llm.sqlite")
+            llm = MockStructuredLLM()
+            asyncio.run(stream(self.cached_llm(llm, SQLiteCacheStore(path))))
+            chunks = asyncio.run(stream(self.cached_llm(llm, SQLiteCacheStore(path))))
+            self.assertEqual(chunks, [OUTPUT])
+            self.assertEqual(llm.calls, 1)
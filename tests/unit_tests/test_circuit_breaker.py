@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+from typing import Any
+
+from app.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitBreakerRunnable,
+    CircuitCheckRunnable,
+    CircuitOpenError,
+)
+from app.metrics import CIRCUIT_STATE, CIRCUIT_TRANSITIONS
+from app.rate_limit import RateLimitedRetriever, TokenBucket
+from langchain_core.runnables import Runnable
+
+
+class MockFlakyRunnable(Runnable):
+    """Mock runnable which fails while `failing` is set and counts its calls."""
+
+    def __init__(self):
+        self.failing = True
+        self.calls = 0
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        if self.failing:
+            raise Exception("Service is unavailable")
+        return "ok"
+
+    async def ainvoke(self, *args: Any, **kwargs: Any):
+        return self.invoke(*args, **kwargs)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.runnable = MockFlakyRunnable()
+        self.breaker = CircuitBreaker("mock", failure_threshold=2, cooldown=60)
+        self.guarded = CircuitBreakerRunnable(self.runnable, self.breaker)
+
+    def test_opens_after_failures(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                self.guarded.invoke("input")
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.guarded.invoke("input")
+        self.assertEqual(self.runnable.calls, 2)
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    def test_state_changes_are_metered(self):
+        breaker = CircuitBreaker("metered", failure_threshold=1, cooldown=0)
+        self.assertEqual(CIRCUIT_STATE.values[("metered",)], 0)
+        breaker.on_failure()
+        self.assertEqual(CIRCUIT_STATE.values[("metered",)], 2)
+        breaker.before_call()
+        self.assertEqual(CIRCUIT_STATE.values[("metered",)], 1)
+        breaker.on_success(0)
+        self.assertEqual(CIRCUIT_STATE.values[("metered",)], 0)
+        self.assertEqual(
+            {
+                state: CIRCUIT_TRANSITIONS.values.get(("metered", state))
+                for state in (OPEN, HALF_OPEN, CLOSED)
+            },
+            {OPEN: 1, HALF_OPEN: 1, CLOSED: 1},
+        )
+
+    def test_half_open_probe_closes(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                asyncio.run(self.guarded.ainvoke("input"))
+        self.breaker.cooldown = 0
+        self.runnable.failing = False
+        self.assertEqual(asyncio.run(self.guarded.ainvoke("input")), "ok")
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_probe_reopens(self):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                self.guarded.invoke("input")
+        self.breaker.cooldown = 0
+        with self.assertRaises(Exception):
+            self.guarded.invoke("input")
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_slow_calls_count_as_failures(self):
+        self.breaker.slow_call_threshold = -1
+        self.runnable.failing = False
+        self.guarded.invoke("input")
+        self.guarded.invoke("input")
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_single_half_open_probe(self):
+        self.breaker.state = HALF_OPEN
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+    def test_check_does_not_take_probe(self):
+        self.breaker.state = HALF_OPEN
+        self.breaker.check()
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.check()
+
+    def test_rate_limiter_wait_is_not_timed(self):
+        # The second call waits 0.1s for a token, longer than the slow call threshold
+        self.breaker.slow_call_threshold = 0.05
+        self.runnable.failing = False
+        guarded = CircuitCheckRunnable(
+            RateLimitedRetriever(
+                self.guarded, TokenBucket(rate=10, burst=1, name="mock")
+            ),
+            self.breaker,
+        )
+        self.assertEqual(self.breaker.failures, 0)
+        guarded.invoke("input")
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_open_circuit_does_not_wait_for_tokens(self):
+        limiter = TokenBucket(rate=1, burst=1, name="mock")
+        guarded = CircuitCheckRunnable(
+            RateLimitedRetriever(self.guarded, limiter), self.breaker
+        )
+        self.breaker.state = OPEN
+        self.breaker.opened_at = float("inf")
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(guarded.ainvoke("input"))
+        self.assertEqual(limiter.acquired, 0)
@@ -0,0 +1,35 @@
+import unittest
+
+from app.dedup import deduplicate_documents
+from langchain_core.documents import Document
+
+TEXT = (
+    "A virtual power plant is a network of decentralized, medium-scale power "
+    "generating units such as wind farms, solar parks, and combined heat and "
+    "power units, as well as flexible power consumers and storage systems. "
+    "The interconnected units are dispatched through the central control room "
+    "of the virtual power plant but nonetheless remain independent in their "
+    "operation and ownership."
+)
+
+
+class TestDeduplicateDocuments(unittest.TestCase):
+    def test_near_duplicates_removed(self):
+        docs = [
+            Document(page_content=TEXT, metadata={"source": "milvus_source"}),
+            Document(page_content="Electricity prices in Sweden vary by zone."),
+            Document(
+                page_content=TEXT.replace("ownership.", "ownership!"),
+                metadata={"source": "tavily_source"},
+            ),
+        ]
+        results, removed = deduplicate_documents(docs, threshold=0.9)
+        self.assertEqual(removed, 1)
+        self.assertEqual(results, docs[:2])
+
+    def test_distinct_documents_kept(self):
+        docs = [Document(page_content=f"Document number {i} " * 5) for i in range(3)]
+        docs.append(Document(page_content=""))
+        results, removed = deduplicate_documents(docs, threshold=0.95)
+        self.assertEqual(removed, 0)
+        self.assertEqual(results, docs)
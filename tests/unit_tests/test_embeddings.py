@@ -0,0 +1,35 @@
+import unittest
+from typing import List
+
+import numpy as np
+from app.embeddings import check_embedding_parity
+from langchain_core.embeddings import Embeddings
+
+TEXTS = ["first", "second", "third", "fourth"]
+
+
+class MockEmbeddings(Embeddings):
+    """Mock embeddings with fixed vectors plus optional noise."""
+
+    def __init__(self, noise: float = 0.0):
+        self.noise = noise
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.eye(len(TEXTS))[[TEXTS.index(text) for text in texts]]
+        return (vectors + self.noise).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class TestEmbeddingParity(unittest.TestCase):
+    def test_identical_backends(self):
+        parity = check_embedding_parity(MockEmbeddings(), MockEmbeddings(), TEXTS)
+        self.assertAlmostEqual(parity["min_cosine"], 1.0, places=5)
+        self.assertEqual(parity["neighbour_overlap"], 1.0)
+
+    def test_drifting_backend(self):
+        parity = check_embedding_parity(
+            MockEmbeddings(), MockEmbeddings(noise=0.5), TEXTS
+        )
+        self.assertLess(parity["min_cosine"], 0.9)
@@ -0,0 +1,224 @@
+import asyncio
+import time
+import unittest
+from typing import Any
+
+from app.ensemble import (
+    FusionRetriever,
+    RankFusion,
+    document_key,
+    reciprocal_rank_fusion,
+)
+from app.metrics import RETRIEVER_DROPPED
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable
+
+FAST_DOC = Document(page_content="Fast content", metadata={"source": "fast_source"})
+SLOW_DOC = Document(page_content="Slow content", metadata={"source": "slow_source"})
+
+
+def contents(docs):
+    return [doc.page_content for doc in docs]
+
+
+class MockDelayedRunnable(Runnable):
+    """Mock retriever runnable which answers after a delay."""
+
+    def __init__(self, delay: float, doc: Document):
+        self.delay = delay
+        self.doc = doc
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        time.sleep(self.delay)
+        return [self.doc]
+
+    async def ainvoke(self, *args: Any, **kwargs: Any):
+        await asyncio.sleep(self.delay)
+        return [self.doc]
+
+
+class MockFailingRunnable(Runnable):
+    """Mock retriever runnable which always fails."""
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        raise Exception("Service is unavailable")
+
+    async def ainvoke(self, *args: Any, **kwargs: Any):
+        return self.invoke(*args, **kwargs)
+
+
+class TestFusionRetriever(unittest.TestCase):
+    def setUp(self):
+        self.retriever = FusionRetriever(
+            retrievers=[
+                MockDelayedRunnable(0.0, FAST_DOC),
+                MockDelayedRunnable(5.0, SLOW_DOC),
+            ],
+            sources=["fast", "slow"],
+            budget=0.2,
+        )
+
+    def test_async_partial_results(self):
+        start = time.monotonic()
+        results = asyncio.run(self.retriever.ainvoke("Testing question"))
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(contents(results), [FAST_DOC.page_content])
+        self.assertEqual(self.retriever.dropped, {"slow": 1})
+
+    def test_sync_partial_results(self):
+        start = time.monotonic()
+        results = self.retriever.invoke("Testing question")
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(contents(results), [FAST_DOC.page_content])
+
+    def test_source_budget(self):
+        self.retriever.budget = 10.0
+        self.retriever.source_budgets = {"slow": 0.1}
+        results = asyncio.run(self.retriever.ainvoke("Testing question"))
+        self.assertEqual(contents(results), [FAST_DOC.page_content])
+
+    def test_without_budget_waits_for_all_sources(self):
+        retriever = FusionRetriever(
+            retrievers=[
+                MockDelayedRunnable(0.0, FAST_DOC),
+                MockDelayedRunnable(0.1, SLOW_DOC),
+            ],
+            sources=["fast", "slow"],
+        )
+        self.assertEqual(
+            contents(asyncio.run(retriever.ainvoke("Testing question"))),
+            ["Fast content", "Slow content"],
+        )
+        self.assertEqual(
+            contents(retriever.invoke("Testing question")),
+            ["Fast content", "Slow content"],
+        )
+        self.assertEqual(retriever.dropped, {})
+
+    def test_dropped_sources_are_metered(self):
+        retriever = FusionRetriever(
+            retrievers=[
+                MockDelayedRunnable(0.0, FAST_DOC),
+                MockDelayedRunnable(5.0, SLOW_DOC),
+                MockFailingRunnable(),
+            ],
+            sources=["metered_fast", "metered_slow", "metered_failing"],
+            budget=0.2,
+        )
+        asyncio.run(retriever.ainvoke("Testing question"))
+        retriever.invoke("Testing question")
+        self.assertEqual(
+            {
+                key: value
+                for key, value in RETRIEVER_DROPPED.values.items()
+                if key[0].startswith("metered_")
+            },
+            {("metered_slow", "budget"): 2, ("metered_failing", "error"): 2},
+        )
+
+    def test_ranked_lists(self):
+        local_doc = Document(page_content="Local content", metadata={"source": "pdf"})
+        retriever = self.retriever.with_ranked_lists({"local": [local_doc, FAST_DOC]})
+        results = asyncio.run(retriever.ainvoke("Testing question"))
+        # FAST_DOC is ranked by both the local list and the fast source
+        self.assertEqual(contents(results), ["Fast content", "Local content"])
+        self.assertEqual(
+            set(results[0].metadata["fusion"]["sources"]), {"local", "fast"}
+        )
+        self.assertEqual(self.retriever.ranked_lists, {})
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_rank_and_merge(self):
+        results = reciprocal_rank_fusion([[SLOW_DOC, FAST_DOC], [FAST_DOC]], c=60)
+        self.assertEqual(contents(results), ["Fast content", "Slow content"])
+        self.assertNotIn("fusion", FAST_DOC.metadata)  # inputs are not modified
+
+    def test_pages_of_same_source_are_kept(self):
+        docs = [
+            Document(page_content=f"Page {i}", metadata={"source": "a.pdf", "page": i})
+            for i in range(3)
+        ]
+        results = reciprocal_rank_fusion([docs, [docs[2]]], c=60)
+        self.assertEqual(contents(results), ["Page 2", "Page 0", "Page 1"])
+
+    def test_weights(self):
+        results = reciprocal_rank_fusion(
+            [[SLOW_DOC], [FAST_DOC]],
+            c=60,
+            sources=["slow", "fast"],
+            weights={"slow": 0.5},
+        )
+        self.assertEqual(contents(results), ["Fast content", "Slow content"])
+
+    def test_score_breakdown(self):
+        results = reciprocal_rank_fusion(
+            [[SLOW_DOC, FAST_DOC], [FAST_DOC]], c=60, sources=["a", "b"]
+        )
+        self.assertEqual(
+            results[0].metadata["fusion"],
+            {
+                "score": 1 / 62 + 1 / 61,
+                "sources": {
+                    "a": {"rank": 2, "score": 1 / 62},
+                    "b": {"rank": 1, "score": 1 / 61},
+                },
+            },
+        )
+
+    def test_duplicate_in_list_counts_best_rank(self):
+        results = reciprocal_rank_fusion([[FAST_DOC, SLOW_DOC, FAST_DOC]], c=60)
+        self.assertEqual(results[0].metadata["fusion"]["score"], 1 / 61)
+
+
+class TestRankFusion(unittest.TestCase):
+    def test_ties_do_not_depend_on_arrival_order(self):
+        docs = {
+            source: [Document(page_content=source, metadata={"source": source})]
+            for source in ("milvus", "tavily")
+        }
+        for order in (["milvus", "tavily"], ["tavily", "milvus"]):
+            fusion = RankFusion(sources=["milvus", "tavily"], c=60)
+            for source in order:
+                fusion.add(source, docs[source])
+            self.assertEqual(contents(fusion.fuse()), ["milvus", "tavily"])
+
+    def test_incremental_fusion_matches_batch(self):
+        lists = [
+            [
+                Document(page_content=str(i), metadata={"source": str(i % 7)})
+                for i in range(offset, offset + 50)
+            ]
+            for offset in (0, 10, 20)
+        ]
+        fusion = RankFusion(c=60)
+        for i, doc_list in enumerate(lists):
+            fusion.add(f"list_{i + 1}", doc_list)
+            self.assertEqual(
+                len(fusion), len({document_key(d) for l in lists[: i + 1] for d in l})
+            )
+        self.assertEqual(
+            [doc.metadata for doc in fusion.fuse(k=5)],
+            [doc.metadata for doc in reciprocal_rank_fusion(lists, c=60)[:5]],
+        )
+
+    def test_document_key_falls_back_to_content(self):
+        self.assertEqual(document_key(Document(page_content="text")), "text")
+        self.assertEqual(document_key(FAST_DOC), ("fast_source", None))
+
+    def test_chunks_of_same_page_stay_apart(self):
+        chunks = [
+            Document(
+                page_content=f"chunk {pk}",
+                metadata={"source": "vpp.pdf", "page": 1, "pk": pk},
+            )
+            for pk in (1, 2)
+        ]
+        web = Document(page_content="web", metadata={"source": "vpp.pdf", "page": 1})
+        fusion = RankFusion()
+        fusion.add("milvus", chunks)
+        fusion.add("tavily", [web, chunks[1]])
+        self.assertEqual(
+            sorted(doc.page_content for doc in fusion.fuse()),
+            ["chunk 1", "chunk 2", "web"],
+        )
@@ -1,4 +1,7 @@
+import asyncio
+import os
 import unittest
+from typing import Any
 from unittest.mock import patch
 
 import httpx
@@ -9,7 +12,7 @@ from langchain_core.prompts import (
     HumanMessagePromptTemplate,
     SystemMessagePromptTemplate,
 )
-from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from langchain_core.runnables import Runnable, RunnableLambda, RunnablePassthrough
 from openai import RateLimitError
 
 DOCS = [
@@ -36,6 +39,18 @@ Information: This is another mock document for testing purposes.
 """
 
 
+class MockStreamingRunnable(Runnable):
+    """Mock structured LLM which streams partial responses."""
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        raise NotImplementedError
+
+    async def astream(self, *args: Any, **kwargs: Any):
+        for answer in ["", "Mock", "Mock answer"]:
+            yield {"answer": answer}
+        yield {"answer": "Mock answer", "citations": [], "additional_sources": []}
+
+
 class TestGenerator(unittest.TestCase):
     def setUp(self):
         self.generator = Generator()
@@ -44,6 +59,18 @@ class TestGenerator(unittest.TestCase):
         context = self.generator.format_docs_as_context(DOCS)
         self.assertEqual(context, CONTEXT)
 
+    def test_auto_provider_requires_api_key(self):
+        with patch.dict(
+            os.environ,
+            {"LLM_PROVIDER": "auto", "OPENAI_API_KEY": "key", "DEEPSEEK_API_KEY": ""},
+        ):
+            generator = Generator()
+            self.assertEqual(list(generator.llms), ["openai"])
+            self.assertIsNone(generator.provider_router)
+            os.environ["OPENAI_API_KEY"] = ""
+            with self.assertRaises(ValueError):
+                Generator()
+
     def test_prompt(self):
         """Test if the prompt contains system and huma message role."""
         prompt = self.generator.get_prompt()
@@ -100,3 +127,97 @@ class TestGenerator(unittest.TestCase):
             result["answer"],
         )
         self.assertEqual(result["citations"], [])
+
+    def test_astream(self):
+        events = []
+        with patch.object(
+            self.generator, "get_llm", return_value=MockStreamingRunnable()
+        ):
+            result = asyncio.run(self.generator.astream("prompt", events.append))
+        self.assertEqual(
+            result, {"answer": "Mock answer", "citations": [], "additional_sources": []}
+        )
+        self.assertEqual(
+            [e["answer_delta"] for e in events if "answer_delta" in e],
+            ["Mock", " answer"],
+        )
+        self.assertIsNotNone(events[-1]["time_to_first_token"])
+        self.assertGreaterEqual(
+            events[-1]["latency"], events[-1]["time_to_first_token"]
+        )
+
+    def test_pack_docs(self):
+        long_doc = Document(
+            page_content="virtual power plant " * 200,
+            metadata={"source": "https://mock_source_3.com/mock.pdf", "page": 3},
+        )
+        docs, dropped, stats = self.generator.pack_docs(
+            DOCS + [long_doc] + DOCS, budget=150
+        )
+        self.assertEqual(docs[:2], DOCS)
+        self.assertEqual(dropped, DOCS)
+        self.assertEqual(stats["docs_trimmed"], 1)
+        self.assertEqual(stats["docs_dropped"], 2)
+        self.assertLessEqual(stats["tokens_used"], 150)
+        self.assertGreater(stats["tokens_cut"], 0)
+        self.assertLess(len(docs[2].page_content), len(long_doc.page_content))
+
+    def test_pack_docs_stops_at_first_dropped_doc(self):
+        long_doc = Document(
+            page_content="virtual power plant " * 200,
+            metadata={"source": "https://mock_source_3.com/mock.pdf", "page": 3},
+        )
+        # Too little budget is left to trim the long document, while the
+        # lower ranked short one would still fit
+        docs, dropped, stats = self.generator.pack_docs(
+            DOCS[:1] + [long_doc] + DOCS[1:], budget=40
+        )
+        self.assertEqual(docs, DOCS[:1])
+        self.assertEqual(dropped, [long_doc] + DOCS[1:])
+        self.assertEqual(stats["docs_trimmed"], 0)
+        self.assertEqual(stats["docs_dropped"], 2)
+
+    def test_format_docs_as_context_reference_mode(self):
+        self.generator.citation_mode = "reference"
+        context = self.generator.format_docs_as_context(DOCS)
+        self.assertIn("Index: 0\nSource: https://mock_source.com/mock.pdf", context)
+        self.assertIn("Index: 1\nSource: https://mock_source_2.com/mock.pdf", context)
+
+    def test_resolve_citations(self):
+        self.generator.citation_mode = "reference"
+        response = {
+            "answer": "Mock answer",
+            "citations": [
+                {"index": 1, "start": 8, "end": 24},
+                {"index": 1, "start": 8, "end": 24},
+                {"index": 5},
+            ],
+        }
+        result = self.generator.resolve_citations(response, DOCS)
+        self.assertEqual(result["answer"], "Mock answer")
+        self.assertEqual(
+            result["citations"],
+            [
+                {
+                    "url": "https://mock_source_2.com/mock.pdf",
+                    "snippet": "another mock doc",
+                    "page": 2,
+                }
+            ],
+        )
+        self.assertEqual(
+            result["additional_sources"],
+            [convert_document_to_additional_source(DOCS[0])],
+        )
+
+    def test_resolve_citations_full_mode(self):
+        response = {"answer": "Mock answer", "citations": [], "additional_sources": []}
+        self.assertIs(self.generator.resolve_citations(response, DOCS), response)
+
+    def test_pack_context_within_budget(self):
+        self.generator.context_token_budget = 1000
+        self.assertEqual(self.generator.pack_context(DOCS), (DOCS, []))
+
+    def test_pack_context_without_budget(self):
+        self.generator.context_token_budget = 0
+        self.assertEqual(self.generator.pack_context(DOCS * 100), (DOCS * 100, []))
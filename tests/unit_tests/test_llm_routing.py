@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+from typing import Any
+
+from app.llm_routing import LatencyHistogram, ProviderRouter
+from langchain_core.runnables import Runnable
+
+
+class MockProvider(Runnable):
+    """Mock structured LLM with a fixed latency."""
+
+    def __init__(self, name: str, latency: float = 0.0, fail: bool = False):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    def invoke(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        if self.fail:
+            raise ValueError(f"{self.name} is unavailable")
+        return {"answer": self.name}
+
+    async def ainvoke(self, *args: Any, **kwargs: Any):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise ValueError(f"{self.name} is unavailable")
+        return {"answer": self.name}
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentile(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.percentile(0.5))
+        for latency in [0.1] * 8 + [5.0] * 2:
+            histogram.record(latency)
+        self.assertLessEqual(histogram.percentile(0.5), 0.15)
+        self.assertGreaterEqual(histogram.percentile(0.95), 5.0)
+
+    def test_recent_samples_weigh_more(self):
+        histogram = LatencyHistogram(decay=0.5)
+        for latency in [5.0] * 10 + [0.1] * 3:
+            histogram.record(latency)
+        self.assertLessEqual(histogram.percentile(0.5), 0.15)
+
+
+class TestProviderRouter(unittest.TestCase):
+    def test_routes_to_fastest_provider(self):
+        router = ProviderRouter({"a": MockProvider("a"), "b": MockProvider("b")})
+        router.histograms["a"].record(3.0)
+        router.histograms["b"].record(0.5)
+        self.assertEqual(router.ranked(), ["b", "a"])
+        self.assertEqual(router.invoke("prompt"), {"answer": "b"})
+
+    def test_failover(self):
+        a, b = MockProvider("a", fail=True), MockProvider("b")
+        router = ProviderRouter({"a": a, "b": b})
+        self.assertEqual(asyncio.run(router.ainvoke("prompt")), {"answer": "b"})
+        self.assertEqual(router.invoke("prompt"), {"answer": "b"})
+        self.assertEqual(router.ranked(), ["b", "a"])  # failures count as timeouts
+
+    def test_all_providers_fail(self):
+        router = ProviderRouter({"a": MockProvider("a", fail=True)})
+        with self.assertRaises(ValueError):
+            asyncio.run(router.ainvoke("prompt"))
+
+    def test_hedge_slow_provider(self):
+        slow, fast = MockProvider("slow", latency=1.0), MockProvider("fast", 0.01)
+        router = ProviderRouter(
+            {"slow": slow, "fast": fast}, hedge=True, min_hedge_delay=0.05
+        )
+        router.histograms["fast"].record(2.0)  # slow is ranked first
+
+        self.assertEqual(asyncio.run(router.ainvoke("prompt")), {"answer": "fast"})
+        self.assertEqual((router.hedges, router.hedge_wins), (1, 1))
+        self.assertEqual(slow.cancelled, 1)
+        self.assertEqual(router.histograms["slow"].samples, 0)
+
+    def test_no_hedge_when_fast(self):
+        a, b = MockProvider("a", latency=0.01), MockProvider("b")
+        router = ProviderRouter({"a": a, "b": b}, hedge=True, min_hedge_delay=0.5)
+        router.histograms["b"].record(2.0)
+        self.assertEqual(asyncio.run(router.ainvoke("prompt")), {"answer": "a"})
+        self.assertEqual((router.hedges, b.calls), (0, 0))
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from app.local_index import LocalIndex, LocalIndexRetriever, tokenize
+from app.retriever import Retriever
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+TEXTS = [
+    "A virtual power plant aggregates batteries and solar panels.",
+    "Electricity prices in Sweden depend on the bidding zone.",
+    "Electric vehicles in Europe are growing fast.",
+    "The virtual power plant trades flexibility on balancing markets.",
+]
+METADATAS = [
+    {"source": "vpp.pdf", "page": 1, "pk": 1},
+    {"source": "sweden.pdf", "page": 3, "pk": 2},
+    {"source": "ev.pdf", "page": 2, "pk": 3},
+    {"source": "vpp.pdf", "page": 2, "pk": 4},
+]
+
+
+class TestLocalIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.embeddings = DeterministicFakeEmbedding(size=16)
+        self.index = LocalIndex.build(
+            self.directory.name,
+            TEXTS,
+            METADATAS,
+            np.array(self.embeddings.embed_documents(TEXTS)),
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize("The price of EVs, in 2024!"), ["price", "evs", "2024"]
+        )
+
+    def test_vectors_are_memory_mapped(self):
+        index = LocalIndex(self.directory.name)
+        self.assertIsInstance(index.vectors, np.memmap)
+        self.assertEqual(index.vectors.dtype, np.float32)
+        self.assertEqual(len(index), 4)
+
+    def test_bm25_search(self):
+        self.assertEqual(
+            self.index.bm25_search("virtual power plant", 10).tolist()[:2], [0, 3]
+        )
+        self.assertEqual(self.index.bm25_search("prices Sweden", 1).tolist(), [1])
+        self.assertEqual(self.index.bm25_search("unknown words", 10).tolist(), [])
+
+    def test_dense_search(self):
+        embedding = self.embeddings.embed_query(TEXTS[2])
+        self.assertEqual(self.index.dense_search(embedding, 1).tolist(), [2])
+        query = np.array(embedding, dtype=np.float32)
+        self.index.dense_search(query, 1)
+        np.testing.assert_array_equal(query, np.array(embedding, dtype=np.float32))
+
+    def test_hybrid_search_keeps_metadata_and_score(self):
+        query = TEXTS[1]
+        docs = self.index.search(query, self.embeddings.embed_query(query), k=2, c=60)
+        self.assertEqual(docs[0].page_content, TEXTS[1])
+        self.assertEqual(docs[0].metadata, {**METADATAS[1], "score": 2 / 61})
+        self.assertEqual(len(docs), 2)
+
+    def test_group_size(self):
+        query = "virtual power plant"
+        embedding = self.embeddings.embed_query(query)
+        docs = self.index.search(query, embedding, k=1, group_size=1)
+        self.assertEqual(len(docs), 1)
+        docs = self.index.search(query, embedding, k=1, group_size=2)
+        self.assertEqual(
+            [doc.metadata["source"] for doc in docs], ["vpp.pdf", "vpp.pdf"]
+        )
+
+    def test_retriever(self):
+        retriever = LocalIndexRetriever(
+            index=self.index, embeddings=self.embeddings, k=1
+        )
+        docs = asyncio.run(retriever.ainvoke(TEXTS[2]))
+        self.assertEqual(docs[0].metadata["source"], "ev.pdf")
+        self.assertEqual(retriever.invoke(TEXTS[2]), docs)
+
+    def test_replaces_milvus_in_retriever(self):
+        env = {
+            "LOCAL_INDEX_ENABLE": "true",
+            "LOCAL_INDEX_PATH": self.directory.name,
+            "MILVUS_ENABLE": "true",
+            "TAVILY_ENABLE": "false",
+            "ARXIV_ENABLE": "false",
+            "PUBMED_ENABLE": "false",
+        }
+        with (
+            patch.dict(os.environ, env),
+            patch("app.retriever.get_dense_embeddings", return_value=self.embeddings),
+            patch("app.retriever.Milvus") as milvus,
+        ):
+            retriever = Retriever()
+        milvus.assert_not_called()
+        docs = retriever().invoke(TEXTS[0])
+        self.assertEqual(docs[0].page_content, TEXTS[0])
+        self.assertIn("local_index", docs[0].metadata["fusion"]["sources"])
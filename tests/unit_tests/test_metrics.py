@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+
+from app.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MeteredRetriever,
+    Registry,
+    TokenUsageCallbackHandler,
+    render,
+    timed_node,
+)
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from typing_extensions import TypedDict
+
+
+class State(TypedDict):
+    question: str
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_render(self):
+        counter = Counter(
+            "test_fallbacks_total", "Fallbacks.", ("source",), registry=self.registry
+        )
+        counter.inc(source="tavily")
+        counter.inc(2, source='a "quoted" name')
+        self.assertIn('test_fallbacks_total{source="tavily"} 1', self.registry.render())
+        self.assertIn(
+            'test_fallbacks_total{source="a \\"quoted\\" name"} 2', counter.render()
+        )
+        self.assertIn("# TYPE test_fallbacks_total counter", counter.render())
+
+    def test_histogram_render(self):
+        histogram = Histogram(
+            "test_duration_seconds",
+            "Duration.",
+            buckets=(1, 5),
+            registry=self.registry,
+        )
+        for value in [0.5, 2, 10]:
+            histogram.observe(value)
+        lines = histogram.render().splitlines()
+        self.assertIn('test_duration_seconds_bucket{le="1"} 1', lines)
+        self.assertIn('test_duration_seconds_bucket{le="5"} 2', lines)
+        self.assertIn('test_duration_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_duration_seconds_sum 12.5", lines)
+        self.assertIn("test_duration_seconds_count 3", lines)
+
+    def test_gauge_render(self):
+        gauge = Gauge("test_state", "State.", ("name",), registry=self.registry)
+        gauge.set(2, name="milvus")
+        gauge.set(0, name="milvus")
+        self.assertIn('test_state{name="milvus"} 0', gauge.render().splitlines())
+        self.assertIn("# TYPE test_state gauge", gauge.render())
+
+    def test_duplicate_name(self):
+        Counter("test_total", "Test.", registry=self.registry)
+        with self.assertRaises(ValueError):
+            Histogram("test_total", "Test.", registry=self.registry)
+
+    def test_metered_retriever(self):
+        retriever = MeteredRetriever(RunnableLambda(lambda x: [1, 2, 3]), "mock")
+        self.assertEqual(asyncio.run(retriever.ainvoke("question")), [1, 2, 3])
+        metrics = render()
+        self.assertIn('qa_retriever_duration_seconds_count{source="mock"} 1', metrics)
+        self.assertIn('qa_retriever_documents_sum{source="mock"} 3', metrics)
+
+    def test_token_usage(self):
+        message = AIMessage(
+            content="",
+            usage_metadata={"input_tokens": 10, "output_tokens": 4, "total_tokens": 14},
+        )
+        TokenUsageCallbackHandler("mock").on_llm_end(
+            LLMResult(generations=[[ChatGeneration(message=message)]])
+        )
+        metrics = render()
+        self.assertIn('qa_llm_tokens_total{provider="mock",type="prompt"} 10', metrics)
+        self.assertIn(
+            'qa_llm_tokens_total{provider="mock",type="completion"} 4', metrics
+        )
+
+    def test_timed_node_keeps_config(self):
+        @timed_node("mock_node")
+        async def node(state: State, config: RunnableConfig) -> State:
+            return {"question": config["configurable"]["question"]}
+
+        builder = StateGraph(State)
+        builder.add_node("mock_node", node)
+        builder.add_edge(START, "mock_node")
+        builder.add_edge("mock_node", END)
+        result = asyncio.run(
+            builder.compile().ainvoke(
+                {"question": ""}, {"configurable": {"question": "configured"}}
+            )
+        )
+        self.assertEqual(result, {"question": "configured"})
+        self.assertIn('qa_node_duration_seconds_count{node="mock_node"} 1', render())
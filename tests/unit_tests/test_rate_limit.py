@@ -0,0 +1,49 @@
+import asyncio
+import time
+import unittest
+
+from app.rate_limit import TokenBucket
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_without_waiting(self):
+        bucket = TokenBucket(rate=1, burst=3)
+
+        async def run():
+            return [await bucket.acquire() for _ in range(3)]
+
+        self.assertEqual(asyncio.run(run()), [0.0, 0.0, 0.0])
+
+    def test_rate_and_fair_order(self):
+        bucket = TokenBucket(rate=20, burst=1)
+
+        async def run():
+            start = time.monotonic()
+            order = []
+
+            async def request(i):
+                await bucket.acquire()
+                order.append(i)
+
+            await asyncio.gather(*(request(i) for i in range(5)))
+            return time.monotonic() - start, order
+
+        elapsed, order = asyncio.run(run())
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertEqual(order, [0, 1, 2, 3, 4])
+        self.assertEqual(bucket.stats()["queue_depth"], 0)
+        self.assertGreater(bucket.stats()["max_wait"], 0.15)
+
+    def test_cancelled_waiter_refunds_tokens(self):
+        bucket = TokenBucket(rate=1, burst=1)
+
+        async def run():
+            await bucket.acquire()
+            waiter = asyncio.create_task(bucket.acquire())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+
+        asyncio.run(run())
+        self.assertEqual(bucket.queue_depth, 0)
+        self.assertLess(bucket._reserve(0), 1.0)
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+
+DOCS = [
+    Document(page_content="Electricity prices in Sweden."),
+    Document(page_content="A virtual power plant aggregates energy resources."),
+    Document(page_content="Electric vehicle adoption in Europe."),
+]
+
+
+class MockCrossEncoder:
+    """Mock cross-encoder which scores passages mentioning 'virtual' highest."""
+
+    def __init__(self, *args: Any, delay: float = 0.0, **kwargs: Any):
+        self.delay = delay
+        self.batches = []
+
+    def predict(self, pairs, batch_size: int = 32):
+        time.sleep(self.delay)
+        self.batches.append(len(pairs))
+        return [float("virtual" in passage) for _, passage in pairs]
+
+
+class TestReranker(unittest.TestCase):
+    def setUp(self):
+        with patch("sentence_transformers.CrossEncoder", MockCrossEncoder):
+            from app.reranker import Reranker
+
+            self.reranker = Reranker()
+
+    def test_rerank_single_batch(self):
+        results = asyncio.run(
+            self.reranker.arerank("What is a virtual power plant?", DOCS)
+        )
+        self.assertEqual(results[0], DOCS[1])
+        self.assertEqual(self.reranker.model.batches, [3])
+
+    def test_candidate_cap(self):
+        self.reranker.max_candidates = 2
+        results = asyncio.run(
+            self.reranker.arerank("What is a virtual power plant?", DOCS)
+        )
+        self.assertEqual(results, [DOCS[1], DOCS[0], DOCS[2]])
+
+    def test_skipped_over_budget(self):
+        self.reranker.model.delay = 0.5
+        self.reranker.budget = 0.05
+        results = asyncio.run(
+            self.reranker.arerank("What is a virtual power plant?", DOCS)
+        )
+        self.assertEqual(results, DOCS)
+        self.assertEqual(self.reranker.skipped, 1)
+
+    def test_skipped_under_load(self):
+        self.reranker.in_flight = self.reranker.max_in_flight
+        results = asyncio.run(
+            self.reranker.arerank("What is a virtual power plant?", DOCS)
+        )
+        self.assertEqual(results, DOCS)
+
+    def test_slots_released_after_timeout_in_busy_executor(self):
+        self.reranker.budget = 0.05
+        question = "What is a virtual power plant?"
+
+        async def run():
+            executor = ThreadPoolExecutor(max_workers=1)
+            asyncio.get_running_loop().set_default_executor(executor)
+            blocked = threading.Event()
+            executor.submit(blocked.wait)  # the only worker is busy
+            for _ in range(self.reranker.max_in_flight):
+                self.assertEqual(await self.reranker.arerank(question, DOCS), DOCS)
+            blocked.set()
+            return await self.reranker.arerank(question, DOCS)
+
+        self.assertEqual(asyncio.run(run())[0], DOCS[1])
+        self.assertEqual(self.reranker.in_flight, 0)
@@ -1,8 +1,15 @@
+import asyncio
 import unittest
 from typing import Any
 from unittest.mock import patch
 
-from app.retriever import Retriever
+import httpx
+from app.retriever import (
+    CustomArxivRetriever,
+    CustomPubMedRetriever,
+    Retriever,
+    TieredTavilySearchAPIRetriever,
+)
 from langchain_core.documents import Document
 from langchain_core.runnables import Runnable
 from langchain_milvus import Milvus
@@ -164,3 +171,117 @@ class TestRetrieverFallback(unittest.TestCase):
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0].page_content, DOC.page_content)
             self.assertEqual(results[0].metadata["source"], DOC.metadata["source"])
+
+
+ARXIV_FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <entry>
+    <id>http://arxiv.org/abs/2301.00001v1</id>
+    <updated>2023-01-02T10:00:00Z</updated>
+    <title>Virtual Power Plants</title>
+    <summary>  Mock arxiv summary.  </summary>
+    <author><name>Alice</name></author>
+    <author><name>Bob</name></author>
+  </entry>
+</feed>"""
+
+PUBMED_SEARCH = {"esearchresult": {"idlist": ["222", "111"]}}
+
+PUBMED_ARTICLES = """<?xml version="1.0"?>
+<PubmedArticleSet>
+  <PubmedArticle><MedlineCitation><PMID Version="1">111</PMID><Article>
+    <ArticleTitle>First article</ArticleTitle>
+    <Abstract><AbstractText>First abstract.</AbstractText></Abstract>
+  </Article></MedlineCitation></PubmedArticle>
+  <PubmedArticle><MedlineCitation><PMID Version="1">222</PMID><Article>
+    <ArticleTitle>Second article</ArticleTitle>
+    <Abstract><AbstractText>Second abstract.</AbstractText></Abstract>
+  </Article></MedlineCitation></PubmedArticle>
+</PubmedArticleSet>"""
+
+
+def mock_async_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+class TestAsyncWebRetrievers(unittest.TestCase):
+    def test_arxiv_async(self):
+        def handler(request: httpx.Request):
+            self.assertEqual(request.url.params["search_query"], "virtual power plant")
+            return httpx.Response(200, text=ARXIV_FEED)
+
+        async def run():
+            with patch(
+                "app.retriever.get_async_client",
+                return_value=mock_async_client(handler),
+            ):
+                retriever = CustomArxivRetriever(get_full_documents=False)
+                return await retriever.ainvoke("virtual power plant")
+
+        docs = asyncio.run(run())
+        self.assertEqual(len(docs), 1)
+        self.assertEqual(docs[0].page_content, "Mock arxiv summary.")
+        self.assertEqual(
+            docs[0].metadata["source"], "http://arxiv.org/abs/2301.00001v1"
+        )
+        self.assertEqual(docs[0].metadata["Authors"], "Alice, Bob")
+        self.assertNotIn("Entry ID", docs[0].metadata)
+
+    def test_pubmed_async_batched(self):
+        requests = []
+
+        def handler(request: httpx.Request):
+            requests.append(request)
+            if "esearch" in request.url.path:
+                return httpx.Response(200, json=PUBMED_SEARCH)
+            return httpx.Response(200, text=PUBMED_ARTICLES)
+
+        async def run():
+            with patch(
+                "app.retriever.get_async_client",
+                return_value=mock_async_client(handler),
+            ):
+                retriever = CustomPubMedRetriever(top_k_results=2)
+                return await retriever.ainvoke("virtual power plant")
+
+        docs = asyncio.run(run())
+        self.assertEqual(len(requests), 2)
+        self.assertEqual(requests[1].url.params["id"], "222,111")
+        self.assertEqual(
+            [doc.metadata["source"] for doc in docs],
+            [
+                "https://pubmed.ncbi.nlm.nih.gov/222",
+                "https://pubmed.ncbi.nlm.nih.gov/111",
+            ],
+        )
+        self.assertEqual(docs[0].page_content, "Second abstract.")
+        self.assertEqual(docs[0].metadata["Title"], "Second article")
+
+
+class TestTieredTavilyRetriever(unittest.TestCase):
+    def search(self, scores: dict):
+        depths = []
+
+        def search(retriever, query, run_manager):
+            depths.append(retriever.search_depth.value)
+            return [
+                Document(page_content="Mock content", metadata={"score": score})
+                for score in scores[retriever.search_depth.value]
+            ]
+
+        retriever = TieredTavilySearchAPIRetriever(k=2, min_score=0.5)
+        with patch(
+            "app.retriever.TavilySearchAPIRetriever._get_relevant_documents", search
+        ):
+            docs = retriever.invoke("Testing question")
+        return depths, docs
+
+    def test_basic_results_sufficient(self):
+        depths, docs = self.search({"basic": [0.8, 0.3], "advanced": [0.9]})
+        self.assertEqual(depths, ["basic"])
+        self.assertEqual(len(docs), 2)
+
+    def test_escalates_to_advanced(self):
+        depths, docs = self.search({"basic": [0.2], "advanced": [0.9]})
+        self.assertEqual(depths, ["basic", "advanced"])
+        self.assertEqual(docs[0].metadata["score"], 0.9)
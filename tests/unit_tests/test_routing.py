@@ -0,0 +1,60 @@
+import unittest
+
+from app.routing import AdaptiveRouter, normalized_rrf_score, query_terms
+from app.utils import RRF_CONSTANT
+from langchain_core.documents import Document
+
+TOP_SCORE = 2 / (RRF_CONSTANT + 1)  # top rank in both dense and BM25 search
+
+
+def make_docs(n: int, score: float, content: str = "virtual power plant"):
+    return [
+        Document(
+            page_content=content,
+            metadata={"source": f"https://mock_source_{i}.com", "score": score},
+        )
+        for i in range(n)
+    ]
+
+
+class TestAdaptiveRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = AdaptiveRouter()
+        self.router.min_docs = 3
+        self.router.min_score = 0.9
+        self.router.min_coverage = 0.6
+        self.question = "What is a virtual power plant?"
+
+    def test_query_terms(self):
+        self.assertEqual(query_terms(self.question), {"virtual", "power", "plant"})
+        self.assertEqual(
+            query_terms("How do EVs in the EU work?"), {"evs", "eu", "work"}
+        )
+
+    def test_normalized_rrf_score(self):
+        self.assertAlmostEqual(normalized_rrf_score(TOP_SCORE), 1.0)
+        self.assertEqual(normalized_rrf_score(None), 0.0)
+
+    def test_confident_local_results_skip_web(self):
+        self.router.record_web_latency(2.0)
+        self.assertFalse(self.router.needs_web(self.question, make_docs(3, TOP_SCORE)))
+        self.assertEqual(
+            self.router.stats(),
+            {"fan_outs": 0, "skips": 1, "latency_saved": 2.0, "web_latency": 2.0},
+        )
+
+    def test_low_signals_fan_out(self):
+        cases = [
+            make_docs(2, TOP_SCORE),  # too few documents
+            make_docs(3, TOP_SCORE / 2),  # only ranked by one of the searches
+            make_docs(3, TOP_SCORE, "unrelated content"),  # question not covered
+            [],
+        ]
+        for docs in cases:
+            self.assertTrue(self.router.needs_web(self.question, docs))
+        self.assertEqual(self.router.stats()["fan_outs"], len(cases))
+
+    def test_web_latency_moving_average(self):
+        self.router.record_web_latency(1.0)
+        self.router.record_web_latency(2.0, weight=0.5)
+        self.assertAlmostEqual(self.router.web_latency, 1.5)
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+
+from app.single_flight import SingleFlight, coalescing_key
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_execution(self):
+        flight = SingleFlight("test")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def run():
+            return await asyncio.gather(*(flight.run("key", work) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ["answer"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(
+            flight.stats(), {"in_flight": 0, "executions": 1, "coalesced": 4}
+        )
+
+    def test_different_keys_run_separately(self):
+        flight = SingleFlight("test")
+
+        async def run():
+            return await asyncio.gather(
+                flight.run("a", lambda: asyncio.sleep(0.01, "a")),
+                flight.run("b", lambda: asyncio.sleep(0.01, "b")),
+            )
+
+        self.assertEqual(asyncio.run(run()), ["a", "b"])
+        self.assertEqual(flight.executions, 2)
+
+    def test_error_propagates_to_all_waiters(self):
+        flight = SingleFlight("test")
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.run("key", work) for _ in range(3)), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        flight = SingleFlight("test")
+
+        async def run():
+            first = asyncio.create_task(
+                flight.run("key", lambda: asyncio.sleep(0.05, "answer"))
+            )
+            second = asyncio.create_task(flight.run("key", lambda: None))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second, first.cancelled()
+
+        self.assertEqual(asyncio.run(run()), ("answer", True))
+
+    def test_execution_cancelled_with_last_waiter(self):
+        flight = SingleFlight("test")
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def run():
+            tasks = [asyncio.create_task(flight.run("key", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.sleep(0)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [1])
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+
+class TestCoalescingKey(unittest.TestCase):
+    def test_normalizes_question_and_ignores_run_ids(self):
+        self.assertEqual(
+            coalescing_key("What is  VPP?", {"configurable": {"thread_id": "1"}}),
+            coalescing_key("what is vpp?", {"configurable": {"thread_id": "2"}}),
+        )
+
+    def test_config_and_extra_change_key(self):
+        self.assertNotEqual(
+            coalescing_key("q", {"configurable": {"model": "a"}}),
+            coalescing_key("q", {"configurable": {"model": "b"}}),
+        )
+        self.assertNotEqual(coalescing_key("q", None, [1]), coalescing_key("q"))
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from app.utils import LazyComponent, get_bool_env
+
+
+class TestLazyComponent(unittest.TestCase):
+    def test_lazy_construction(self):
+        calls = []
+        component = LazyComponent(lambda: calls.append(1) or "instance", "mock")
+        self.assertFalse(component.initialized)
+        self.assertEqual(calls, [])
+        self.assertEqual(component.get(), "instance")
+        self.assertEqual(asyncio.run(component.aget()), "instance")
+        self.assertEqual(calls, [1])
+        self.assertIsNotNone(component.init_duration)
+
+    def test_thread_safe_construction(self):
+        calls = []
+
+        def factory():
+            time.sleep(0.05)
+            calls.append(1)
+            return object()
+
+        component = LazyComponent(factory, "mock")
+        instances = []
+        threads = [
+            threading.Thread(target=lambda: instances.append(component.get()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len({id(instance) for instance in instances}), 1)
+
+
+class TestGetBoolEnv(unittest.TestCase):
+    def test_default(self):
+        self.assertFalse(get_bool_env("MOCK_UNSET_VARIABLE", False))
+        self.assertTrue(get_bool_env("MOCK_UNSET_VARIABLE"))